@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+One-off backfill for the project -> conversation pointer.
+
+Older conversations were only discoverable through a collection-wide
+``where("project_id", "==", ...)`` query. This script walks the
+``conversations`` collection once and writes ``conversation_id`` onto each
+project document (the most recently created conversation wins), so
+``ConversationService.get_project_conversation`` can use single-document
+reads. Safe to re-run; use --dry-run to preview.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from google.cloud import firestore  # noqa: E402
+
+from src.services.database_service import DEFAULT_PROJECT_ID, FIRESTORE_COLLECTION  # noqa: E402
+
+# Firestore 單一 WriteBatch 最多 500 個寫入
+BATCH_LIMIT = 500
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def collect_latest_conversations(client: firestore.Client) -> Dict[str, Tuple[str, datetime]]:
+    """Return {project_id: (conversation_id, created_at)} keeping the newest conversation."""
+    latest: Dict[str, Tuple[str, datetime]] = {}
+    for doc in client.collection("conversations").select(["project_id", "created_at"]).stream():
+        data = doc.to_dict() or {}
+        project_id = data.get("project_id")
+        if not project_id:
+            continue
+        created_at = data.get("created_at") or _EPOCH
+        current = latest.get(project_id)
+        if current is None or created_at >= current[1]:
+            latest[project_id] = (doc.id, created_at)
+    return latest
+
+
+def write_pointers(client: firestore.Client, latest: Dict[str, Tuple[str, datetime]], dry_run: bool) -> int:
+    projects = client.collection(FIRESTORE_COLLECTION)
+    batch = client.batch()
+    pending = 0
+    written = 0
+    for project_id, (conversation_id, _) in sorted(latest.items()):
+        if dry_run:
+            print(f"[dry-run] {FIRESTORE_COLLECTION}/{project_id}.conversation_id = {conversation_id}")
+            continue
+        batch.set(projects.document(project_id), {
+            "conversation_id": conversation_id,
+            "conversation_updated_at": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        pending += 1
+        if pending == BATCH_LIMIT:
+            batch.commit()
+            written += pending
+            batch, pending = client.batch(), 0
+    if pending:
+        batch.commit()
+        written += pending
+    return written
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--project", default=DEFAULT_PROJECT_ID, help="GCP project id (defaults to env).")
+    parser.add_argument("--dry-run", action="store_true", help="Print the pointers without writing them.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    client = firestore.Client(project=args.project)
+    latest = collect_latest_conversations(client)
+    written = write_pointers(client, latest, args.dry_run)
+    print(f"Found {len(latest)} projects with conversations; wrote {written} pointers.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
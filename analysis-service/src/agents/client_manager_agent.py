@@ -1,12 +1,12 @@
 from src.agents.base_agent import BaseAgent
 from src.models.project import Interaction, AgentRole, ProjectBrief
-from src.services.llm_service import mock_llm_service
+from src.services.llm_backend import LLMBackend, default_agent_backend
 from src.services.image_generation_service import mock_image_generation_service
 from src.services.task_dispatcher import task_dispatcher
 from src.services.database_service import db_service
 from src.agents.contractor_agent import ContractorAgent
 from src.agents.designer_agent import DesignerAgent
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,6 +17,10 @@ class ClientManagerAgent(BaseAgent):
     It handles the initial interaction, quote analysis, and final presentation.
     """
 
+    def __init__(self, llm: Optional[LLMBackend] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.llm = llm or default_agent_backend()
+
     async def run(self, input_data: Dict[str, Any], **kwargs) -> Dict[str, Any]:
         """
         Main run logic for the Client Manager Agent. It now also handles
@@ -49,9 +53,9 @@ class ClientManagerAgent(BaseAgent):
             "If a style was mentioned, ask for feedback on the generated image."
         )
 
-        # 3. Call the (mock) LLM service
-        llm_response = await mock_llm_service.generate_response(
-            prompt=prompt,
+        # 3. Call the LLM backend
+        llm_response = await self.llm.generate_text(
+            prompt,
             context={"project_id": project_id, "user_message": user_message}
         )
         
@@ -85,8 +89,8 @@ class ClientManagerAgent(BaseAgent):
             "Please summarize this into a structured ProjectBrief."
         )
 
-        # 2. Call the (mock) LLM service to get structured data
-        structured_brief_data = await mock_llm_service.generate_response(
+        # 2. Call the LLM backend to get structured data
+        structured_brief_data = await self.llm.generate_json(
             prompt=prompt,
             context={"project_id": project_id, "task": "summarize"}
         )
@@ -118,7 +122,7 @@ class ClientManagerAgent(BaseAgent):
         logger.info(f"Presenting final results for project {brief.project_id}.")
 
         # 1. Simulate getting results from other agents
-        contractor_agent = ContractorAgent()
+        contractor_agent = ContractorAgent(llm=self.llm)
         designer_agent = DesignerAgent()
 
         generated_quote = await contractor_agent.run(brief)
@@ -134,8 +138,8 @@ class ClientManagerAgent(BaseAgent):
             "Present the final quote and rendering to the user in a warm and professional manner. "
             "Briefly explain what they are looking at."
         )
-        presentation_message = await mock_llm_service.generate_response(
-            prompt=presentation_prompt,
+        presentation_message = await self.llm.generate_text(
+            presentation_prompt,
             context={"project_id": brief.project_id}
         )
 
@@ -1,6 +1,7 @@
 from src.agents.base_agent import BaseAgent
 from src.models.project import ProjectBrief, Quote
-from src.services.llm_service import mock_llm_service
+from src.services.llm_backend import LLMBackend, default_agent_backend
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +12,10 @@ class ContractorAgent(BaseAgent):
     structured quote based on the project brief.
     """
 
+    def __init__(self, llm: Optional[LLMBackend] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.llm = llm or default_agent_backend()
+
     async def run(self, brief: ProjectBrief, **kwargs) -> Quote:
         """
         Takes a project brief and generates a detailed quote.
@@ -35,8 +40,8 @@ class ContractorAgent(BaseAgent):
             "Please generate a structured quote in JSON format."
         )
 
-        # 2. Call the (mock) LLM service to get structured data
-        quote_data = await mock_llm_service.generate_response(
+        # 2. Call the LLM backend to get structured data
+        quote_data = await self.llm.generate_json(
             prompt=prompt,
             context={"project_id": brief.project_id, "task": "generate_quote"}
         )
@@ -1,34 +1,30 @@
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, HTTPException, Query, Response, UploadFile, File
 from fastapi.responses import StreamingResponse
-from typing import Dict, Any, List, Optional, AsyncGenerator, Tuple
+from typing import Dict, Any, List, Optional, AsyncGenerator, Awaitable, Callable, Tuple, Union
 from pydantic import BaseModel
 import os
 import uuid
 from datetime import datetime, timezone
 import io
 import asyncio
+import hashlib
 import json
 import logging
 import re
 from pathlib import Path
 
-from google.cloud import storage, pubsub_v1, firestore
-import openpyxl
-import PyPDF2
+from google.cloud import firestore
 
 logger = logging.getLogger(__name__)
 
-# Configuration for GCS and Pub/Sub
+# Configuration for GCS (Pub/Sub settings live in quote_dispatch)
 GCS_BUCKET_NAME = os.getenv("GCS_UPLOAD_BUCKET", "houseiq-project-quotes")
-PUBSUB_TOPIC_ID = os.getenv("PUBSUB_PROCESSING_TOPIC", "quote-analysis-requests")
-GCP_PROJECT_ID = os.getenv("PROJECT_ID", "houseiq-yourinteriordeco-ai")
 
 from src.agents.client_manager_v2 import ClientManagerAgentV2, QuestionCategory
 from src.agents.construction_translator import ConstructionTranslator
 from src.agents.contractor_agent import ContractorAgent
 from src.agents.designer_agent import DesignerAgent
 from src.services.pdf_service import generate_pdf_report
-from src.services.llm_service import mock_llm_service
 from src.services.gemini_service import gemini_service
 from src.models.project import (
     ConversationState,
@@ -37,10 +33,19 @@ from src.models.project import (
     ConversationStage,
     ProjectBrief,
     Booking,
+    Quote,
+    AgentRole,
 )
 from src.services.conversation_service import ConversationService
 from src.services.spec_tracking import SpecTracker
-from src.services.database_service import db_service
+from src.services.database_service import CompletionInputsView, QuoteContextView, db_service
+from src.services.quote_text_store import QuoteTextUnavailable, quote_text_store
+from src.services.quote_extraction import extract_from_text, format_quote_table
+from src.services.upload_service import InvalidUpload, UploadTooLarge, upload_service
+from src.services.quote_dispatch import quote_dispatcher
+from src.services.task_dispatcher import JOB_SUCCEEDED, TERMINAL_STATUSES, agent_task_type, task_dispatcher
+from src.services.job_progress import job_progress
+from src.services.agent_orchestration import AgentCall, run_agents
 
 router = APIRouter()
 
@@ -52,8 +57,34 @@ spec_tracker = SpecTracker()
 contractor_agent = ContractorAgent()
 designer_agent = DesignerAgent()
 
+
+@task_dispatcher.handler(agent_task_type(AgentRole.CONTRACTOR))
+async def _run_contractor_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Background job: generate and store the contractor quote for a brief."""
+    brief = ProjectBrief(**payload["brief"])
+    quote = await contractor_agent.run(brief)
+    await db_service.update_project_with_quote(brief.project_id, quote)
+    return {"quote": quote.model_dump(mode="json")}
+
+
+@task_dispatcher.handler(agent_task_type(AgentRole.DESIGNER))
+async def _run_designer_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Background job: generate and store the designer rendering for a brief."""
+    brief = ProjectBrief(**payload["brief"])
+    output = await designer_agent.run(brief)
+    await db_service.update_project_with_rendering(brief.project_id, output.get("image_url", ""))
+    return {"image_url": output.get("image_url")}
+
+
+# Uploaded quotes are stored under their SHA-256 so identical files share one blob
+QUOTE_BLOB_PREFIX = os.getenv("QUOTE_BLOB_PREFIX", "quotes/sha256")
 UPLOAD_ROOT = Path(os.getenv("QUOTE_UPLOAD_DIR", "./uploaded_quotes"))
 UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+# mode=job completions run on the task dispatcher and stream progress over SSE
+COMPLETION_TASK_TYPE = "conversation.complete"
+COMPLETION_STREAM_KEEPALIVE = float(os.getenv("COMPLETION_STREAM_KEEPALIVE", "15"))
+# The rolling history summary is refreshed on the task dispatcher after each streamed reply
+HISTORY_SUMMARY_TASK_TYPE = "conversation.history_summary"
 # Request/Response Models
 class CreateProjectResponse(BaseModel):
     project_id: str
@@ -99,6 +130,11 @@ class CompleteConversationResponse(BaseModel):
     briefing: Dict[str, Any]
     analysis: Dict[str, Any]
 
+class CompletionJobResponse(BaseModel):
+    job_id: str
+    status: str
+    stream_url: str
+
 class BookingRequest(BaseModel):
     name: str
     phone: str
@@ -206,6 +242,8 @@ async def upload_quote(project_id: str, file: UploadFile = File(...)) -> Dict[st
     """
     Receives a user-uploaded quote, performs a quick validation, saves it to GCS,
     and dispatches a message to Pub/Sub for background processing.
+    Files are content-addressed by SHA-256: a file whose parse result is already
+    cached is attached to the project immediately without upload or re-analysis.
     """
     if not await conversation_service.project_exists(project_id):
         raise HTTPException(status_code=404, detail="Project not found")
@@ -221,73 +259,115 @@ async def upload_quote(project_id: str, file: UploadFile = File(...)) -> Dict[st
     if file.content_type not in supported_types:
         raise HTTPException(status_code=400, detail=f"Unsupported file format: {file.content_type}")
 
-    contents = await file.read()
-    await file.seek(0) # Reset file pointer after reading
+    safe_name = file.filename or "upload"
 
     # --- Quick Pre-flight Check ---
+    # Starlette has already spooled the body to a temp file; hash and check it
+    # from that handle on the upload pool instead of reading it into memory here.
     try:
-        if file.content_type == "application/pdf":
-            # Try to read the PDF metadata
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(contents))
-            if len(pdf_reader.pages) == 0:
-                raise ValueError("PDF file is empty or corrupted.")
-        elif "spreadsheetml" in file.content_type or "ms-excel" in file.content_type:
-            # Try to load the workbook
-            openpyxl.load_workbook(io.BytesIO(contents))
-    except Exception as e:
+        upload_info = await upload_service.inspect(file.file, file.content_type)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
         logger.warning(f"Pre-flight check failed for {file.filename}: {e}")
         raise HTTPException(status_code=400, detail="File appears to be corrupted or is an invalid format.")
+    content_sha256 = upload_info.content_sha256
+
+    # --- Reuse an existing parse result for identical content ---
+    cached_result = await db_service.get_quote_parse_result(content_sha256)
+    if cached_result is not None:
+        await db_service.update_project(project_id, {
+            "quote_analysis_status": "completed",
+            **_cached_quote_text_fields(cached_result),
+            "quote_content_sha256": content_sha256,
+            "original_filename": safe_name,
+        })
+        await _log_project_event(
+            project_id,
+            "quote_upload_deduplicated",
+            description=f"File {safe_name} matches an already analyzed quote.",
+            payload={"content_sha256": content_sha256}
+        )
+        logger.info(f"Upload for project {project_id} reused parse result {content_sha256}")
+        return {"message": "此報價單先前已分析過，可以直接開始對話。", "status": "already_analyzed", "content_sha256": content_sha256}
 
-    # --- Upload to GCS ---
+    # --- Upload to GCS (content-addressed) ---
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        
-        safe_name = file.filename or "upload"
-        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        destination_blob_name = f"{project_id}/{timestamp}_{safe_name}"
-        
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_string(contents, content_type=file.content_type)
+        destination_blob_name = f"{QUOTE_BLOB_PREFIX}/{content_sha256}"
+        uploaded = await upload_service.upload(
+            GCS_BUCKET_NAME, destination_blob_name, file.file, file.content_type, upload_info.size_bytes
+        )
+        if uploaded:
+            logger.info(f"File {file.filename} for project {project_id} uploaded to {destination_blob_name}")
+        else:
+            logger.info(f"Blob {destination_blob_name} already exists; skipping upload.")
         gcs_uri = f"gs://{GCS_BUCKET_NAME}/{destination_blob_name}"
-        logger.info(f"File {file.filename} for project {project_id} uploaded to {gcs_uri}")
     except Exception as e:
         logger.error(f"Failed to upload to GCS for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail="Could not save file to cloud storage.")
 
     # --- Dispatch to Pub/Sub ---
+    # The request does not wait for the publish ack; the callback records the outcome.
     try:
-        publisher = pubsub_v1.PublisherClient()
-        topic_path = publisher.topic_path(GCP_PROJECT_ID, PUBSUB_TOPIC_ID)
-        
         message_data = {
             "project_id": project_id,
             "gcs_uri": gcs_uri,
             "original_filename": safe_name,
             "content_type": file.content_type,
-            "size_bytes": len(contents),
+            "content_sha256": content_sha256,
+            "size_bytes": upload_info.size_bytes,
             "uploaded_at": datetime.utcnow().isoformat(),
         }
-        
-        future = publisher.publish(topic_path, data=json.dumps(message_data).encode("utf-8"))
-        future.result()  # Wait for publish to complete
-        logger.info(f"Message published to {topic_path} for project {project_id}")
+        quote_dispatcher.dispatch(message_data, on_complete=_quote_dispatch_callback(project_id, gcs_uri))
     except Exception as e:
         logger.error(f"Failed to publish to Pub/Sub for project {project_id}: {e}")
         # Here we might want to add cleanup logic, e.g., delete the file from GCS
         raise HTTPException(status_code=500, detail="Could not dispatch file for analysis.")
 
     # --- Log Event and Return Success ---
-    conversation = await conversation_service.get_project_conversation(project_id)
-    if conversation:
-        await conversation_service.log_event(
-            conversation["conversation_id"],
-            "quote_upload_queued",
-            description=f"User uploaded file {safe_name} for background analysis.",
+    await _log_project_event(
+        project_id,
+        "quote_upload_queued",
+        description=f"User uploaded file {safe_name} for background analysis.",
+        payload={"gcs_uri": gcs_uri}
+    )
+
+    return {"message": "檔案上傳成功，排隊分析中...", "status": "queued", "content_sha256": content_sha256}
+
+
+def _quote_dispatch_callback(project_id: str, gcs_uri: str):
+    """Records the Pub/Sub publish outcome of an upload in the conversation event log."""
+    async def on_complete(message_id: Optional[str], error: Optional[BaseException]) -> None:
+        if error is None:
+            logger.info(f"Message {message_id} published for project {project_id}")
+            await _log_project_event(
+                project_id,
+                "quote_upload_published",
+                description="Quote analysis request published.",
+                payload={"gcs_uri": gcs_uri, "message_id": message_id}
+            )
+            return
+        logger.error(f"Failed to publish to Pub/Sub for project {project_id}: {error}")
+        await db_service.update_project(project_id, {
+            "quote_analysis_status": "failed",
+            "quote_analysis_error": "Could not dispatch file for analysis.",
+        })
+        await _log_project_event(
+            project_id,
+            "quote_dispatch_failed",
+            severity="error",
+            description=f"Could not dispatch file for analysis: {error}",
             payload={"gcs_uri": gcs_uri}
         )
 
-    return {"message": "檔案上傳成功，排隊分析中..."}
+    return on_complete
+
+
+async def _log_project_event(project_id: str, event_type: str, **kwargs) -> None:
+    """Log an event on the project's conversation, if one exists yet."""
+    conversation = await conversation_service.get_project_conversation(project_id)
+    if conversation:
+        await conversation_service.log_event(conversation["conversation_id"], event_type, **kwargs)
 
 @router.post("/projects/{project_id}/conversation/start", response_model=StartConversationResponse)
 async def start_conversation(project_id: str) -> StartConversationResponse:
@@ -530,16 +610,16 @@ async def init_conversation(project_id: str) -> InitConversationResponse:
     # Create a new conversation session
     conversation_id = f"conv-{uuid.uuid4()}"
     await conversation_service.create_conversation(conversation_id, project_id)
-    await conversation_service.log_event(
-        conversation_id,
-        "conversation_initialized",
-        description="Conversation created via init endpoint."
-    )
-    
-    # Initialize spec tracking in Firestore
-    await conversation_service.update_extracted_specs(conversation_id, spec_tracker.empty_state())
-    await conversation_service.update_missing_fields(conversation_id, spec_tracker.initial_missing_fields())
-    await conversation_service.update_conversation_stage(conversation_id, "greeting", 0)
+
+    # Initialize spec tracking in Firestore (committed as a single batch)
+    async with conversation_service.turn(conversation_id) as turn:
+        await turn.log_event(
+            "conversation_initialized",
+            description="Conversation created via init endpoint."
+        )
+        await turn.update_extracted_specs(spec_tracker.empty_state())
+        await turn.update_missing_fields(spec_tracker.initial_missing_fields())
+        await turn.update_conversation_stage("greeting", 0)
 
     # Agent Information
     agent = {
@@ -551,27 +631,33 @@ async def init_conversation(project_id: str) -> InitConversationResponse:
     initial_message = ""
     
     # Check if processed quote content exists
-    project_data = await db_service.get_project(project_id)
-    quote_content = project_data.get("original_quote_content")
-
-    if quote_content:
-        logger.info(f"Found original_quote_content for project {project_id}. Analyzing...")
-        # If quote exists, analyze it to generate the first message
-        analysis_result = await gemini_service.analyze_quote_and_generate_initial_response(quote_content)
-        
-        if analysis_result and "analysis" in analysis_result:
-            # Save the analysis to the project
-            await db_service.update_project(project_id, {"quote_analysis": analysis_result["analysis"]})
-            initial_message = analysis_result.get("initial_response", "")
-            await conversation_service.log_event(
-                conversation_id,
-                "quote_analysis_completed",
-                description="Initial quote analysis successful.",
-                payload=analysis_result["analysis"]
-            )
-        else:
-            logger.warning(f"Quote analysis failed for project {project_id}. Falling back.")
-            initial_message = "抱歉，分析您的報價單時發生了點問題。不過沒關係，我們可以先從聊聊您的需求開始嗎？"
+    quote_context = await db_service.get_quote_context(project_id) or QuoteContextView()
+    quote_text = _QuoteText(quote_context)
+
+    if quote_text.present:
+        logger.info(f"Found quote content for project {project_id}. Analyzing...")
+        # If quote exists, analyze it to generate the first message.
+        # The compact line-item table replaces the full document text when extraction succeeds,
+        # so offloaded text is only downloaded when there is no valid cached extraction.
+        structured_quote = await _get_structured_quote(project_id, quote_text)
+        prompt_quote = format_quote_table(structured_quote) if structured_quote else await quote_text.load()
+        # An unreadable offloaded quote falls through to the generic greeting
+        if prompt_quote:
+            analysis_result = await gemini_service.analyze_quote_and_generate_initial_response(prompt_quote)
+
+            if analysis_result and "analysis" in analysis_result:
+                # Save the analysis to the project
+                await db_service.update_project(project_id, {"quote_analysis": analysis_result["analysis"]})
+                initial_message = analysis_result.get("initial_response", "")
+                await conversation_service.log_event(
+                    conversation_id,
+                    "quote_analysis_completed",
+                    description="Initial quote analysis successful.",
+                    payload=analysis_result["analysis"]
+                )
+            else:
+                logger.warning(f"Quote analysis failed for project {project_id}. Falling back.")
+                initial_message = "抱歉，分析您的報價單時發生了點問題。不過沒關係，我們可以先從聊聊您的需求開始嗎？"
 
     if not initial_message:
         # Fallback for when there's no quote or analysis fails
@@ -585,6 +671,73 @@ async def init_conversation(project_id: str) -> InitConversationResponse:
     )
 
 
+def _cached_quote_text_fields(cached_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Project fields for a parse-cache hit: the blob manifest, or inline text for older entries."""
+    manifest = cached_result.get("quote_text_manifest")
+    if manifest:
+        return {"quote_text_manifest": manifest, "original_quote_content": None}
+    return {"original_quote_content": cached_result.get("extracted_text", ""), "quote_text_manifest": None}
+
+
+class _QuoteText:
+    """
+    The project's extracted quote text: inline `original_quote_content` (older
+    documents) or a `quote_text_manifest` whose blob is loaded at most once, on demand.
+    """
+
+    def __init__(self, quote_context: QuoteContextView):
+        self.context = quote_context
+        self._text = quote_context.original_quote_content
+        self._manifest = quote_context.quote_text_manifest if not self._text else None
+
+    @property
+    def present(self) -> bool:
+        return bool(self._text or self._manifest)
+
+    @property
+    def sha256(self) -> str:
+        if self._manifest and self._manifest.get("sha256"):
+            return self._manifest["sha256"]
+        return hashlib.sha256((self._text or "").encode("utf-8")).hexdigest()
+
+    async def load(self) -> Optional[str]:
+        """The text, or None when the offloaded blob cannot be read (logged, not retried)."""
+        if self._text is None and self._manifest:
+            try:
+                self._text = await quote_text_store.load(self._manifest)
+            except QuoteTextUnavailable as e:
+                logger.error(f"Quote text unavailable, continuing without it: {e}")
+                self._manifest = None
+                return None
+        return self._text or ""
+
+
+async def _get_structured_quote(project_id: str, quote_text: _QuoteText) -> Optional[Quote]:
+    """
+    Return the structured quote for the project's uploaded quote text.
+    It is extracted deterministically on first use and stored on the project,
+    keyed by a hash of the source text so a re-upload is re-extracted.
+    """
+    content_hash = quote_text.sha256
+    stored = quote_text.context.structured_quote
+    if stored and quote_text.context.structured_quote_source_sha256 == content_hash:
+        return Quote(**stored)
+
+    content = await quote_text.load()
+    if content is None:
+        return None
+    quote = extract_from_text(content)
+    if quote is None:
+        logger.info(f"No line items could be extracted from the quote of project {project_id}.")
+        return None
+    await db_service.update_project(project_id, {
+        "structured_quote": quote.model_dump(),
+        "structured_quote_source_sha256": content_hash
+    })
+    logger.info(f"Extracted {len(quote.line_items)} line items from the quote of project {project_id}.")
+    return quote
+
+
 async def generate_agent_response(
     message: str,
     conversation_id: str,
@@ -642,6 +795,66 @@ async def generate_agent_response(
             await asyncio.sleep(0.01)
 
 
+async def _apply_spec_update(turn, extracted_specs: Dict[str, Any], spec_update: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge stage-completion flags into the specs and stage the resulting writes on the turn."""
+    tracking_snapshot = spec_tracker.merge(extracted_specs, spec_update)
+    if tracking_snapshot["changed"]:
+        await turn.update_extracted_specs(tracking_snapshot["state"])
+        await turn.update_missing_fields(tracking_snapshot["missing_fields"])
+        await turn.update_conversation_stage(tracking_snapshot["stage"], tracking_snapshot["progress"])
+        await turn.log_event(
+            "spec_updated", source="agent", payload={"fields": list(spec_update.keys())}
+        )
+    return tracking_snapshot
+
+
+# conversation_id -> (lock, jobs holding or waiting for it); summary jobs of one conversation run one at a time
+_history_summary_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+
+async def _submit_history_summary(conversation_id: str, last_message_id: str) -> None:
+    """One summary job per turn: resubmitting the same turn returns the existing job."""
+    await task_dispatcher.submit(
+        HISTORY_SUMMARY_TASK_TYPE,
+        {"conversation_id": conversation_id, "last_message_id": last_message_id},
+        idempotency_key=f"{HISTORY_SUMMARY_TASK_TYPE}:{conversation_id}:{last_message_id}",
+    )
+
+
+@task_dispatcher.handler(HISTORY_SUMMARY_TASK_TYPE)
+async def _refresh_history_summary(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Background job: fold messages that no longer fit the token budget into the rolling summary.
+    Jobs of one conversation are serialized so each starts from the state the previous one stored;
+    a job whose turn is no longer the latest is skipped, since the newer turn's job covers it.
+    """
+    conversation_id = payload["conversation_id"]
+    last_message_id = payload.get("last_message_id")
+    lock, holders = _history_summary_locks.get(conversation_id, (asyncio.Lock(), 0))
+    _history_summary_locks[conversation_id] = (lock, holders + 1)
+    try:
+        async with lock:
+            # Both come from the history cache, which already holds the committed turn
+            conversation_history = await conversation_service.get_conversation_history(conversation_id, limit=None)
+            summary_state = await conversation_service.get_history_summary(conversation_id)
+            latest_id = conversation_history[-1].get("id") if conversation_history else None
+            if last_message_id and (
+                latest_id != last_message_id
+                or (summary_state or {}).get("covered_through_id") == last_message_id
+            ):
+                return {"changed": False, "skipped": True}
+            updated = await gemini_service.refresh_history_summary(conversation_history, summary_state)
+            if updated is not None:
+                await conversation_service.update_history_summary(conversation_id, updated)
+            return {"changed": updated is not None}
+    finally:
+        lock, holders = _history_summary_locks[conversation_id]
+        if holders <= 1:
+            del _history_summary_locks[conversation_id]
+        else:
+            _history_summary_locks[conversation_id] = (lock, holders - 1)
+
+
 @router.get("/projects/{project_id}/conversation/message-stream")
 async def send_message_stream(
     project_id: str,
@@ -663,108 +876,171 @@ async def send_message_stream(
     conversation_id = conversation["conversation_id"]
 
     async def event_generator():
+        response_text = ""
+        last_message_id: Optional[str] = None
         try:
-            # Initial setup
-            conversation_history = await conversation_service.get_conversation_history(conversation_id)
-            extracted_specs = await conversation_service.get_current_specs(conversation_id) or {}
+            # Initial setup: full history is fitted to the token budget by the LLM service
+            conversation_history, extracted_specs = await asyncio.gather(
+                conversation_service.get_conversation_history(conversation_id, limit=None),
+                conversation_service.get_current_specs(conversation_id),
+            )
+            # Loaded and cached together with the history, so this does not read Firestore
+            history_summary = await conversation_service.get_history_summary(conversation_id)
+            extracted_specs = extracted_specs or {}
             tracking_snapshot = spec_tracker.evaluate(extracted_specs)
             current_stage = tracking_snapshot["stage"]
             current_progress = tracking_snapshot["progress"]
             current_missing_fields = tracking_snapshot["missing_fields"]
 
-            # Save user message
-            await conversation_service.save_message(conversation_id, "user", message)
-            await conversation_service.log_event(
-                conversation_id, "user_message_received", source="user", description=message[:200]
-            )
-
-            # Generate and stream agent response
-            response_text = ""
-            await conversation_service.log_event(
-                conversation_id, "agent_stream_started", source="agent", payload={"model": getattr(gemini_service, "model_name", "unknown")}
-            )
-            
-            context = {
-                "project_id": project_id,
-                "conversation_id": conversation_id,
-                "role": "houseiq",
-                "extracted_specs": extracted_specs
-            }
+            # All writes of this turn are collected and committed as one batch at turn end
+            async with conversation_service.turn(conversation_id) as turn:
+                # Save user message
+                last_message_id = await turn.save_message("user", message)
+                await turn.log_event(
+                    "user_message_received", source="user", description=message[:200]
+                )
+
+                # Generate and stream agent response
+                await turn.log_event(
+                    "agent_stream_started", source="agent", payload={"model": getattr(gemini_service, "model_name", "unknown")}
+                )
+
+                context = {
+                    "project_id": project_id,
+                    "conversation_id": conversation_id,
+                    "role": "houseiq",
+                    "extracted_specs": extracted_specs,
+                    "history_summary": history_summary
+                }
 
-            async for text_chunk, spec_update in gemini_service.generate_response_stream(
-                message=message,
-                conversation_history=conversation_history,
-                context=context
-            ):
-                if text_chunk:
-                    response_text += text_chunk
-                    event_data = {
-                        "chunk": text_chunk, "isComplete": False,
-                        "metadata": {"stage": current_stage, "progress": current_progress, "missingFields": current_missing_fields[:3]}
-                    }
-                    yield f"event: message_chunk\n"
-                    yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-
-                if spec_update:
-                    # --- Handle Image Generation Event (Task 2.3.3) ---
-                    image_url = spec_update.pop("generated_image_url", None)
-                    if image_url:
-                        await conversation_service.save_message(
-                            conversation_id, "agent", image_url, message_type="image"
-                        )
-                        await conversation_service.log_event(
-                            conversation_id, "agent_generated_image", source="agent", payload={"url": image_url}
-                        )
-
-                    # --- Handle other spec updates ---
-                    if spec_update: # If there are still items left after popping the image url
-                        tracking_snapshot = spec_tracker.merge(extracted_specs, spec_update)
-                        if tracking_snapshot["changed"]:
-                            extracted_specs = tracking_snapshot["state"]
-                            current_stage = tracking_snapshot["stage"]
-                            current_progress = tracking_snapshot["progress"]
-                            current_missing_fields = tracking_snapshot["missing_fields"]
-                            await conversation_service.update_extracted_specs(conversation_id, extracted_specs)
-                            await conversation_service.update_missing_fields(conversation_id, current_missing_fields)
-                            await conversation_service.update_conversation_stage(conversation_id, current_stage, current_progress)
-                            await conversation_service.log_event(
-                                conversation_id, "spec_updated", source="agent", payload={"fields": list(spec_update.keys())}
+                async for text_chunk, spec_update in gemini_service.generate_response_stream(
+                    message=message,
+                    conversation_history=conversation_history,
+                    context=context
+                ):
+                    if text_chunk:
+                        response_text += text_chunk
+                        event_data = {
+                            "chunk": text_chunk, "isComplete": False,
+                            "metadata": {"stage": current_stage, "progress": current_progress, "missingFields": current_missing_fields[:3]}
+                        }
+                        yield f"event: message_chunk\n"
+                        yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
+
+                    if spec_update:
+                        # --- Handle Image Generation Event (Task 2.3.3) ---
+                        image_url = spec_update.pop("generated_image_url", None)
+                        if image_url:
+                            last_message_id = await turn.save_message("agent", image_url, message_type="image")
+                            await turn.log_event(
+                                "agent_generated_image", source="agent", payload={"url": image_url}
                             )
 
-            # Save the full text response (cleaned of any commands)
-            final_response_text = re.sub(r'\[GENERATE_IMAGE:.*?\]', '', response_text).strip()
-            if final_response_text:
-                await conversation_service.save_message(conversation_id, "agent", final_response_text)
-
-            # Send completion event
-            final_snapshot = spec_tracker.evaluate(extracted_specs)
-            complete_event = {
-                "chunk": "", "isComplete": True,
-                "metadata": {
-                    "stage": final_snapshot["stage"], "progress": final_snapshot["progress"],
-                    "missingFields": final_snapshot["missing_fields"], "extracted_specs": extracted_specs or {}
+                        # --- Handle other spec updates ---
+                        if spec_update: # If there are still items left after popping the image url
+                            tracking_snapshot = await _apply_spec_update(turn, extracted_specs, spec_update)
+                            if tracking_snapshot["changed"]:
+                                extracted_specs = tracking_snapshot["state"]
+                                current_stage = tracking_snapshot["stage"]
+                                current_progress = tracking_snapshot["progress"]
+                                current_missing_fields = tracking_snapshot["missing_fields"]
+
+                # Save the full text response (cleaned of any commands)
+                final_response_text = re.sub(r'\[GENERATE_IMAGE:.*?\]', '', response_text).strip()
+                if final_response_text:
+                    last_message_id = await turn.save_message("agent", final_response_text)
+
+                # Send completion event
+                defer_spec_update = gemini_service.spec_extraction_mode == "background"
+                final_snapshot = spec_tracker.evaluate(extracted_specs)
+                complete_event = {
+                    "chunk": "", "isComplete": True,
+                    "metadata": {
+                        "stage": final_snapshot["stage"], "progress": final_snapshot["progress"],
+                        "missingFields": final_snapshot["missing_fields"], "extracted_specs": extracted_specs or {},
+                        "specUpdatePending": defer_spec_update
+                    }
                 }
-            }
-            yield f"event: message_chunk\n"
-            yield f"data: {json.dumps(complete_event, ensure_ascii=False)}\n\n"
-            await conversation_service.log_event(
-                conversation_id, "agent_stream_completed", source="agent", payload={"response_length": len(final_response_text)}
-            )
+                yield f"event: message_chunk\n"
+                yield f"data: {json.dumps(complete_event, ensure_ascii=False)}\n\n"
+                await turn.log_event(
+                    "agent_stream_completed", source="agent", payload={"response_length": len(final_response_text)}
+                )
+
+                if defer_spec_update:
+                    # Persist the turn now; stage evaluation runs after the user-visible reply
+                    await turn.checkpoint()
+                    spec_update = await gemini_service.evaluate_stage_completion(
+                        conversation_history, message, final_response_text, extracted_specs
+                    )
+                    tracking_snapshot = await _apply_spec_update(turn, extracted_specs, spec_update or {})
+                    # The client closes the stream on spec_update; persist before it sees the event
+                    await turn.checkpoint()
+                    spec_event = {
+                        "changed": tracking_snapshot["changed"],
+                        "metadata": {
+                            "stage": tracking_snapshot["stage"], "progress": tracking_snapshot["progress"],
+                            "missingFields": tracking_snapshot["missing_fields"],
+                            "extracted_specs": tracking_snapshot["state"]
+                        }
+                    }
+                    yield f"event: spec_update\n"
+                    yield f"data: {json.dumps(spec_event, ensure_ascii=False)}\n\n"
 
         except Exception as e:
             logger.error(f"Error in stream: {e}")
             # Error handling...
+        finally:
+            # Runs after the turn is committed, also when the client disconnects early
+            if response_text and last_message_id:
+                await _submit_history_summary(conversation_id, last_message_id)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Connection": "keep-alive"})
 
 
-@router.post("/projects/{project_id}/conversation/complete", response_model=CompleteConversationResponse)
-async def complete_conversation(project_id: str) -> CompleteConversationResponse:
+@router.post(
+    "/projects/{project_id}/conversation/complete",
+    response_model=Union[CompleteConversationResponse, CompletionJobResponse],
+)
+async def complete_conversation(
+    project_id: str,
+    response: Response,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+) -> Union[CompleteConversationResponse, CompletionJobResponse]:
     """
     Purpose: Finalize the conversation, generate all analysis, and return the complete solution package.
-    Input: project_id (str)
-    Output: CompleteConversationResponse containing summary, brief, and the full analysis.
+    Input: project_id (str); mode=job queues the work and returns a job id immediately (202).
+    Output: CompleteConversationResponse containing summary, brief, and the full analysis,
+            or CompletionJobResponse whose progress is streamed from `stream_url`.
     """
+    conversation_id, specs, quote_analysis = await _prepare_completion(project_id)
+
+    if mode == "job":
+        job_id = f"job-{uuid.uuid4()}"
+        job = await task_dispatcher.submit(
+            COMPLETION_TASK_TYPE,
+            {"project_id": project_id, "job_id": job_id},
+            job_id=job_id,
+            max_attempts=1,  # agent failures are already reported as partial results
+        )
+        await conversation_service.log_event(
+            conversation_id,
+            "completion_job_queued",
+            description="Conversation completion queued as a background job.",
+            payload={"job_id": job.job_id}
+        )
+        response.status_code = 202
+        return CompletionJobResponse(
+            job_id=job.job_id,
+            status=job.status,
+            stream_url=f"/api/projects/{project_id}/conversation/complete/jobs/{job.job_id}/stream",
+        )
+
+    return await _run_completion(project_id, conversation_id, specs, quote_analysis)
+
+
+async def _prepare_completion(project_id: str) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """Validates that the conversation can be completed; returns (conversation_id, specs, quote_analysis)."""
     if not await conversation_service.project_exists(project_id):
         raise HTTPException(status_code=404, detail="Project not found")
 
@@ -772,12 +1048,10 @@ async def complete_conversation(project_id: str) -> CompleteConversationResponse
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found for this project")
 
-    conversation_id = conversation["conversation_id"]
-    
-    # Fetch all necessary data from Firestore
-    project_data = await db_service.get_project(project_id)
-    specs = project_data.get("extracted_specs", {})
-    quote_analysis = project_data.get("quote_analysis", {})
+    # Fetch only the fields the completion needs
+    inputs = await db_service.get_completion_inputs(project_id) or CompletionInputsView()
+    specs = inputs.extracted_specs or {}
+    quote_analysis = inputs.quote_analysis or {}
 
     # Validate conversation completion
     evaluation = spec_tracker.evaluate(specs)
@@ -786,52 +1060,93 @@ async def complete_conversation(project_id: str) -> CompleteConversationResponse
             status_code=400,
             detail={"message": "對話尚未完成，仍有關鍵資訊缺失。", "missing_fields": evaluation["missing_fields"]}
         )
+    return conversation["conversation_id"], specs, quote_analysis
+
+
+async def _run_completion(
+    project_id: str,
+    conversation_id: str,
+    specs: Dict[str, Any],
+    quote_analysis: Dict[str, Any],
+    report: Optional[Callable[[str, int], Awaitable[None]]] = None,
+) -> CompleteConversationResponse:
+    """Builds the brief, runs the agents and stores the results; `report(text, progress)` receives progress."""
+    async def progress(text: str, percent: int) -> None:
+        if report is not None:
+            await report(text, percent)
 
     # Build the main project brief and summary
     briefing_model = _build_project_brief(project_id, specs)
     summary = _build_summary_from_brief(briefing_model)
     analysis = _build_analysis_from_brief(briefing_model)
     analysis["original_quote_analysis"] = quote_analysis # Add initial quote analysis to the final package
-
-    # --- Generate Budget Trade-off Suggestions (Task 2.2) ---
-    budget_suggestions = await gemini_service.generate_budget_tradeoff_suggestions(
-        extracted_specs=specs,
-        quote_analysis=quote_analysis
-    )
-    if budget_suggestions:
-        analysis["budget_tradeoffs"] = budget_suggestions
-        await conversation_service.log_event(
-            conversation_id,
-            "budget_analysis_completed",
-            description="Budget trade-off suggestions generated."
-        )
-
-    # Update project with the core brief and summary first
-    await db_service.update_project(
-        project_id,
-        {
-            "project_brief": briefing_model.model_dump(),
-            "conversation_summary": summary,
-            "budget_tradeoff_analysis": budget_suggestions or {}
-        }
-    )
+    await progress("已整理專案需求摘要。", 10)
 
     # --- Multi-Agent Collaboration ---
+    # Budget trade-offs (Task 2.2), contractor and designer only depend on the brief,
+    # so they run concurrently; the endpoint waits for the slowest, not the sum.
     await conversation_service.log_event(
         conversation_id,
         "handoff_started",
-        description="Dispatching project brief to contractor/designer agents."
+        description="Dispatching project brief to budget/contractor/designer agents."
     )
-    contractor_quote = await contractor_agent.run(briefing_model)
-    designer_output = await designer_agent.run(briefing_model)
+    agent_labels = {"budget_tradeoffs": "預算取捨建議", "contractor": "統包商報價", "designer": "設計師渲染圖"}
+    finished: List[str] = []
+
+    async def agent_done(outcome) -> None:
+        finished.append(outcome.name)
+        status_text = "完成" if outcome.ok else "未完成"
+        await progress(
+            f"{agent_labels[outcome.name]}{status_text}。",
+            20 + 60 * len(finished) // len(agent_labels),
+        )
 
-    # Update project with agent outputs
-    await db_service.update_project_with_quote(project_id, contractor_quote)
-    await db_service.update_project_with_rendering(project_id, designer_output.get("image_url", ""))
+    outcomes = await run_agents([
+        AgentCall("budget_tradeoffs", lambda: gemini_service.generate_budget_tradeoff_suggestions(
+            extracted_specs=specs,
+            quote_analysis=quote_analysis
+        )),
+        AgentCall("contractor", lambda: contractor_agent.run(briefing_model)),
+        AgentCall("designer", lambda: designer_agent.run(briefing_model)),
+    ], on_done=agent_done)
+    budget_suggestions = outcomes["budget_tradeoffs"].value
+    contractor_quote = outcomes["contractor"].value
+    designer_output = outcomes["designer"].value or {}
+
+    # One merged write for the brief, summary and whichever agents succeeded
+    project_update: Dict[str, Any] = {
+        "project_brief": briefing_model.model_dump(),
+        "conversation_summary": summary,
+        "budget_tradeoff_analysis": budget_suggestions or {},
+        "agent_status": {name: outcome.summary() for name, outcome in outcomes.items()},
+    }
+    if contractor_quote is not None:
+        project_update["generated_quote"] = contractor_quote.model_dump()
+    if outcomes["designer"].ok:
+        project_update["final_rendering_url"] = designer_output.get("image_url", "")
+    await db_service.update_project(project_id, project_update)
+    await progress("分析結果已儲存。", 90)
 
     # Add agent outputs to the final analysis package
-    analysis["quote"] = contractor_quote.model_dump()
+    if budget_suggestions:
+        analysis["budget_tradeoffs"] = budget_suggestions
+        await conversation_service.log_event(
+            conversation_id,
+            "budget_analysis_completed",
+            description="Budget trade-off suggestions generated."
+        )
+    analysis["quote"] = contractor_quote.model_dump() if contractor_quote is not None else None
     analysis["rendering_url"] = designer_output.get("image_url")
+    failed_agents = {name: outcome.error for name, outcome in outcomes.items() if not outcome.ok}
+    if failed_agents:
+        analysis["agent_errors"] = failed_agents
+        await conversation_service.log_event(
+            conversation_id,
+            "agents_partially_failed",
+            severity="warning",
+            description=f"Agents without results: {', '.join(failed_agents)}.",
+            payload=failed_agents
+        )
 
     await conversation_service.log_event(
         conversation_id,
@@ -845,6 +1160,87 @@ async def complete_conversation(project_id: str) -> CompleteConversationResponse
         analysis=analysis
     )
 
+
+@task_dispatcher.handler(COMPLETION_TASK_TYPE)
+async def _run_completion_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Background job for mode=job completions; progress goes to `job_progress` for SSE clients."""
+    project_id = payload["project_id"]
+    job_id = payload["job_id"]
+
+    async def report(text: str, percent: int) -> None:
+        job_progress.publish(job_id, _completion_progress_event(job_id, "running", text, percent))
+
+    try:
+        await report("開始產生完整分析…", 0)
+        conversation_id, specs, quote_analysis = await _prepare_completion(project_id)
+        result = await _run_completion(project_id, conversation_id, specs, quote_analysis, report=report)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        job_progress.publish(
+            job_id, _completion_progress_event(job_id, "failed", "分析失敗，請稍後再試。", 100, error=detail), final=True
+        )
+        raise
+    payload_out = result.model_dump(mode="json")
+    job_progress.publish(
+        job_id, _completion_progress_event(job_id, "succeeded", "", 100, result=payload_out), final=True
+    )
+    return payload_out
+
+
+def _completion_progress_event(job_id: str, status: str, text: str, percent: int, **extra) -> Dict[str, Any]:
+    """Same shape as the message-stream `message_chunk` events."""
+    return {
+        "chunk": text,
+        "isComplete": status != "running",
+        "metadata": {"jobId": job_id, "status": status, "progress": percent, **extra},
+    }
+
+
+async def _get_completion_job(project_id: str, job_id: str):
+    job = await task_dispatcher.get_job(job_id)
+    if job is None or job.task_type != COMPLETION_TASK_TYPE or job.payload.get("project_id") != project_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/projects/{project_id}/conversation/complete/jobs/{job_id}")
+async def get_completion_job(project_id: str, job_id: str) -> Dict[str, Any]:
+    """Status record of a mode=job completion; the result is also stored on the project."""
+    job = await _get_completion_job(project_id, job_id)
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "result": job.result,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+@router.get("/projects/{project_id}/conversation/complete/jobs/{job_id}/stream")
+async def stream_completion_job(project_id: str, job_id: str) -> StreamingResponse:
+    """SSE progress of a mode=job completion, as `event: message_chunk` frames."""
+    job = await _get_completion_job(project_id, job_id)
+
+    async def event_generator():
+        if job.status in TERMINAL_STATUSES and not job_progress.has(job_id):
+            # Finished before this instance saw it (e.g. after a restart): send the outcome only
+            status = "succeeded" if job.status == JOB_SUCCEEDED else "failed"
+            final = _completion_progress_event(job_id, status, "", 100, result=job.result, error=job.error)
+            yield f"event: message_chunk\n"
+            yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+            return
+        async for event in job_progress.subscribe(job_id, keepalive=COMPLETION_STREAM_KEEPALIVE):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: message_chunk\n"
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Connection": "keep-alive"})
+
+
 def _parse_iso_datetime(value: Optional[str]) -> Optional[datetime]:
     """Parse ISO 8601 string to datetime with timezone awareness."""
     if not value:
@@ -1015,13 +1411,13 @@ async def get_analysis_result(project_id: str) -> Dict[str, Any]:
     if not await conversation_service.project_exists(project_id):
         raise HTTPException(status_code=404, detail="Project not found")
 
-    project_record = await db_service.get_project(project_id)
+    project_record = await db_service.get_analysis_result(project_id)
     if not project_record:
         raise HTTPException(status_code=404, detail="Result not found")
 
-    quote = project_record.get("generated_quote")
-    rendering_url = project_record.get("final_rendering_url")
-    summary = project_record.get("conversation_summary")
+    quote = project_record.generated_quote
+    rendering_url = project_record.final_rendering_url
+    summary = project_record.conversation_summary
 
     if not any([quote, rendering_url, summary]):
         raise HTTPException(status_code=404, detail="Analysis result not available yet")
@@ -2,6 +2,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api import projects
 from src.services.gemini_service import gemini_service
+from src.services.upload_service import upload_service
+from src.services.quote_dispatch import quote_dispatcher
+from src.services.task_dispatcher import task_dispatcher
+from src.services.firestore_client import firestore_clients
 from datetime import datetime
 import os
 
@@ -18,6 +22,23 @@ app.add_middleware(
 
 app.include_router(projects.router, prefix="/api", tags=["projects"])
 
+@app.on_event("startup")
+async def start_background_services():
+    """啟動時建立共用的 GCS client 與 Pub/Sub publisher，並啟動背景工作佇列"""
+    upload_service.start()
+    quote_dispatcher.start()
+    await task_dispatcher.start()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """關機前等待報價單派送回呼完成並關閉 publisher（送出未滿批次），再寫出緩衝中的對話事件日誌"""
+    await task_dispatcher.stop()
+    await quote_dispatcher.drain()
+    quote_dispatcher.close()
+    upload_service.close()
+    await projects.conversation_service.close()
+    task_dispatcher.queue.close()
+
 @app.get("/")
 async def root():
     return {"message": "Analysis Service is running!"}
@@ -43,3 +64,29 @@ async def gemini_status():
         "model": "gemini-1.5-flash" if gemini_service.enabled else None,
         "api_type": "Vertex AI"
     }
+
+@app.get("/debug/cache-stats")
+async def cache_stats():
+    """調試端點:專案/對話查詢與系統提示快取命中統計"""
+    stats = projects.conversation_service.cache_stats()
+    context_cache = getattr(projects.gemini_service, "context_cache", None)
+    if context_cache is not None:
+        stats["prompt_context"] = context_cache.stats()
+    return stats
+
+@app.get("/debug/upload-stats")
+async def upload_stats():
+    """調試端點:上傳各階段(pre-flight / GCS 上傳)耗時與 Pub/Sub 發佈統計"""
+    stats = upload_service.stats()
+    stats["dispatch"] = quote_dispatcher.stats()
+    return stats
+
+@app.get("/debug/task-stats")
+async def task_stats():
+    """調試端點:背景工作佇列狀態統計"""
+    return await task_dispatcher.stats()
+
+@app.get("/debug/firestore-stats")
+async def firestore_stats():
+    """調試端點:共用 Firestore 連線數與進行中的 RPC 統計"""
+    return firestore_clients.stats()
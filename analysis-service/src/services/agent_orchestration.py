@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+AGENT_DEFAULT_TIMEOUT = float(os.getenv("AGENT_DEFAULT_TIMEOUT", "60"))
+# Per-agent overrides, e.g. AGENT_TIMEOUTS="designer=90,contractor=45"
+AGENT_TIMEOUTS: Dict[str, float] = {
+    name.strip(): float(value)
+    for name, _, value in (
+        entry.partition("=") for entry in os.getenv("AGENT_TIMEOUTS", "").split(",") if "=" in entry
+    )
+}
+
+AGENT_OK = "ok"
+AGENT_TIMEOUT = "timeout"
+AGENT_ERROR = "error"
+
+
+def agent_timeout(name: str) -> float:
+    return AGENT_TIMEOUTS.get(name, AGENT_DEFAULT_TIMEOUT)
+
+
+@dataclass
+class AgentCall:
+    """One independent unit of agent work; `run` creates a fresh coroutine."""
+
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    timeout: Optional[float] = None
+
+
+@dataclass
+class AgentOutcome:
+    name: str
+    status: str
+    value: Any = None
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == AGENT_OK
+
+    def summary(self) -> Dict[str, Any]:
+        return {"status": self.status, "error": self.error, "elapsed_ms": round(self.elapsed_ms, 1)}
+
+
+async def _run_one(call: AgentCall) -> AgentOutcome:
+    timeout = call.timeout if call.timeout is not None else agent_timeout(call.name)
+    started = time.perf_counter()
+    try:
+        value = await asyncio.wait_for(call.run(), timeout=timeout)
+        outcome = AgentOutcome(call.name, AGENT_OK, value=value)
+    except asyncio.TimeoutError:
+        logger.warning(f"Agent '{call.name}' timed out after {timeout}s")
+        outcome = AgentOutcome(call.name, AGENT_TIMEOUT, error=f"Timed out after {timeout}s")
+    except Exception as e:
+        logger.error(f"Agent '{call.name}' failed: {e}", exc_info=True)
+        outcome = AgentOutcome(call.name, AGENT_ERROR, error=f"{type(e).__name__}: {e}")
+    outcome.elapsed_ms = (time.perf_counter() - started) * 1000
+    return outcome
+
+
+async def run_agents(
+    calls: Sequence[AgentCall],
+    on_done: Optional[Callable[[AgentOutcome], Awaitable[None]]] = None,
+) -> Dict[str, AgentOutcome]:
+    """
+    Runs independent agents concurrently, each under its own timeout.
+    A failing or slow agent never cancels the others; callers get one outcome
+    per agent and decide what a partial result means for them.
+    `on_done` is awaited as each agent finishes (progress reporting).
+    """
+    async def run_and_report(call: AgentCall) -> AgentOutcome:
+        outcome = await _run_one(call)
+        if on_done is not None:
+            await on_done(outcome)
+        return outcome
+
+    outcomes = await asyncio.gather(*(run_and_report(call) for call in calls))
+    return {outcome.name: outcome for outcome in outcomes}
@@ -1,35 +1,275 @@
 from google.cloud import firestore
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
 from datetime import datetime, timezone
 import logging
+import os
+
+from src.services.cache import LRUTTLCache, MISSING
+from src.services.database_service import FIRESTORE_COLLECTION
+from src.services.firestore_client import firestore_clients
+from src.services.event_log_writer import BufferedEventLogWriter, last_event_data, last_event_ref
+from src.services.history_cache import ConversationHistoryCache
+from src.services.sharded_counter import COUNTER_SHARDS, ShardedCounter
 
 logger = logging.getLogger(__name__)
 
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_LOOKUP_CACHE_SIZE", "2048"))
+LOOKUP_CACHE_TTL = float(os.getenv("CONVERSATION_LOOKUP_CACHE_TTL", "300"))
+# 負快取時間較短：其他實例剛建立的專案不會長時間被誤判為不存在
+LOOKUP_CACHE_NEGATIVE_TTL = float(os.getenv("CONVERSATION_LOOKUP_CACHE_NEGATIVE_TTL", "5"))
+# 執行 scripts/backfill_conversation_pointers.py 後可關閉舊資料的 collection 查詢備援
+CONVERSATION_POINTER_FALLBACK = os.getenv("CONVERSATION_POINTER_FALLBACK", "true").lower() == "true"
+# message_count 以分片計數器累加，避免每則訊息都寫入同一份 conversation document
+CONVERSATION_COUNTER_SHARDS = int(os.getenv("CONVERSATION_COUNTER_SHARDS", str(COUNTER_SHARDS)))
+
+
+def _history_message(message_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """轉成 get_conversation_history 回傳的訊息格式"""
+    return {
+        "id": message_id,
+        "sender": data.get("sender"),
+        "content": data.get("content"),
+        "timestamp": data.get("timestamp"),
+        "metadata": data.get("metadata", {})
+    }
+
+
+class ConversationTurn:
+    """
+    單一對話回合的寫入彙整（unit of work）。
+    回合中對 conversation document 與其子集合的所有變更先暫存在記憶體，
+    於回合結束或 checkpoint() 時以單一 Firestore WriteBatch 原子性寫入。
+    訊息計數寫入分片計數器、最新事件寫入 activity 文件；
+    conversation document 只在 stage / missing_fields 等欄位變更時才寫入。
+    方法簽名與 ConversationService 相同，呼叫端可直接替換。
+    """
+
+    def __init__(self, service: "ConversationService", conversation_id: str):
+        self.service = service
+        self.conversation_id = conversation_id
+        self._conversation_ref = service.conversations_col.document(conversation_id)
+        self._conversation_updates: Dict[str, Any] = {}
+        self._subdocument_sets: Dict[str, Any] = {}
+        self._subdocument_data: Dict[str, Dict[str, Any]] = {}
+        self._created_docs: List[Tuple[Any, Dict[str, Any]]] = []
+        self._staged_messages: List[Dict[str, Any]] = []
+        self._message_count_delta = 0
+        self._last_event: Optional[Dict[str, Any]] = None
+        self._history_summary: Optional[Dict[str, Any]] = None
+
+    @property
+    def pending_writes(self) -> int:
+        """目前暫存、尚未寫入的操作數"""
+        return (
+            len(self._created_docs)
+            + len(self._subdocument_sets)
+            + int(bool(self._conversation_updates))
+            + int(bool(self._message_count_delta))
+            + int(self._last_event is not None)
+        )
+
+    async def __aenter__(self) -> "ConversationTurn":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.commit()
+            return
+        # 回合中途失敗時仍盡量保存已完成的部分（例如使用者訊息）
+        try:
+            await self.commit()
+        except Exception as commit_exc:
+            logger.warning(
+                f"Failed to commit partial turn for conversation {self.conversation_id}: {commit_exc}"
+            )
+
+    async def save_message(
+        self,
+        sender: str,
+        content: str,
+        message_type: str = "text",
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        message_ref = self._conversation_ref.collection("messages").document()
+        self._created_docs.append((message_ref, {
+            "sender": sender,
+            "content": content,
+            "type": message_type,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "metadata": metadata or {}
+        }))
+        self._staged_messages.append(_history_message(message_ref.id, {
+            "sender": sender,
+            "content": content,
+            "timestamp": datetime.now(timezone.utc),
+            "metadata": metadata or {}
+        }))
+        self._message_count_delta += 1
+        return message_ref.id
+
+    async def update_extracted_specs(self, specs: Dict[str, Any]) -> None:
+        self._stage_subdocument("extracted_specs", "current_version", specs)
+
+    async def update_history_summary(self, summary_state: Dict[str, Any]) -> None:
+        self._stage_subdocument("history_summary", "current", summary_state)
+        self._history_summary = summary_state
+
+    async def update_conversation_stage(self, stage: str, progress: int) -> None:
+        self._conversation_updates.update({"stage": stage, "progress": progress})
+
+    async def update_missing_fields(self, missing_fields: List[Dict[str, Any]]) -> None:
+        self._conversation_updates["missing_fields"] = missing_fields
+
+    async def log_event(
+        self,
+        event_type: str,
+        *,
+        severity: str = "info",
+        source: str = "system",
+        description: str = "",
+        payload: Optional[Dict[str, Any]] = None
+    ) -> None:
+        event_ref = self._conversation_ref.collection("events").document()
+        event = {
+            "type": event_type,
+            "severity": severity,
+            "source": source,
+            "description": description,
+            "payload": payload or {},
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "logged_at": datetime.now(timezone.utc)
+        }
+        self._created_docs.append((event_ref, event))
+        self._last_event = event
+
+    async def checkpoint(self) -> int:
+        """將目前暫存的變更寫入 Firestore，回傳寫入操作數；回合可繼續使用"""
+        return await self.commit()
+
+    async def commit(self) -> int:
+        """以單一 WriteBatch 寫入暫存的變更"""
+        write_count = self.pending_writes
+        if not write_count:
+            return 0
+
+        batch = self.service.db.batch()
+        for doc_ref, data in self._created_docs:
+            batch.set(doc_ref, data)
+        for path, doc_ref in self._subdocument_sets.items():
+            batch.set(doc_ref, self._subdocument_data[path], merge=True)
+
+        if self._conversation_updates:
+            batch.set(self._conversation_ref, {
+                **self._conversation_updates,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            }, merge=True)
+        if self._message_count_delta:
+            self.service.message_counter(self.conversation_id).increment_in(batch, self._message_count_delta)
+        if self._last_event is not None:
+            batch.set(last_event_ref(self._conversation_ref), last_event_data(self._last_event), merge=True)
+
+        await batch.commit()
+        for message in self._staged_messages:
+            self.service.history_cache.append(self.conversation_id, message)
+        if self._history_summary is not None:
+            self.service.history_cache.set_summary(self.conversation_id, self._history_summary)
+        self._reset()
+        return write_count
+
+    def _stage_subdocument(self, collection: str, document: str, data: Dict[str, Any]) -> None:
+        path = f"{collection}/{document}"
+        if path not in self._subdocument_sets:
+            self._subdocument_sets[path] = self._conversation_ref.collection(collection).document(document)
+            self._subdocument_data[path] = {}
+        self._subdocument_data[path].update(data)
+
+    def _reset(self) -> None:
+        self._conversation_updates = {}
+        self._subdocument_sets = {}
+        self._subdocument_data = {}
+        self._created_docs = []
+        self._staged_messages = []
+        self._message_count_delta = 0
+        self._last_event = None
+        self._history_summary = None
+
+
 class ConversationService:
     """Firestore 持久化對話服務"""
 
-    def __init__(self):
-        self.db = firestore.AsyncClient()
-        self.conversations_col = self.db.collection("conversations")
+    def __init__(self, db: Optional[Any] = None):
+        # The shared registry picks a channel per call; tests inject a single client
+        self.db = db if db is not None else firestore_clients
+        self.event_writer = BufferedEventLogWriter(self.db, "conversations")
+        self.history_cache = ConversationHistoryCache()
+        self.project_exists_cache = LRUTTLCache(
+            LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL, negative_ttl_seconds=LOOKUP_CACHE_NEGATIVE_TTL
+        )
+        self.project_conversation_cache = LRUTTLCache(
+            LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL, negative_ttl_seconds=LOOKUP_CACHE_NEGATIVE_TTL
+        )
 
     async def create_conversation(
         self,
         conversation_id: str,
         project_id: str
     ) -> Dict[str, Any]:
-        """初始化新的對話會話"""
+        """
+        初始化新的對話會話，並在 project document 上寫入指向最新對話的 conversation_id，
+        讓 get_project_conversation 以單一文件讀取取代 collection 查詢。
+        （反向查詢由 conversation document 本身的 project_id 欄位提供）
+        """
         data = {
             "conversation_id": conversation_id,
             "project_id": project_id,
             "stage": "greeting",
             "progress": 0,
-            "message_count": 0,
             "created_at": firestore.SERVER_TIMESTAMP,
             "updated_at": firestore.SERVER_TIMESTAMP
         }
-        await self.conversations_col.document(conversation_id).set(data)
+        batch = self.db.batch()
+        batch.set(self.conversations_col.document(conversation_id), data)
+        batch.set(self.projects_col.document(project_id), {
+            "conversation_id": conversation_id,
+            "conversation_updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        await batch.commit()
+        self.project_exists_cache.set(project_id, True)
+        self.project_conversation_cache.set(project_id, {
+            key: value for key, value in data.items() if key not in ("created_at", "updated_at")
+        })
         return data
 
+    @property
+    def conversations_col(self):
+        return self.db.collection("conversations")
+
+    @property
+    def projects_col(self):
+        return self.db.collection(FIRESTORE_COLLECTION)
+
+    def message_counter(self, conversation_id: str) -> ShardedCounter:
+        return ShardedCounter(
+            self.db, self.conversations_col.document(conversation_id), "message_count", CONVERSATION_COUNTER_SHARDS
+        )
+
+    async def get_message_count(self, conversation_id: str) -> int:
+        """加總分片計數器取得對話訊息數"""
+        return await self.message_counter(conversation_id).total()
+
+    async def get_last_event(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """取得最新事件（last_event / last_event_severity / updated_at）"""
+        doc = await last_event_ref(self.conversations_col.document(conversation_id)).get()
+        return doc.to_dict() if doc.exists else None
+
+    def turn(self, conversation_id: str) -> ConversationTurn:
+        """
+        建立單一回合的 unit of work，回合內的寫入於結束時合併為一次 WriteBatch。
+        用法：async with conversation_service.turn(conversation_id) as turn: ...
+        """
+        return ConversationTurn(self, conversation_id)
+
     async def save_message(
         self,
         conversation_id: str,
@@ -38,49 +278,70 @@ class ConversationService:
         message_type: str = "text",
         metadata: Optional[Dict[str, Any]] = None
     ) -> str:
-        """保存單一消息到 Firestore，並支持自訂消息類型"""
-        doc_ref, message_ref = await self.conversations_col.document(
-            conversation_id
-        ).collection("messages").add({
+        """保存單一消息到 Firestore，並支持自訂消息類型（訊息與分片計數於同一批次寫入）"""
+        message_ref = self.conversations_col.document(conversation_id).collection("messages").document()
+        batch = self.db.batch()
+        batch.set(message_ref, {
             "sender": sender,
             "content": content,
             "type": message_type, # Add message type field
             "timestamp": firestore.SERVER_TIMESTAMP,
             "metadata": metadata or {}
         })
-
         # 增加消息計數
-        await self.conversations_col.document(conversation_id).update({
-            "message_count": firestore.Increment(1),
-            "updated_at": firestore.SERVER_TIMESTAMP
-        })
+        self.message_counter(conversation_id).increment_in(batch)
+        await batch.commit()
 
+        self.history_cache.append(conversation_id, _history_message(message_ref.id, {
+            "sender": sender,
+            "content": content,
+            "timestamp": datetime.now(timezone.utc),
+            "metadata": metadata or {}
+        }))
         return message_ref.id
 
     async def get_conversation_history(
         self,
         conversation_id: str,
-        limit: int = 100
+        limit: Optional[int] = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        檢索對話歷史（用於傳遞給LLM），依時間排序回傳前 limit 筆（None 為全部）。
+        歷史保存在行程內快取：首次完整載入，之後只在超過同步間隔時
+        查詢 last_synced_timestamp 之後的新訊息，一般回合不需讀取 Firestore。
+        滾動摘要狀態與歷史並行讀取並一起快取（見 get_history_summary）。
+        """
+        entry = self.history_cache.get(conversation_id)
+        if entry is None:
+            loaded_at = datetime.now(timezone.utc)
+            messages, summary_state = await asyncio.gather(
+                self._stream_messages(conversation_id),
+                self._read_history_summary(conversation_id),
+            )
+            entry = self.history_cache.store(conversation_id, messages, loaded_at=loaded_at)
+            entry.summary_state = summary_state
+        elif self.history_cache.needs_sync(entry):
+            messages = await self._stream_messages(conversation_id, after=entry.last_synced_timestamp)
+            self.history_cache.merge(entry, messages)
+
+        return list(entry.messages[:limit])
+
+    async def _stream_messages(
+        self,
+        conversation_id: str,
+        after: Optional[datetime] = None
     ) -> List[Dict[str, Any]]:
-        """檢索完整的對話歷史（用於傳遞給LLM）"""
         messages_ref = self.conversations_col.document(
             conversation_id
-        ).collection("messages").order_by(
-            "timestamp",
-            direction=firestore.Query.ASCENDING
-        ).limit(limit)
+        ).collection("messages")
+        if after is not None:
+            messages_ref = messages_ref.where("timestamp", ">", after)
+        query = messages_ref.order_by("timestamp", direction=firestore.Query.ASCENDING)
 
-        docs = messages_ref.stream()
+        docs = query.stream()
         messages: List[Dict[str, Any]] = []
         async for doc in docs:
-            data = doc.to_dict() or {}
-            messages.append({
-                "id": doc.id,
-                "sender": data.get("sender"),
-                "content": data.get("content"),
-                "timestamp": data.get("timestamp"),
-                "metadata": data.get("metadata", {})
-            })
+            messages.append(_history_message(doc.id, doc.to_dict() or {}))
         return messages
 
     async def update_extracted_specs(
@@ -95,6 +356,35 @@ class ConversationService:
             "current_version"
         ).set(specs, merge=True)
 
+    async def get_history_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        讀取滾動摘要狀態（由 GeminiLLMService 壓縮歷史時產生）。
+        歷史已快取時直接回傳快取中的狀態，不需讀取 Firestore。
+        """
+        cached = self.history_cache.get_summary(conversation_id)
+        if cached is not MISSING:
+            return cached
+        summary_state = await self._read_history_summary(conversation_id)
+        self.history_cache.set_summary(conversation_id, summary_state)
+        return summary_state
+
+    async def _read_history_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.conversations_col.document(
+            conversation_id
+        ).collection("history_summary").document("current").get()
+        return doc.to_dict() if doc.exists else None
+
+    async def update_history_summary(
+        self,
+        conversation_id: str,
+        summary_state: Dict[str, Any]
+    ) -> None:
+        """保存滾動摘要狀態，與對話一起持久化"""
+        await self.conversations_col.document(
+            conversation_id
+        ).collection("history_summary").document("current").set(summary_state)
+        self.history_cache.set_summary(conversation_id, summary_state)
+
     async def update_conversation_stage(
         self,
         conversation_id: str,
@@ -145,11 +435,45 @@ class ConversationService:
         return doc.to_dict() if doc.exists else None
 
     async def get_project_conversation(self, project_id: str) -> Optional[Dict[str, Any]]:
-        """用 project_id 查找對話"""
+        """
+        用 project_id 查找對話（經 LRU+TTL 快取）。
+        快取內容供辨識對話使用；stage/progress 等欄位請以 get_conversation 讀取最新值。
+        """
+        cached = self.project_conversation_cache.get(project_id)
+        if cached is not MISSING:
+            return dict(cached) if cached is not None else None
+
+        conversation = await self._get_conversation_by_pointer(project_id)
+        if conversation is None and CONVERSATION_POINTER_FALLBACK:
+            conversation = await self._find_conversation_by_query(project_id)
+        self.project_conversation_cache.set(project_id, conversation)
+        return dict(conversation) if conversation is not None else None
+
+    async def _get_conversation_by_pointer(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """透過 project document 上的 conversation_id 指標取得對話"""
+        project_doc = await self.projects_col.document(project_id).get(field_paths=["conversation_id"])
+        conversation_id = (project_doc.to_dict() or {}).get("conversation_id") if project_doc.exists else None
+        if not conversation_id:
+            return None
+        return await self.get_conversation(conversation_id)
+
+    async def _find_conversation_by_query(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """
+        舊資料（尚未 backfill 指標）的備援查詢；找到時順便補寫指標，
+        之後的查詢即可走單一文件讀取。
+        """
         query = self.conversations_col.where("project_id", "==", project_id).limit(1)
         docs = query.stream()
         async for doc in docs:
-            return doc.to_dict()
+            conversation = doc.to_dict()
+            try:
+                await self.projects_col.document(project_id).set({
+                    "conversation_id": doc.id,
+                    "conversation_updated_at": firestore.SERVER_TIMESTAMP
+                }, merge=True)
+            except Exception as exc:
+                logger.warning(f"Failed to backfill conversation pointer for project {project_id}: {exc}")
+            return conversation
         return None
 
     async def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
@@ -158,17 +482,32 @@ class ConversationService:
         return doc.to_dict() if doc.exists else None
 
     async def project_exists(self, project_id: str) -> bool:
-        """檢查專案是否存在"""
-        doc = await self.db.collection("projects").document(project_id).get()
+        """檢查專案是否存在（經 LRU+TTL 快取，不存在的結果以較短 TTL 負快取）"""
+        cached = self.project_exists_cache.get(project_id)
+        if cached is not MISSING:
+            return cached is True
+
+        doc = await self.projects_col.document(project_id).get()
+        self.project_exists_cache.set(project_id, True if doc.exists else None)
         return doc.exists
 
     async def create_project_in_db(self, project_id: str) -> None:
         """在 Firestore 中創建專案記錄"""
-        await self.db.collection("projects").document(project_id).set({
+        await self.projects_col.document(project_id).set({
             "id": project_id,
             "status": "created",
             "created_at": firestore.SERVER_TIMESTAMP,
         })
+        self.project_exists_cache.set(project_id, True)
+        self.project_conversation_cache.invalidate(project_id)
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """回傳各快取的命中統計"""
+        return {
+            "project_exists": self.project_exists_cache.stats(),
+            "project_conversation": self.project_conversation_cache.stats(),
+            "conversation_history": self.history_cache.stats(),
+        }
 
     async def log_event(
         self,
@@ -180,7 +519,11 @@ class ConversationService:
         description: str = "",
         payload: Optional[Dict[str, Any]] = None
     ) -> None:
-        """寫入對話事件日誌"""
+        """
+        寫入對話事件日誌。
+        事件交由 BufferedEventLogWriter 排程批次寫入，不阻塞呼叫端；
+        需要立即落盤時請呼叫 flush_events()。
+        """
         event_data = {
             "type": event_type,
             "severity": severity,
@@ -190,15 +533,18 @@ class ConversationService:
             "timestamp": firestore.SERVER_TIMESTAMP
         }
         try:
-            await self.conversations_col.document(conversation_id).collection("events").add(event_data)
-            await self.conversations_col.document(conversation_id).update({
-                "last_event": event_type,
-                "last_event_severity": severity,
-                "updated_at": firestore.SERVER_TIMESTAMP
-            })
+            self.event_writer.enqueue(conversation_id, event_data)
         except Exception as exc:
             logger.warning(f"Failed to log event for conversation {conversation_id}: {exc}")
 
+    async def flush_events(self) -> int:
+        """立即寫出緩衝中的事件（供關機 hook 或測試使用）"""
+        return await self.event_writer.flush()
+
+    async def close(self) -> None:
+        """服務關閉時寫出所有尚未落盤的事件"""
+        await self.event_writer.close()
+
     async def get_events(
         self,
         conversation_id: str,
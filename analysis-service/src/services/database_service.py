@@ -1,9 +1,11 @@
-import asyncio
 import logging
 import os
-from typing import Any, Dict, Optional
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 from src.models.project import Booking, Quote
+from src.services.firestore_client import FIRESTORE_PROJECT_ID, firestore_clients
 
 try:
     from google.cloud import firestore
@@ -13,33 +15,135 @@ except ImportError:  # pragma: no cover - optional dependency for local dev
 logger = logging.getLogger(__name__)
 
 FIRESTORE_COLLECTION = os.getenv("FIRESTORE_PROJECTS_COLLECTION", "projects")
+# Parse results keyed by the SHA-256 of the uploaded file (written by the background processor)
+QUOTE_PARSE_CACHE_COLLECTION = os.getenv("QUOTE_PARSE_CACHE_COLLECTION", "quote_parse_cache")
 DB_BACKEND = os.getenv("DB_BACKEND", "mock").lower()
-DEFAULT_PROJECT_ID = (
-    os.getenv("FIRESTORE_PROJECT_ID")
-    or os.getenv("PROJECT_ID")
-    or os.getenv("GCP_PROJECT")
-    or os.getenv("GOOGLE_CLOUD_PROJECT")
-)
+DEFAULT_PROJECT_ID = FIRESTORE_PROJECT_ID
 
+# update_project(read_back=...): False = no read, True = whole document, or a list of field paths
+ReadBack = Union[bool, Sequence[str]]
 
-class MockDBService:
+
+@dataclass(frozen=True)
+class ProjectWriteResult:
+    """Write metadata of update_project; `document` is only set when read-back was requested."""
+
+    project_id: str
+    update_time: Optional[datetime]
+    document: Optional[Dict[str, Any]] = None
+
+
+def project_fields(document: Dict[str, Any], field_paths: Sequence[str]) -> Dict[str, Any]:
+    """Keeps only `field_paths` (dotted paths allowed), the way a Firestore field mask does."""
+    projected: Dict[str, Any] = {}
+    for path in field_paths:
+        parts = path.split(".")
+        value: Any = document
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+
+ViewT = TypeVar("ViewT", bound="ProjectView")
+
+
+class ProjectView:
+    """
+    Typed, field-masked slice of a project document. Each subclass is a
+    dataclass whose field names are the document fields it needs, so only
+    those are transferred and deserialized.
+    """
+
+    @classmethod
+    def field_paths(cls) -> Tuple[str, ...]:
+        return tuple(field.name for field in fields(cls))
+
+    @classmethod
+    def from_document(cls: Type[ViewT], document: Dict[str, Any]) -> ViewT:
+        return cls(**{name: document.get(name) for name in cls.field_paths()})
+
+
+@dataclass(frozen=True)
+class QuoteContextView(ProjectView):
+    """init_conversation: uploaded quote text (inline or its blob manifest) and its cached extraction."""
+
+    original_quote_content: Optional[str] = None
+    quote_text_manifest: Optional[Dict[str, Any]] = None
+    structured_quote: Optional[Dict[str, Any]] = None
+    structured_quote_source_sha256: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CompletionInputsView(ProjectView):
+    """complete_conversation: collected specs and the initial quote analysis."""
+
+    extracted_specs: Optional[Dict[str, Any]] = None
+    quote_analysis: Optional[Dict[str, Any]] = None
+
+
+@dataclass(frozen=True)
+class AnalysisResultView(ProjectView):
+    """get_analysis_result: outputs written by the completion agents."""
+
+    generated_quote: Optional[Dict[str, Any]] = None
+    final_rendering_url: Optional[str] = None
+    conversation_summary: Optional[str] = None
+
+
+class _ProjectViewsMixin:
+    """Per-endpoint typed reads on top of get_project(fields=...)."""
+
+    async def get_project_view(self, project_id: str, view: Type[ViewT]) -> Optional[ViewT]:
+        document = await self.get_project(project_id, fields=view.field_paths())
+        return view.from_document(document) if document is not None else None
+
+    async def get_quote_context(self, project_id: str) -> Optional[QuoteContextView]:
+        return await self.get_project_view(project_id, QuoteContextView)
+
+    async def get_completion_inputs(self, project_id: str) -> Optional[CompletionInputsView]:
+        return await self.get_project_view(project_id, CompletionInputsView)
+
+    async def get_analysis_result(self, project_id: str) -> Optional[AnalysisResultView]:
+        return await self.get_project_view(project_id, AnalysisResultView)
+
+
+class MockDBService(_ProjectViewsMixin):
     """In-memory database used for local development and testing."""
 
     def __init__(self) -> None:
         self._db: Dict[str, Dict] = {}
+        self._parse_cache: Dict[str, Dict[str, Any]] = {}
 
-    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+    async def get_project(
+        self, project_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
         logger.info("MOCK DB: get project '%s'", project_id)
-        return self._db.get(project_id)
-
-    async def update_project(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        document = self._db.get(project_id)
+        if document is None or fields is None:
+            return document
+        return project_fields(document, fields)
+
+    async def update_project(
+        self, project_id: str, data: Dict[str, Any], *, read_back: ReadBack = False
+    ) -> ProjectWriteResult:
         logger.info("MOCK DB: update project '%s'", project_id)
         if project_id not in self._db:
             self._db[project_id] = {}
 
         self._db[project_id].update(data)
         logger.debug("MOCK DB: project '%s' data: %s", project_id, self._db[project_id])
-        return self._db[project_id]
+        document = None
+        if read_back:
+            current = self._db[project_id]
+            document = dict(current) if read_back is True else project_fields(current, read_back)
+        return ProjectWriteResult(project_id, datetime.now(timezone.utc), document)
 
     async def update_project_with_quote(self, project_id: str, quote: Quote) -> None:
         await self.update_project(project_id, {"generated_quote": quote.model_dump()})
@@ -56,39 +160,50 @@ class MockDBService:
             },
         )
 
+    async def get_quote_parse_result(self, content_sha256: str) -> Optional[Dict[str, Any]]:
+        return self._parse_cache.get(content_sha256)
+
+    async def save_quote_parse_result(self, content_sha256: str, result: Dict[str, Any]) -> None:
+        self._parse_cache[content_sha256] = dict(result)
+
 
-class FirestoreDBService:
+class FirestoreDBService(_ProjectViewsMixin):
     """Firestore-backed database service for production deployment."""
 
-    def __init__(self, project_id: Optional[str] = None) -> None:
-        if firestore is None:
+    def __init__(self, client: Optional[Any] = None) -> None:
+        if client is None and firestore is None:
             raise ImportError(
                 "google-cloud-firestore is not installed. "
                 "Install the dependency or switch DB_BACKEND to 'mock'."
             )
-
-        # Allow Firestore to infer credentials from the environment
-        self._client = firestore.Client(project=project_id)
+        # Shares the process-wide AsyncClient pool (channel picked per call) with ConversationService
+        self._client = client if client is not None else firestore_clients
         self._collection_name = FIRESTORE_COLLECTION
 
     def _project_ref(self, project_id: str):
         return self._client.collection(self._collection_name).document(project_id)
 
-    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
-        def _get_project() -> Optional[Dict[str, Any]]:
-            doc = self._project_ref(project_id).get()
-            return doc.to_dict() if doc.exists else None
-
-        return await asyncio.to_thread(_get_project)
-
-    async def update_project(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        def _update_project() -> Dict[str, Any]:
-            doc_ref = self._project_ref(project_id)
-            doc_ref.set(data, merge=True)
-            doc = doc_ref.get()
-            return doc.to_dict() if doc.exists else data
-
-        return await asyncio.to_thread(_update_project)
+    async def get_project(
+        self, project_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """`fields` is a Firestore field mask; only those paths are sent back."""
+        doc = await self._project_ref(project_id).get(field_paths=list(fields) if fields is not None else None)
+        return doc.to_dict() if doc.exists else None
+
+    async def update_project(
+        self, project_id: str, data: Dict[str, Any], *, read_back: ReadBack = False
+    ) -> ProjectWriteResult:
+        """
+        Server-side merge without a read. Pass read_back=True (whole document) or
+        a list of field paths to fetch the merged result with one extra read.
+        """
+        doc_ref = self._project_ref(project_id)
+        write_result = await doc_ref.set(data, merge=True)
+        document = None
+        if read_back:
+            doc = await doc_ref.get(field_paths=None if read_back is True else list(read_back))
+            document = doc.to_dict() if doc.exists else None
+        return ProjectWriteResult(project_id, getattr(write_result, "update_time", None), document)
 
     async def update_project_with_quote(self, project_id: str, quote: Quote) -> None:
         await self.update_project(project_id, {"generated_quote": quote.model_dump()})
@@ -105,6 +220,13 @@ class FirestoreDBService:
             },
         )
 
+    async def get_quote_parse_result(self, content_sha256: str) -> Optional[Dict[str, Any]]:
+        doc = await self._client.collection(QUOTE_PARSE_CACHE_COLLECTION).document(content_sha256).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def save_quote_parse_result(self, content_sha256: str, result: Dict[str, Any]) -> None:
+        await self._client.collection(QUOTE_PARSE_CACHE_COLLECTION).document(content_sha256).set(result)
+
 
 _db_service: Optional[Any] = None
 
@@ -117,7 +239,7 @@ def get_database_service() -> Any:
     backend = DB_BACKEND.lower()
     if backend == "firestore":
         try:
-            _db_service = FirestoreDBService(project_id=DEFAULT_PROJECT_ID)
+            _db_service = FirestoreDBService()
             logger.info("Using FirestoreDBService for persistence.")
             return _db_service
         except Exception as exc:  # pragma: no cover - defensive logging
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+from src.services.firestore_client import FirestoreClientRegistry
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", "50"))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "0.5"))
+
+# Firestore 單一 WriteBatch 最多 500 個寫入
+FIRESTORE_MAX_BATCH_WRITES = 500
+# 最新事件記錄在 conversations/{id}/activity/last_event，不寫入高頻更新的 conversation document
+ACTIVITY_COLLECTION = "activity"
+LAST_EVENT_DOCUMENT = "last_event"
+
+
+def last_event_ref(conversation_ref: Any) -> Any:
+    return conversation_ref.collection(ACTIVITY_COLLECTION).document(LAST_EVENT_DOCUMENT)
+
+
+def last_event_data(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "last_event": event["type"],
+        "last_event_severity": event["severity"],
+        "updated_at": firestore.SERVER_TIMESTAMP
+    }
+
+
+class BufferedEventLogWriter:
+    """
+    對話事件日誌的緩衝寫入器。
+    事件先排入記憶體佇列，達到批次大小或時間窗口時以 Firestore WriteBatch 一次寫入，
+    並將同一對話的 last_event / updated_at 合併為每次 flush 一筆 activity 文件寫入。
+    db 可為 FirestoreClientRegistry：每次 flush 取用輪替中的下一個 client，寫入分散到各 channel。
+    """
+
+    def __init__(
+        self,
+        db: Any,
+        collection: str = "conversations",
+        *,
+        batch_size: int = EVENT_LOG_BATCH_SIZE,
+        flush_interval: float = EVENT_LOG_FLUSH_INTERVAL,
+    ) -> None:
+        self.db = db
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, conversation_id: str, event_data: Dict[str, Any]) -> None:
+        """排入一筆事件，不等待 Firestore 寫入"""
+        event = dict(event_data)
+        # 同一批次內的 SERVER_TIMESTAMP 會相同，保留客戶端時間以維持事件順序
+        event.setdefault("logged_at", datetime.now(timezone.utc))
+        self._pending.append((conversation_id, event))
+
+        if len(self._pending) >= self.batch_size:
+            self._spawn(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = self._spawn(self._flush_after_interval())
+
+    async def flush(self) -> int:
+        """將目前佇列中的事件寫入 Firestore，回傳寫入的事件數"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, []
+
+            written = 0
+            for chunk in self._chunk(pending):
+                try:
+                    await self._commit(chunk)
+                    written += len(chunk)
+                except Exception as exc:
+                    conversation_ids = sorted({conversation_id for conversation_id, _ in chunk})
+                    logger.warning(
+                        f"Failed to flush {len(chunk)} events for conversations {conversation_ids}: {exc}"
+                    )
+            return written
+
+    async def close(self) -> None:
+        """關閉前呼叫：等待進行中的 flush 並寫出剩餘事件"""
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+        await self.flush()
+
+    async def _flush_after_interval(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        # shield：關閉時取消計時器不應中斷已開始的寫入
+        await asyncio.shield(self.flush())
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+
+    def _chunk(self, pending: List[Tuple[str, Dict[str, Any]]]):
+        """切分批次，確保事件數加上 activity 寫入數不超過 WriteBatch 上限"""
+        chunk: List[Tuple[str, Dict[str, Any]]] = []
+        conversation_ids: set = set()
+        for conversation_id, event in pending:
+            new_parent = 0 if conversation_id in conversation_ids else 1
+            writes_after_add = len(chunk) + 1 + len(conversation_ids) + new_parent
+            if chunk and writes_after_add > FIRESTORE_MAX_BATCH_WRITES:
+                yield chunk
+                chunk, conversation_ids = [], set()
+            chunk.append((conversation_id, event))
+            conversation_ids.add(conversation_id)
+        if chunk:
+            yield chunk
+
+    async def _commit(self, chunk: List[Tuple[str, Dict[str, Any]]]) -> None:
+        client = self.db.client() if isinstance(self.db, FirestoreClientRegistry) else self.db
+        batch = client.batch()
+        conversations_col = client.collection(self.collection)
+        latest: Dict[str, Dict[str, Any]] = {}
+        for conversation_id, event in chunk:
+            conversation_ref = conversations_col.document(conversation_id)
+            batch.set(conversation_ref.collection("events").document(), event)
+            latest[conversation_id] = event
+
+        for conversation_id, event in latest.items():
+            batch.set(last_event_ref(conversations_col.document(conversation_id)), last_event_data(event), merge=True)
+        await batch.commit()
@@ -0,0 +1,171 @@
+import inspect
+import itertools
+import logging
+import os
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+try:
+    from google.cloud import firestore
+except ImportError:  # pragma: no cover - optional dependency for local dev
+    firestore = None
+
+logger = logging.getLogger(__name__)
+
+# Number of gRPC channels (one AsyncClient each) shared by every service in the process
+FIRESTORE_GRPC_CHANNELS = int(os.getenv("FIRESTORE_GRPC_CHANNELS", "1"))
+FIRESTORE_PROJECT_ID = (
+    os.getenv("FIRESTORE_PROJECT_ID")
+    or os.getenv("PROJECT_ID")
+    or os.getenv("GCP_PROJECT")
+    or os.getenv("GOOGLE_CLOUD_PROJECT")
+)
+
+
+class RpcCounters:
+    """Started / completed / in-flight Firestore RPCs, in total and per method."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.started = 0
+        self.completed = 0
+        self.by_method: Dict[str, Dict[str, int]] = {}
+
+    def start(self, method: str) -> Dict[str, int]:
+        per_method = self.by_method.setdefault(method, {"in_flight": 0, "started": 0})
+        per_method["in_flight"] += 1
+        per_method["started"] += 1
+        self.in_flight += 1
+        self.started += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return per_method
+
+    def finish(self, per_method: Dict[str, int]) -> None:
+        per_method["in_flight"] -= 1
+        self.in_flight -= 1
+        self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "started": self.started,
+            "completed": self.completed,
+            "by_method": {name: dict(values) for name, values in self.by_method.items()},
+        }
+
+
+_PLAIN_VALUES = (str, bytes, int, float, bool, type(None), dict, list, tuple)
+
+
+class _CountedFirestore:
+    """
+    Public-API wrapper around a Firestore client / reference / query / batch.
+    Awaited calls count as one RPC until they return and async iterators
+    (stream, get_all) until they are exhausted or closed; references and
+    queries it hands out are wrapped the same way.
+    """
+
+    __slots__ = ("_target", "_counters")
+
+    def __init__(self, target: Any, counters: RpcCounters):
+        self._target = target
+        self._counters = counters
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if not callable(value):
+            return self._wrap(value, name)
+
+        def call(*args, **kwargs):
+            return self._wrap(value(*args, **kwargs), name)
+
+        return call
+
+    def _wrap(self, value: Any, name: str) -> Any:
+        method = f"{type(self._target).__name__}.{name}"
+        if inspect.isawaitable(value):
+            return self._count_awaitable(value, method)
+        if hasattr(value, "__aiter__"):
+            return self._count_iterator(value, method)
+        if isinstance(value, _PLAIN_VALUES):
+            return value
+        return _CountedFirestore(value, self._counters)
+
+    async def _count_awaitable(self, awaitable, method: str) -> Any:
+        per_method = self._counters.start(method)
+        try:
+            return await awaitable
+        finally:
+            self._counters.finish(per_method)
+
+    async def _count_iterator(self, iterator, method: str) -> AsyncIterator[Any]:
+        per_method = self._counters.start(method)
+        try:
+            async for item in iterator:
+                yield item
+        finally:
+            self._counters.finish(per_method)
+
+
+class FirestoreClientRegistry:
+    """
+    Process-wide pool of Firestore AsyncClients, one gRPC channel each.
+    Services hold the registry itself as their `db`: every collection(),
+    document(), batch() and get_all() call takes the next client round-robin,
+    so consecutive operations of one service spread across all channels.
+    Refs, batches and snapshots of different clients can be mixed freely
+    since they all point at the same project and database.
+    """
+
+    def __init__(
+        self,
+        channels: int = FIRESTORE_GRPC_CHANNELS,
+        project: Optional[str] = FIRESTORE_PROJECT_ID,
+        client_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self.channels = max(1, channels)
+        self.project = project
+        self.rpc_counters = RpcCounters()
+        self._client_factory = client_factory
+        self._clients: List[Any] = []
+        self._next = itertools.cycle(range(self.channels))
+
+    def _new_client(self) -> Any:
+        if self._client_factory is not None:
+            return self._client_factory()
+        if firestore is None:
+            raise ImportError(
+                "google-cloud-firestore is not installed. "
+                "Install the dependency or switch DB_BACKEND to 'mock'."
+            )
+        return firestore.AsyncClient(project=self.project)
+
+    def client(self) -> _CountedFirestore:
+        """The next client in the rotation; channels are opened on first use."""
+        index = next(self._next)
+        while len(self._clients) <= index:
+            self._clients.append(_CountedFirestore(self._new_client(), self.rpc_counters))
+            logger.info(f"Created Firestore channel {len(self._clients)}/{self.channels}")
+        return self._clients[index]
+
+    def collection(self, *path: str) -> Any:
+        return self.client().collection(*path)
+
+    def document(self, *path: str) -> Any:
+        return self.client().document(*path)
+
+    def batch(self) -> Any:
+        return self.client().batch()
+
+    def transaction(self, **kwargs) -> Any:
+        return self.client().transaction(**kwargs)
+
+    def get_all(self, references, **kwargs) -> AsyncIterator[Any]:
+        return self.client().get_all(references, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"channels": self.channels, "open_clients": len(self._clients), "rpcs": self.rpc_counters.stats()}
+
+
+firestore_clients = FirestoreClientRegistry()
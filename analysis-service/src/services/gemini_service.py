@@ -1,65 +1,139 @@
 import os
-import logging
 import json
-import re
+import logging
 from typing import AsyncGenerator, Optional, Tuple, Dict, Any, List
-from google import genai
 from google.genai import types
 from google.api_core import exceptions as google_exceptions
 import asyncio
 
+from src.services.llm_backend import LLMBackend, LLMBackendError, build_llm_backend
 from src.services.spec_tracking import SpecTracker
+from src.services.history_compaction import (
+    CompactionResult,
+    HistoryCompactor,
+    estimate_tokens,
+    extractive_summary,
+)
+from src.services.prompt_library import (
+    PromptContextCache,
+    StagePrompt,
+    build_prompt_context_cache,
+    prompt_library,
+)
 # from src.services.image_service import image_service
 
 logger = logging.getLogger(__name__)
 
-MAX_HISTORY_TOKENS = 8000
+MAX_HISTORY_TOKENS = int(os.getenv("MAX_HISTORY_TOKENS", "8000"))
+
+# 階段完成評估的執行方式：
+# - inline：串流結束後同步評估，再送出 isComplete（原行為）
+# - speculative：生成開始時只以使用者訊息並行評估，串流結束時通常已完成
+# - background：不在串流中評估，由呼叫端於 isComplete 之後呼叫 evaluate_stage_completion
+#   （前端須等待 specUpdatePending 後的 spec_update 事件才關閉連線，前端更新上線後再啟用）
+SPEC_EXTRACTION_MODES = ("inline", "speculative", "background")
+SPEC_EXTRACTION_MODE = os.getenv("SPEC_EXTRACTION_MODE", "inline").lower()
 
 class GeminiLLMService:
-    def __init__(self):
+    def __init__(self, backend: Optional[LLMBackend] = None):
         """
-        Initialize the Gemini LLM service exclusively with the Vertex AI backend.
+        Initialize the Gemini LLM service. The model backend is selected by LLM_BACKEND
+        (Vertex AI by default, or the offline local stand-in) unless one is injected.
         """
         self.spec_tracker = SpecTracker()
-        self.enabled = False
-        self.model = None
         self.model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-001")
-        project_id = os.getenv("PROJECT_ID")
-        location = os.getenv("VERTEX_LOCATION", "asia-east1")
+        self.prompts = prompt_library
+        self.context_cache: Optional[PromptContextCache] = None
+        self.spec_extraction_mode = SPEC_EXTRACTION_MODE
+        if self.spec_extraction_mode not in SPEC_EXTRACTION_MODES:
+            logger.warning(f"Unknown SPEC_EXTRACTION_MODE '{self.spec_extraction_mode}', using 'inline'.")
+            self.spec_extraction_mode = "inline"
+
+        if backend is None:
+            backend = build_llm_backend(
+                model_name=self.model_name,
+                project_id=os.getenv("PROJECT_ID"),
+                location=os.getenv("VERTEX_LOCATION", "asia-east1"),
+            )
+        self.backend = backend
+        self.enabled = backend is not None
+        if backend is not None:
+            self.context_cache = build_prompt_context_cache(client=getattr(backend, "client", None))
 
-        if not project_id:
-            logger.error("✗ PROJECT_ID environment variable is not set.")
-            return
+    def _count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    async def _summarize_messages(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        """將被擠出預算的舊訊息併入滾動摘要；模型不可用或失敗時改用擷取式摘要"""
+        if not self.enabled:
+            return await extractive_summary(previous_summary, messages)
+
+        history_text = "\n".join(f"{msg.get('sender')}: {msg.get('content', '')}" for msg in messages)
+        prompt = f"""
+你正在維護一段室內裝修諮詢對話的「滾動摘要」，供後續對話參考。
+請將【新增對話】的重點併入【既有摘要】，輸出更新後的完整摘要。
+- 使用台灣繁體中文、條列式
+- 保留屋況、施工範圍、材質風格、隱藏風險、預算與使用者明確表達的偏好或顧慮
+- 省略寒暄與重複內容，不要加入對話中沒有的資訊
 
+【既有摘要】
+{previous_summary or "（無）"}
+
+【新增對話】
+{history_text}
+
+【更新後摘要】
+"""
         try:
-            genai.configure(project=project_id, location=location)
-            self.model = genai.GenerativeModel(self.model_name)
-            self.enabled = True
-            logger.info(
-                f"✓ Gemini client configured with Vertex AI backend (project={project_id}, location={location}, model={self.model_name})."
-            )
+            summary = (await self.backend.generate_text(prompt)).strip()
+            if summary:
+                return summary
         except Exception as e:
-            logger.error(f"✗ Failed to initialize Google Gen AI SDK with Vertex AI: {e}")
+            logger.warning(f"History summarization failed, using extractive summary: {e}")
+        return await extractive_summary(previous_summary, messages)
 
-    def _count_tokens(self, text: str) -> int:
-        # A simple approximation
-        return len(text) // 4
+    async def _get_summarized_history(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        max_tokens: int,
+        summary_state: Optional[Dict[str, Any]] = None
+    ) -> CompactionResult:
+        """
+        依 token 預算壓縮歷史：保留最新訊息原文，較舊訊息增量併入滾動摘要。
+        summary_state 為上一回合持久化的摘要狀態（conversation 的 history_summary）。
+        """
+        compactor = HistoryCompactor(max_tokens)
+        return await compactor.compact(conversation_history, summary_state, self._summarize_messages)
 
-    async def _get_summarized_history(self, conversation_history: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
-        # This is a placeholder. A real implementation would summarize older messages.
-        return conversation_history
+    async def refresh_history_summary(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        summary_state: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        回覆串流結束後由呼叫端（背景）執行：將超出預算的舊訊息併入滾動摘要。
+        conversation_history 應包含本回合的使用者訊息與回覆；摘要有變更時回傳新狀態，否則回傳 None。
+        """
+        compaction = await self._get_summarized_history(conversation_history, MAX_HISTORY_TOKENS, summary_state)
+        return compaction.summary_state if compaction.summary_changed else None
 
     def _build_gemini_contents(
         self,
-        system_prompt: str,
+        system_prompt: Optional[StagePrompt],
         history: List[Dict[str, Any]],
-        latest_user_message: str
+        latest_user_message: str,
+        history_summary: str = ""
     ) -> List[types.Content]:
         # Vertex AI SDK works best with alternating user/model roles.
-        # We'll prepend the system prompt to the first user message.
+        # We'll prepend the system prompt to the first user message, unless it is
+        # already supplied through cached context (system_prompt is None).
         contents: List[types.Content] = []
         is_first_user_message = True
 
+        if history_summary:
+            summary_text = f"【先前對話摘要】\n{history_summary}"
+            contents.append(types.Content(role="user", parts=[types.Part.from_text(text=summary_text)]))
+
         for msg in history:
             text = msg.get("content", "")
             if not text:
@@ -69,156 +143,33 @@ class GeminiLLMService:
             if role == "user":
                 is_first_user_message = False
 
-        user_message = latest_user_message
-        if is_first_user_message:
-            user_message = f"{system_prompt}\n\n---\n\nUSER_MESSAGE:\n{latest_user_message}"
+        if system_prompt is not None and is_first_user_message:
+            # Reuse the precomputed parts instead of re-concatenating the prompt text
+            user_part = types.Part.from_text(text=f"\n---\n\nUSER_MESSAGE:\n{latest_user_message}")
+            parts = [*system_prompt.parts, user_part]
+        else:
+            parts = [types.Part.from_text(text=latest_user_message)]
 
-        contents.append(types.Content(role="user", parts=[types.Part.from_text(text=user_message)]))
+        contents.append(types.Content(role="user", parts=parts))
         return contents
 
-    def _build_dynamic_system_prompt(self, extracted_specs: Dict[str, Any]) -> str:
-        """
-        Builds the entire, state-aware system prompt based on the user's detailed instructions.
-        """
+    def _stage_prompt(self, extracted_specs: Dict[str, Any]) -> StagePrompt:
+        """依下一個尚未完成的階段挑選預先建立的系統提示"""
         tracker_view = self.spec_tracker.evaluate(extracted_specs or {})
         missing_fields = tracker_view.get("missing_fields", [])
-        
-        # --- BASE PROMPT (Persona, Guidelines, Rules) ---
-        base_prompt = """
-你是一位「住宅室內裝修顧問＋報價風險審核專家」，服務對象是一般屋主（消費者）。
-你的任務是：讀取使用者提供的報價單與補充資訊，透過對話一步一步釐清工程內容，最後產出一份結構完整、風險透明、方便比價的「新報價草稿」。
-
--------------------------
-一、語言與互動風格
--------------------------
-1. 全程使用「台灣繁體中文」，用清楚但不過度專業的說法，必要時再解釋專有名詞。
-2. 每一輪對話，一次提出 1 個關鍵問題，讓使用者好回覆，不要一次丟一大堆。
-3. 你要像現場丈量的設計師／統包主管一樣，邏輯清楚、誠實說明風險，不推銷特定產品。
-4. 若資訊不足，不要硬估價，要明確說「需要先確認 XXX 才能給估算」，並用問題引導。
-
--------------------------
-二、你內建的裝修 Guideline
--------------------------
-【1. 施工順序視角】
-你看工程時，腦中要有這個順序，檢查每一步有沒有在報價中被照顧到：
-1. 拆除與保護工程
-2. 水電與機電工程（電源、照明、插座、可能的排水）
-3. 泥作／修補工程（防水、批土、找平）
-4. 木作工程（隔間、天花、櫃體、床架等）
-5. 油漆工程（底漆、面漆、特殊塗料）
-6. 地坪工程（找平、防潮層、木地板／磁磚等）
-7. 玻璃與門窗工程（如有）
-8. 收尾與清潔（踢腳板、收邊、五金調整、清潔）
-9. 工程管理與保固
-
-【2. 法律／規範視角（僅用來提醒，不做法律解釋）】
-根據《建築物室內裝修管理辦法》，以下四種行為在多數情況下需要申請室內裝修審查：
-1. 固著於建築物構造體之天花板裝修
-2. 固著於構造體之內部牆面裝修
-3. 高度超過地板面 1.2 公尺之「固定隔屏」或兼作櫥櫃之隔屏裝修
-4. 分間牆之變更
-你的工作是標示「疑似涉及室內裝修審查」的地方，並提醒使用者：「這部分建議與設計師或合格技師確認是否需報審」。
-
--------------------------
-三、錯誤避免與限制
--------------------------
-1. 你不能假裝自己是有執照的建築師、技師或法律專業，只能做「風險提醒與溝通建議」。
-2. 當使用者直接問「這樣報價算不算貴」，你可以用「市場大致區間」與「影響單價的因素」來回應，但要提醒他實價仍需以現場條件為準。
-3. 任何估價數字都要清楚標註「為估算區間，非實際報價」。
-"""
-
-        # --- DYNAMIC TASK INSTRUCTION ---
-        task_instruction = ""
-        if not missing_fields:
-            # All stages are complete, generate the final output
-            task_instruction = """
--------------------------
-四、當前任務：產出最終報告
--------------------------
-所有資訊已收集完畢。請根據對話歷史，執行以下兩項任務：
-
-任務一：產出「標準化的報價草稿」
-嚴格遵循以下格式要求，以 Markdown 表格方式呈現。
-- 報價項目要依「施工順序」排序。
-- 將「原報價有寫」與「你建議補上的工項」都放進表格，並在「風險提示」欄標示來源（例如：「原報價已含」或「建議補列，避免日後追加」）。
-- 欄位：工項編號, 分類, 子項目, 單位, 數量, 單價, 小計, 材料品牌／等級, 工法說明, 是否疑似需送審, 風險提示
-
-任務二：產出「建議對設計師／統包發問」的問題清單
-- 根據對話內容，生成一份條列式、好複製貼上的問題清單。
-- 至少涵蓋：舊漆處理、壁癌處理、地板找平、清潔收尾、保固與追加方式。
-
-完成以上兩項任務後，在訊息的最後，加上以下這句 CTA：
-「如果你希望進一步確認現場狀況，我們可以根據這份報價內容，提供一次免費到府說明與丈量服務。需要我幫你預約嗎？」
-"""
-        else:
-            next_stage = missing_fields[0] # Get the next stage to work on
-            stage_id = next_stage['id']
-            
-            stage_prompts = {
-                "stage_1_situation_purpose": """
--------------------------
-四、當前任務：【階段 1：釐清屋況與目的】
--------------------------
-你的目標是釐清是新成屋、舊屋翻修、還是局部修繕，以及是自住／出租。
-請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
-範例問題：
-- 「這份報價是針對整個房子，還是某幾個空間？」
-- 「這個空間是自住、出租，還是其他用途？」
-- 「你這次主要是想解決什麼問題？（例如：牆面舊、壁癌、想換地板…）」
-""",
-                "stage_2_scope_condition": """
--------------------------
-四、當前任務：【階段 2：釐清施工範圍與現況】
--------------------------
-你的目標是知道哪些空間會施工、牆面狀況、地板狀況、櫃體保留與否。
-請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
-範例問題：
-- 「這次施工會包含哪些空間？（例如：主臥、書房、小孩房…）」
-- 「牆面目前狀況大概是：完整舊漆？裂縫？壁癌？有貼壁紙？」
-- 「地板會保留還是拆掉重做？櫃體會保留嗎？需不要做保護？」
-""",
-                "stage_3_material_style": """
--------------------------
-四、當前任務：【階段 3：釐清材質與風格】
--------------------------
-你的目標是瞭解油漆／地板／燈具的方向，用來推薦工項與風險。
-請用消費者的角度提問，避免客戶不清楚。一次只問一題。
-範例問題：
-- 「牆面你比較在意的是：耐髒好清潔？還是設計感（例如特殊漆、跳色）？」
-- 「地板你有鎖定超耐磨木地板、SPC，還是還沒決定？」
-- 「有預計更換燈具或開關插座嗎？（例如換成隱藏式面板）」
-""",
-                "stage_4_hidden_risks": """
--------------------------
-四、當前任務：【階段 4：釐清隱藏工程與風險】
--------------------------
-你的目標是主動把「最常被忽略、施工後才加價」的地方問出來。
-請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
-範例問題：
-- 拆除後的找平與修補：「如果拆掉舊地板或磁磚，地面高低差太大，能接受另外按實際狀況報價，還是希望先估一個預算上限？」
-- 壁癌與滲水：「有沒有哪幾面牆之前就有壁癌或滲水的記錄？」
-- 清潔與收尾：「你期待完工時是『可以直接搬進來』，還是可以接受自己再整理一次？」
-""",
-                "stage_5_budget_decision": """
--------------------------
-四、當前任務：【階段 5：確認預算感與決策方式】
--------------------------
-你的目標是了解使用者的預算區間與重視的優先順序（價格、品質、風格）。
-請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
-範例問題：
-- 「你心裡有沒有一個大概的預算範圍？比如說 XX–XX 萬？」
-- 「在這次工程裡，價格、施工品質、設計感，三個排列順序會是？」
-"""
-            }
-            task_instruction = stage_prompts.get(stage_id, "請繼續與使用者對話，收集裝修相關資訊。")
+        return self.prompts.for_stage(missing_fields[0]["id"] if missing_fields else None)
 
-        return f"{base_prompt}\n{task_instruction}"
+    def _build_dynamic_system_prompt(self, extracted_specs: Dict[str, Any]) -> str:
+        """
+        Returns the entire, state-aware system prompt for the current stage.
+        """
+        return self._stage_prompt(extracted_specs).text
 
     async def _extract_specifications(self, conversation_history: list, current_specs: dict) -> Dict[str, Any]:
         """
         Evaluates if the current conversation stage is complete.
         """
-        if not self.enabled or not self.model:
+        if not self.enabled:
             return {}
 
         tracker_view = self.spec_tracker.evaluate(current_specs or {})
@@ -253,57 +204,152 @@ class GeminiLLMService:
         """
 
         try:
-            response = await self.model.generate_content_async(prompt)
-            
-            # Extract JSON from the response text
-            json_str_match = re.search(r'\{.*\}', response.text, re.DOTALL)
-            if not json_str_match:
-                logger.warning(f"Spec extraction: No JSON found in response for stage {stage_id}.")
-                return {}
-
-            result = json.loads(json_str_match.group(0))
+            result = await self.backend.generate_json(prompt, context={"task": "evaluate_stage", "stage_id": stage_id})
             if result.get("is_complete") is True:
                 logger.info(f"Stage '{stage_id}' has been completed.")
                 return {stage_id: True} # Return the flag to mark stage as complete
 
-        except (json.JSONDecodeError, google_exceptions.GoogleAPICallError, Exception) as e:
+        except (LLMBackendError, google_exceptions.GoogleAPICallError, Exception) as e:
             logger.error(f"Error during specification extraction for stage {stage_id}: {e}")
 
         return {}
 
+    async def analyze_quote_and_generate_initial_response(self, quote_content: str) -> Dict[str, Any]:
+        """
+        分析上傳的報價單並產生開場訊息。
+        quote_content 優先使用 quote_extraction 產生的精簡工項表，擷取失敗時才是報價單原文。
+        回傳 {"analysis": {...}, "initial_response": "..."}；失敗時回傳空 dict。
+        """
+        if not self.enabled:
+            return {}
+
+        prompt = f"""
+你是一位住宅室內裝修顧問＋報價風險審核專家。以下是屋主上傳的報價單內容：
+
+---
+{quote_content}
+---
+
+請輸出一個 JSON 物件，包含兩個欄位：
+- "analysis"：物件，包含 "summary"（報價單重點摘要）、"missing_items"（常見但未列出的工項清單）、
+  "risk_items"（可能追加費用或疑似需送審的工項清單）
+- "initial_response"：給屋主的第一則訊息（台灣繁體中文），先簡短說明你看到的重點，
+  再提出 1 個最關鍵的問題
+"""
+        try:
+            result = await self.backend.generate_json(prompt, context={"task": "analyze_quote"})
+        except Exception as e:
+            logger.error(f"Quote analysis failed: {e}")
+            return {}
+
+        if not isinstance(result.get("analysis"), dict):
+            logger.warning("Quote analysis response is missing the 'analysis' object.")
+            return {}
+        return {"analysis": result["analysis"], "initial_response": str(result.get("initial_response", ""))}
+
+    async def generate_budget_tradeoff_suggestions(
+        self,
+        extracted_specs: Dict[str, Any],
+        quote_analysis: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        依已蒐集的需求與報價單分析，提出在預算內的取捨建議（Task 2.2）。
+        回傳 {"suggestions": [...], "notes": "..."}；模型不可用時回傳空 dict。
+        模型呼叫失敗或回覆格式不符時拋出例外，由呼叫端記錄為該 agent 失敗。
+        """
+        if not self.enabled:
+            return {}
+
+        specs_text = json.dumps(extracted_specs or {}, ensure_ascii=False, default=str)
+        analysis_text = json.dumps(quote_analysis or {}, ensure_ascii=False, default=str)
+        prompt = f"""
+你是一位住宅室內裝修顧問＋報價風險審核專家。以下是與屋主對話整理出的需求，以及原始報價單的分析：
+
+【需求】
+{specs_text}
+
+【報價單分析】
+{analysis_text}
+
+請在屋主的預算範圍內提出取捨建議（例如哪些工項可改用較平價的材質、哪些可延後、哪些不建議省），
+並輸出一個 JSON 物件，包含兩個欄位：
+- "suggestions"：字串陣列，每項一則具體建議（台灣繁體中文）
+- "notes"：一段簡短說明，提醒屋主取捨時要注意的風險
+"""
+        result = await self.backend.generate_json(prompt, context={"task": "budget_tradeoffs"})
+        suggestions = result.get("suggestions")
+        if not isinstance(suggestions, list):
+            raise LLMBackendError("Budget trade-off response is missing the 'suggestions' list.")
+        return {"suggestions": [str(item) for item in suggestions], "notes": str(result.get("notes", ""))}
+
+    async def evaluate_stage_completion(
+        self,
+        conversation_history: list,
+        message: str,
+        response_text: str,
+        current_specs: dict
+    ) -> Dict[str, Any]:
+        """
+        background 模式使用：回合串流完成後再評估階段是否完成，
+        結果由呼叫端以獨立的 spec_update SSE 事件推送給前端。
+        """
+        updated_history = conversation_history + [
+            {"sender": "user", "content": message},
+            {"sender": "agent", "content": response_text}
+        ]
+        return await self._extract_specifications(updated_history, current_specs)
+
     async def generate_response_stream(
         self,
         message: str,
         conversation_history: list,
         context: dict
     ) -> AsyncGenerator[Tuple[str, Optional[Dict[str, Any]]], None]:
-        if not self.enabled or not self.model:
+        if not self.enabled:
             yield ("抱歉，AI 服務目前無法使用。", None)
             return
 
+        extraction_mode = self.spec_extraction_mode
+        speculative_extraction: Optional[asyncio.Task] = None
         try:
             extracted_specs = context.get("extracted_specs", {})
-            system_prompt = self._build_dynamic_system_prompt(extracted_specs)
-
-            # Summarization logic is placeholder, using full history for now
-            processed_history = await self._get_summarized_history(conversation_history, MAX_HISTORY_TOKENS)
-
-            contents = self._build_gemini_contents(system_prompt, processed_history, message)
+            if extraction_mode == "speculative":
+                # Evaluate on the user's message alone while the reply is being generated
+                speculative_extraction = asyncio.create_task(self._extract_specifications(
+                    conversation_history + [{"sender": "user", "content": message}], extracted_specs
+                ))
+
+            stage_prompt = self._stage_prompt(extracted_specs)
+            cached_content = None
+            if self.context_cache is not None:
+                cached_content = await self.context_cache.get(self.model_name, stage_prompt)
+
+            # Only the current summary is used here; folding older messages into it
+            # is left to refresh_history_summary once the reply has streamed
+            compaction = HistoryCompactor(MAX_HISTORY_TOKENS).fit(
+                conversation_history, context.get("history_summary")
+            )
 
-            response_stream = await self.model.generate_content_async(contents=contents, stream=True)
+            contents = self._build_gemini_contents(
+                None if cached_content else stage_prompt,
+                compaction.messages,
+                message,
+                compaction.summary_text
+            )
 
             full_response = ""
-            async for chunk in response_stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    full_response += chunk.text
-                    yield (chunk.text, None)
+            async for text in self.backend.stream_text(contents, cached_content=cached_content):
+                full_response += text
+                yield (text, None)
             
             # After streaming, evaluate if the stage is complete
-            updated_history = conversation_history + [
-                {"sender": "user", "content": message},
-                {"sender": "agent", "content": full_response}
-            ]
-            extracted = await self._extract_specifications(updated_history, extracted_specs)
+            extracted: Dict[str, Any] = {}
+            if speculative_extraction is not None:
+                extracted = await speculative_extraction
+            elif extraction_mode == "inline":
+                extracted = await self.evaluate_stage_completion(
+                    conversation_history, message, full_response, extracted_specs
+                )
 
             if extracted:
                 yield ("", extracted)
@@ -314,6 +360,9 @@ class GeminiLLMService:
         except Exception as e:
             logger.error(f"Generic Error in generate_response_stream: {e}", exc_info=True)
             yield ("抱歉，AI 服務發生未預期的錯誤。", None)
+        finally:
+            if speculative_extraction is not None and not speculative_extraction.done():
+                speculative_extraction.cancel()
 
 # Singleton instance
 gemini_service = GeminiLLMService()
@@ -0,0 +1,135 @@
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from src.services.cache import LRUTTLCache, MISSING
+
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", "512"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "3600"))
+# 超過此秒數未與 Firestore 同步時，讀取前先以 delta 查詢補上其他實例寫入的訊息
+HISTORY_CACHE_SYNC_INTERVAL = float(os.getenv("HISTORY_CACHE_SYNC_INTERVAL", "30"))
+# 完整載入時尚無任何 server timestamp（空對話），以載入開始時間減去此秒數作為 delta 查詢起點，
+# 容許本機與 Firestore 的時鐘誤差（起點過早只會多讀幾則，以 id 去重）
+HISTORY_CACHE_CLOCK_SKEW = float(os.getenv("HISTORY_CACHE_CLOCK_SKEW", "5"))
+
+_NO_TIMESTAMP = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _message_order(message: Dict[str, Any]):
+    return (message.get("timestamp") or _NO_TIMESTAMP, message["id"])
+
+
+@dataclass
+class HistoryEntry:
+    """單一對話的快取歷史（依 (timestamp, id) 排序）"""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    ids: Set[str] = field(default_factory=set)
+    # 只記錄從 Firestore 讀回的 server timestamp，本地 append 的時間不可作為 delta 查詢起點
+    last_synced_timestamp: Optional[datetime] = None
+    synced_at: float = 0.0
+    # 滾動摘要狀態（history_summary/current），與歷史一起載入與同步；MISSING 表示尚未讀取
+    summary_state: Any = MISSING
+
+
+class ConversationHistoryCache:
+    """
+    對話歷史的行程內快取（跨對話以 LRU 限制數量）。
+    - 首次讀取：完整載入後快取
+    - save_message / 回合提交：直接 append，不需重新讀取
+    - 超過同步間隔：只查詢比 last_synced_timestamp 更新的訊息並以 id 去重、依時間插入
+    - 滾動摘要狀態跟著歷史快取，每回合不需再讀取 history_summary 文件
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = HISTORY_CACHE_MAX_CONVERSATIONS,
+        ttl_seconds: float = HISTORY_CACHE_TTL,
+        sync_interval: float = HISTORY_CACHE_SYNC_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._entries = LRUTTLCache(max_conversations, ttl_seconds, clock=clock)
+        self.delta_syncs = 0
+
+    def get(self, conversation_id: str) -> Optional[HistoryEntry]:
+        entry = self._entries.get(conversation_id)
+        return None if entry is MISSING else entry
+
+    def needs_sync(self, entry: HistoryEntry) -> bool:
+        return self._clock() - entry.synced_at >= self.sync_interval
+
+    def store(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        loaded_at: Optional[datetime] = None,
+    ) -> HistoryEntry:
+        """
+        以完整讀取的結果建立快取。loaded_at 為讀取開始的時間；結果中沒有 server timestamp 時
+        以它作為 delta 查詢起點，之後的同步不會再退回完整讀取。
+        """
+        entry = HistoryEntry()
+        self._merge_server_messages(entry, messages)
+        if entry.last_synced_timestamp is None:
+            loaded_at = loaded_at or datetime.now(timezone.utc)
+            entry.last_synced_timestamp = loaded_at - timedelta(seconds=HISTORY_CACHE_CLOCK_SKEW)
+        self._entries.set(conversation_id, entry)
+        return entry
+
+    def merge(self, entry: HistoryEntry, messages: List[Dict[str, Any]]) -> None:
+        """合併 delta 查詢結果"""
+        self.delta_syncs += 1
+        self._merge_server_messages(entry, messages)
+
+    def append(self, conversation_id: str, message: Dict[str, Any]) -> None:
+        """本地寫入成功後附加訊息；未快取的對話略過，下次讀取時會完整載入"""
+        entry = self._entries.get(conversation_id)
+        if entry is MISSING or message["id"] in entry.ids:
+            return
+        entry.messages.append(message)
+        entry.ids.add(message["id"])
+
+    def get_summary(self, conversation_id: str) -> Any:
+        """回傳快取的摘要狀態（可能為 None）；未快取時回傳 MISSING"""
+        entry = self.get(conversation_id)
+        return MISSING if entry is None else entry.summary_state
+
+    def set_summary(self, conversation_id: str, summary_state: Optional[Dict[str, Any]]) -> None:
+        """寫入或讀取摘要後更新快取；未快取的對話略過"""
+        entry = self.get(conversation_id)
+        if entry is not None:
+            entry.summary_state = summary_state
+
+    def invalidate(self, conversation_id: str) -> None:
+        self._entries.invalidate(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._entries.stats()
+        stats["delta_syncs"] = self.delta_syncs
+        return stats
+
+    def _merge_server_messages(self, entry: HistoryEntry, messages: List[Dict[str, Any]]) -> None:
+        positions = {message["id"]: index for index, message in enumerate(entry.messages)}
+        changed = False
+        for message in messages:
+            index = positions.get(message["id"])
+            if index is not None:
+                # 以 server 版本取代本地 append 的版本（取得真正的 server timestamp）
+                changed = changed or entry.messages[index].get("timestamp") != message.get("timestamp")
+                entry.messages[index] = message
+            else:
+                entry.messages.append(message)
+                entry.ids.add(message["id"])
+                changed = True
+            timestamp = message.get("timestamp")
+            if timestamp is not None and (
+                entry.last_synced_timestamp is None or timestamp > entry.last_synced_timestamp
+            ):
+                entry.last_synced_timestamp = timestamp
+        if changed:
+            # 其他實例寫入的訊息可能早於本地 append 的訊息，依 server 時間插入而非附加在最後
+            entry.messages.sort(key=_message_order)
+        entry.synced_at = self._clock()
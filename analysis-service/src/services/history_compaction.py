@@ -0,0 +1,182 @@
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 每則訊息的角色/格式開銷（估計值）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 滾動摘要最多可使用的歷史預算比例
+SUMMARY_BUDGET_RATIO = 0.25
+
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+def is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK Unified Ideographs
+        or 0x3400 <= code <= 0x4DBF   # CJK Extension A
+        or 0x20000 <= code <= 0x2FA1F  # CJK Extensions B+ / Compatibility Supplement
+        or 0xF900 <= code <= 0xFAFF   # CJK Compatibility Ideographs
+        or 0x3000 <= code <= 0x30FF   # CJK punctuation, Hiragana, Katakana
+        or 0x3100 <= code <= 0x312F   # Bopomofo（注音）
+        or 0xAC00 <= code <= 0xD7AF   # Hangul
+        or 0xFF00 <= code <= 0xFFEF   # Fullwidth forms（全形標點）
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    CJK 感知的 token 估算。
+    Gemini 對繁體中文大約每個字 1 個 token，英數字約每 4 個字元 1 個 token；
+    原本的 len(text)//4 會把中文低估約四倍。
+    """
+    if not text:
+        return 0
+    cjk = 0
+    other = 0
+    for char in text:
+        if is_cjk(char):
+            cjk += 1
+        else:
+            other += 1
+    return cjk + math.ceil(other / 4)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """從開頭保留文字直到 token 預算用完"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+async def extractive_summary(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """不需呼叫模型的備援摘要：保留每則訊息的開頭"""
+    lines = [previous_summary] if previous_summary else []
+    for message in messages:
+        content = (message.get("content") or "").replace("\n", " ").strip()
+        if content:
+            lines.append(f"{message.get('sender')}: {content[:80]}")
+    return "\n".join(lines)
+
+
+@dataclass
+class CompactionResult:
+    """壓縮後送給模型的歷史與更新後的滾動摘要狀態"""
+    messages: List[Dict[str, Any]]
+    summary_state: Dict[str, Any] = field(default_factory=dict)
+    summary_changed: bool = False
+    total_tokens: int = 0
+
+    @property
+    def summary_text(self) -> str:
+        return self.summary_state.get("text", "")
+
+
+class HistoryCompactor:
+    """
+    以 token 預算壓縮對話歷史。
+    - 最新的訊息原文保留，直到用完（總預算 - 摘要預算）
+    - 更早、尚未納入摘要的訊息以 summarizer 增量併入滾動摘要
+    - 摘要狀態記錄已涵蓋到哪一則訊息（covered_through_id），下次只處理新被擠出的訊息
+    - 摘要 + 保留訊息保證不超過 max_tokens
+    fit() 不呼叫模型，只以現有摘要裁切歷史，供回覆前使用；
+    compact() 會更新摘要，可在回覆串流結束後再執行。
+    """
+
+    def __init__(self, max_tokens: int, summary_ratio: float = SUMMARY_BUDGET_RATIO):
+        self.max_tokens = max_tokens
+        self.summary_budget = int(max_tokens * summary_ratio)
+
+    def fit(
+        self,
+        history: List[Dict[str, Any]],
+        summary_state: Optional[Dict[str, Any]],
+    ) -> CompactionResult:
+        """以現有摘要 + 放得下的最新訊息組成本回合的歷史；放不下的舊訊息留給下次 compact() 併入摘要"""
+        summary_state = dict(summary_state or {})
+        uncovered = history[self._covered_count(history, summary_state):]
+        summary_text = truncate_to_tokens(summary_state.get("text", ""), self.summary_budget)
+        kept, _ = self._split_recent(uncovered, self.max_tokens - estimate_tokens(summary_text))
+        if "text" in summary_state:
+            summary_state["text"] = summary_text
+        total = estimate_tokens(summary_text) + sum(message_tokens(message) for message in kept)
+        return CompactionResult(messages=kept, summary_state=summary_state, total_tokens=total)
+
+    async def compact(
+        self,
+        history: List[Dict[str, Any]],
+        summary_state: Optional[Dict[str, Any]],
+        summarize: Summarizer,
+    ) -> CompactionResult:
+        summary_state = dict(summary_state or {})
+        covered = self._covered_count(history, summary_state)
+        uncovered = history[covered:]
+        summary_text = truncate_to_tokens(summary_state.get("text", ""), self.summary_budget)
+        changed = summary_text != summary_state.get("text", "")
+
+        uncovered_tokens = sum(message_tokens(message) for message in uncovered)
+        if estimate_tokens(summary_text) + uncovered_tokens <= self.max_tokens:
+            kept = list(uncovered)
+        else:
+            # 保留區只能使用「總預算 - 摘要預算」，其餘較舊的訊息併入摘要
+            kept, evicted = self._split_recent(uncovered, self.max_tokens - self.summary_budget)
+            summary_text = truncate_to_tokens(await summarize(summary_text, evicted), self.summary_budget)
+            summary_state = {
+                "covered_through_id": evicted[-1].get("id"),
+                "covered_count": covered + len(evicted),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            changed = True
+
+        if summary_text or summary_state.get("covered_through_id"):
+            summary_state["text"] = summary_text
+            summary_state["token_estimate"] = estimate_tokens(summary_text)
+        else:
+            summary_state = {}
+
+        total = estimate_tokens(summary_text) + sum(message_tokens(message) for message in kept)
+        return CompactionResult(
+            messages=kept,
+            summary_state=summary_state,
+            summary_changed=changed,
+            total_tokens=total,
+        )
+
+    @staticmethod
+    def _split_recent(messages: List[Dict[str, Any]], budget: int):
+        """從最新往回保留原文直到用完預算，回傳 (保留, 擠出)"""
+        kept: List[Dict[str, Any]] = []
+        used = 0
+        for message in reversed(messages):
+            cost = message_tokens(message)
+            if used + cost > budget:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        return kept, messages[: len(messages) - len(kept)]
+
+    @staticmethod
+    def _covered_count(history: List[Dict[str, Any]], summary_state: Dict[str, Any]) -> int:
+        covered_id = summary_state.get("covered_through_id")
+        if not covered_id:
+            return 0
+        for index, message in enumerate(history):
+            if message.get("id") == covered_id:
+                return index + 1
+        # 找不到 id（例如歷史被截斷）時以記錄的數量為準
+        return min(int(summary_state.get("covered_count", 0)), len(history))
@@ -0,0 +1,66 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Progress of this many recent jobs is kept for (re)connecting SSE clients
+JOB_PROGRESS_MAX_JOBS = int(os.getenv("JOB_PROGRESS_MAX_JOBS", "256"))
+
+
+class _ProgressEntry:
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.finished = False
+        self.changed = asyncio.Event()
+
+
+class JobProgressLog:
+    """
+    In-process, append-only progress events per job.
+    Subscribers replay everything published so far and then follow new
+    events, so a client that connects late (or reconnects) misses nothing.
+    """
+
+    def __init__(self, max_jobs: int = JOB_PROGRESS_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._entries: "OrderedDict[str, _ProgressEntry]" = OrderedDict()
+
+    def _entry(self, job_id: str) -> _ProgressEntry:
+        entry = self._entries.get(job_id)
+        if entry is None:
+            entry = self._entries[job_id] = _ProgressEntry()
+            while len(self._entries) > self.max_jobs:
+                self._entries.popitem(last=False)
+        return entry
+
+    def has(self, job_id: str) -> bool:
+        return job_id in self._entries
+
+    def publish(self, job_id: str, event: Dict[str, Any], final: bool = False) -> None:
+        entry = self._entry(job_id)
+        entry.events.append(event)
+        entry.finished = entry.finished or final
+        # Wake every waiting subscriber, then arm a fresh event for the next publish
+        entry.changed.set()
+        entry.changed = asyncio.Event()
+
+    async def subscribe(self, job_id: str, keepalive: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yields progress events until the final one. Yields None after `keepalive`
+        seconds without events so the caller can keep the connection alive.
+        """
+        entry = self._entry(job_id)
+        index = 0
+        while True:
+            while index < len(entry.events):
+                index += 1
+                yield entry.events[index - 1]
+            if entry.finished:
+                return
+            try:
+                await asyncio.wait_for(entry.changed.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+
+job_progress = JobProgressLog()
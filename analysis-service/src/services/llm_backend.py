@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Protocol, Union, runtime_checkable
+
+from google.genai import types
+
+from src.services.history_compaction import estimate_tokens, is_cjk
+from src.services.llm_service import mock_llm_service
+
+logger = logging.getLogger(__name__)
+
+# vertex：Vertex AI 上的 Gemini；local：離線模擬（可設定延遲與失敗），供負載測試使用
+LLM_BACKEND = os.getenv("LLM_BACKEND", "vertex").lower()
+
+LOCAL_LLM_FIRST_TOKEN_DELAY = float(os.getenv("LOCAL_LLM_FIRST_TOKEN_DELAY", "0.4"))
+LOCAL_LLM_TOKENS_PER_SECOND = float(os.getenv("LOCAL_LLM_TOKENS_PER_SECOND", "40"))
+LOCAL_LLM_CHUNK_TOKENS = int(os.getenv("LOCAL_LLM_CHUNK_TOKENS", "8"))
+LOCAL_LLM_FAILURE_RATE = float(os.getenv("LOCAL_LLM_FAILURE_RATE", "0"))
+
+Contents = Union[str, List[types.Content]]
+
+
+class LLMBackendError(Exception):
+    """模型後端呼叫失敗（包含 local 後端注入的失敗）"""
+
+
+@runtime_checkable
+class LLMBackend(Protocol):
+    """GeminiLLMService 與各 agent 共用的非同步模型介面"""
+
+    name: str
+
+    def stream_text(self, contents: Contents, *, cached_content: Optional[str] = None) -> AsyncIterator[str]:
+        """逐段產生回覆文字"""
+        ...
+
+    async def generate_text(self, contents: Contents, context: Optional[Dict[str, Any]] = None) -> str:
+        """context 為呼叫端的結構化資訊（project_id、user_message 等），後端可用於路由或記錄"""
+        ...
+
+    async def generate_json(self, prompt: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """產生結構化結果；無法解析為 JSON 物件時拋出 LLMBackendError"""
+        ...
+
+    async def count_tokens(self, contents: Contents) -> int:
+        ...
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        raise LLMBackendError("No JSON object found in model response")
+    try:
+        result = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise LLMBackendError(f"Invalid JSON in model response: {e}") from e
+    if not isinstance(result, dict):
+        raise LLMBackendError("Model response JSON is not an object")
+    return result
+
+
+def contents_text(contents: Contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(
+        part.text for content in contents for part in (content.parts or []) if getattr(part, "text", None)
+    )
+
+
+class VertexGeminiBackend:
+    """以 google-genai Client（Vertex AI）呼叫 Gemini"""
+
+    name = "vertex"
+
+    def __init__(self, model_name: str, project_id: str, location: str) -> None:
+        from google import genai
+
+        self.model_name = model_name
+        self.client = genai.Client(vertexai=True, project=project_id, location=location)
+
+    async def stream_text(self, contents: Contents, *, cached_content: Optional[str] = None) -> AsyncIterator[str]:
+        config = types.GenerateContentConfig(cached_content=cached_content) if cached_content else None
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model_name, contents=contents, config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    async def generate_text(self, contents: Contents, context: Optional[Dict[str, Any]] = None) -> str:
+        response = await self.client.aio.models.generate_content(model=self.model_name, contents=contents)
+        return response.text or ""
+
+    async def generate_json(self, prompt: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+        )
+        return parse_json_object(response.text or "")
+
+    async def count_tokens(self, contents: Contents) -> int:
+        try:
+            response = await self.client.aio.models.count_tokens(model=self.model_name, contents=contents)
+            return response.total_tokens
+        except Exception as e:
+            logger.warning(f"count_tokens failed, using local estimate: {e}")
+            return estimate_tokens(contents_text(contents))
+
+
+class LocalLLMBackend:
+    """
+    離線模擬後端：回覆內容沿用 MockLLMService 的關鍵字範本，
+    並依 first_token_delay / tokens_per_second 模擬串流時序，以 failure_rate 注入失敗。
+    tokens_per_second <= 0 代表不限速（立即回覆）。
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        *,
+        first_token_delay: float = LOCAL_LLM_FIRST_TOKEN_DELAY,
+        tokens_per_second: float = LOCAL_LLM_TOKENS_PER_SECOND,
+        chunk_tokens: int = LOCAL_LLM_CHUNK_TOKENS,
+        failure_rate: float = LOCAL_LLM_FAILURE_RATE,
+        fail_after_tokens: Optional[int] = None,
+        responder: Optional[Callable[[str, Dict[str, Any]], Any]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.first_token_delay = max(0.0, first_token_delay)
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.failure_rate = failure_rate
+        self.fail_after_tokens = fail_after_tokens
+        self.responder = responder
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    @classmethod
+    def instant(cls, **kwargs) -> "LocalLLMBackend":
+        return cls(first_token_delay=0, tokens_per_second=0, failure_rate=0, **kwargs)
+
+    async def stream_text(self, contents: Contents, *, cached_content: Optional[str] = None) -> AsyncIterator[str]:
+        reply = await self._reply(contents_text(contents), {})
+        text = reply if isinstance(reply, str) else json.dumps(reply, ensure_ascii=False)
+        tokens = _split_tokens(text)
+        for start in range(0, len(tokens), self.chunk_tokens):
+            if self.fail_after_tokens is not None and start >= self.fail_after_tokens:
+                raise LLMBackendError(f"Injected failure after {start} tokens")
+            chunk = tokens[start:start + self.chunk_tokens]
+            await self._sleep_for(len(chunk))
+            yield "".join(chunk)
+
+    async def generate_text(self, contents: Contents, context: Optional[Dict[str, Any]] = None) -> str:
+        reply = await self._reply(contents_text(contents), context or {})
+        text = reply if isinstance(reply, str) else json.dumps(reply, ensure_ascii=False)
+        await self._sleep_for(len(_split_tokens(text)))
+        return text
+
+    async def generate_json(self, prompt: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        reply = await self._reply(prompt, context or {})
+        if isinstance(reply, dict):
+            await self._sleep_for(estimate_tokens(json.dumps(reply, ensure_ascii=False)))
+            return reply
+        await self._sleep_for(len(_split_tokens(reply)))
+        return parse_json_object(reply)
+
+    async def count_tokens(self, contents: Contents) -> int:
+        return estimate_tokens(contents_text(contents))
+
+    async def _reply(self, prompt: str, context: Dict[str, Any]) -> Any:
+        self.calls += 1
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise LLMBackendError("Injected failure before first token")
+        if self.responder is not None:
+            return self.responder(prompt, context)
+        return await mock_llm_service.generate_response(prompt=prompt, context=context)
+
+    async def _sleep_for(self, token_count: int) -> None:
+        if self.tokens_per_second > 0 and token_count:
+            await asyncio.sleep(token_count / self.tokens_per_second)
+
+
+def _split_tokens(text: str) -> List[str]:
+    """粗略切成 token：CJK 每字一個，其他字元每 4 個一個（與 estimate_tokens 一致）"""
+    tokens: List[str] = []
+    buffer = ""
+    for char in text:
+        if is_cjk(char):
+            if buffer:
+                tokens.append(buffer)
+                buffer = ""
+            tokens.append(char)
+        else:
+            buffer += char
+            if len(buffer) == 4:
+                tokens.append(buffer)
+                buffer = ""
+    if buffer:
+        tokens.append(buffer)
+    return tokens
+
+
+def build_llm_backend(
+    backend: str = LLM_BACKEND,
+    *,
+    model_name: str,
+    project_id: Optional[str] = None,
+    location: Optional[str] = None,
+) -> Optional[LLMBackend]:
+    """依設定建立模型後端；vertex 缺少 PROJECT_ID 或初始化失敗時回傳 None"""
+    if backend == "local":
+        logger.info("✓ Using local LLM backend (offline stand-in).")
+        return LocalLLMBackend()
+    if backend != "vertex":
+        logger.warning(f"Unknown LLM_BACKEND '{backend}', using 'vertex'.")
+    if not project_id:
+        logger.error("✗ PROJECT_ID environment variable is not set.")
+        return None
+    try:
+        vertex = VertexGeminiBackend(model_name, project_id, location)
+        logger.info(
+            f"✓ Gemini client configured with Vertex AI backend (project={project_id}, location={location}, model={model_name})."
+        )
+        return vertex
+    except Exception as e:
+        logger.error(f"✗ Failed to initialize Google Gen AI SDK with Vertex AI: {e}")
+        return None
+
+
+def default_agent_backend() -> LLMBackend:
+    """
+    Agent 目前使用範本回覆；LLM_BACKEND=local 時改用有延遲設定的模擬後端，
+    讓 ContractorAgent / ClientManagerAgent 也能以實際時序做離線負載測試。
+    """
+    return LocalLLMBackend() if LLM_BACKEND == "local" else LocalLLMBackend.instant()
@@ -3,7 +3,10 @@ import openpyxl
 from fastapi import UploadFile
 import io
 import logging
-from typing import List, Dict, Any
+from typing import Any, Dict
+
+from src.services.excel_rows import iter_capped_rows
+from src.services.quote_extraction import extract_from_rows, extract_from_text
 
 logger = logging.getLogger(__name__)
 
@@ -48,25 +51,30 @@ class ParsingService:
         
         full_text = "\n".join(text_content)
         logger.info(f"Successfully extracted {len(full_text)} characters from PDF.")
-        # For now, we return the raw text. Later tasks will structure this.
-        return {"raw_text": full_text}
+        quote = extract_from_text(full_text)
+        return {"raw_text": full_text, "quote": quote.model_dump() if quote else None}
 
     def _parse_excel(self, file_stream: io.BytesIO) -> Dict[str, Any]:
         """
         Parses an Excel file and extracts data from the active sheet.
+        The workbook is streamed in read-only mode and capped per sheet.
         """
-        workbook = openpyxl.load_workbook(file_stream)
-        sheet = workbook.active
-        
-        data = []
-        for row in sheet.iter_rows(values_only=True):
-            # Filter out empty rows
-            if any(cell is not None for cell in row):
-                data.append(list(row))
-        
-        logger.info(f"Successfully extracted {len(data)} rows from Excel file.")
-        # For now, we return the raw data. Later tasks will structure this.
-        return {"rows": data}
+        workbook = openpyxl.load_workbook(file_stream, read_only=True, data_only=True)
+        try:
+            data = []
+            truncated = False
+            # 與 background-processor 共用同一份上限與逐列讀取邏輯，只是略過空白列
+            for row in iter_capped_rows(workbook.active, skip_empty=True):
+                if row is None:
+                    truncated = True
+                    break
+                data.append(row)
+        finally:
+            workbook.close()
+
+        logger.info(f"Successfully extracted {len(data)} rows from Excel file (truncated={truncated}).")
+        quote = extract_from_rows(data)
+        return {"rows": data, "truncated": truncated, "quote": quote.model_dump() if quote else None}
 
 # Singleton instance
 parsing_service = ParsingService()
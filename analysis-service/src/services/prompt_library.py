@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from google.genai import types
+
+from src.services.cache import LRUTTLCache, MISSING
+from src.services.history_compaction import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 系統提示的快取方式：none（每回合隨訊息送出）、local（行程內假實作，測試用）、vertex（Vertex AI cached content）
+PROMPT_CONTEXT_CACHE = os.getenv("PROMPT_CONTEXT_CACHE", "none").lower()
+PROMPT_CONTEXT_CACHE_TTL = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL", "3600"))
+# 註冊失敗（例如低於模型最小快取 token 數）後，隔多久再重試
+PROMPT_CONTEXT_CACHE_RETRY = float(os.getenv("PROMPT_CONTEXT_CACHE_RETRY", "300"))
+
+FINAL_REPORT_STAGE = "final_report"
+
+# --- BASE PROMPT (Persona, Guidelines, Rules) ---
+BASE_PROMPT = """
+你是一位「住宅室內裝修顧問＋報價風險審核專家」，服務對象是一般屋主（消費者）。
+你的任務是：讀取使用者提供的報價單與補充資訊，透過對話一步一步釐清工程內容，最後產出一份結構完整、風險透明、方便比價的「新報價草稿」。
+
+-------------------------
+一、語言與互動風格
+-------------------------
+1. 全程使用「台灣繁體中文」，用清楚但不過度專業的說法，必要時再解釋專有名詞。
+2. 每一輪對話，一次提出 1 個關鍵問題，讓使用者好回覆，不要一次丟一大堆。
+3. 你要像現場丈量的設計師／統包主管一樣，邏輯清楚、誠實說明風險，不推銷特定產品。
+4. 若資訊不足，不要硬估價，要明確說「需要先確認 XXX 才能給估算」，並用問題引導。
+
+-------------------------
+二、你內建的裝修 Guideline
+-------------------------
+【1. 施工順序視角】
+你看工程時，腦中要有這個順序，檢查每一步有沒有在報價中被照顧到：
+1. 拆除與保護工程
+2. 水電與機電工程（電源、照明、插座、可能的排水）
+3. 泥作／修補工程（防水、批土、找平）
+4. 木作工程（隔間、天花、櫃體、床架等）
+5. 油漆工程（底漆、面漆、特殊塗料）
+6. 地坪工程（找平、防潮層、木地板／磁磚等）
+7. 玻璃與門窗工程（如有）
+8. 收尾與清潔（踢腳板、收邊、五金調整、清潔）
+9. 工程管理與保固
+
+【2. 法律／規範視角（僅用來提醒，不做法律解釋）】
+根據《建築物室內裝修管理辦法》，以下四種行為在多數情況下需要申請室內裝修審查：
+1. 固著於建築物構造體之天花板裝修
+2. 固著於構造體之內部牆面裝修
+3. 高度超過地板面 1.2 公尺之「固定隔屏」或兼作櫥櫃之隔屏裝修
+4. 分間牆之變更
+你的工作是標示「疑似涉及室內裝修審查」的地方，並提醒使用者：「這部分建議與設計師或合格技師確認是否需報審」。
+
+-------------------------
+三、錯誤避免與限制
+-------------------------
+1. 你不能假裝自己是有執照的建築師、技師或法律專業，只能做「風險提醒與溝通建議」。
+2. 當使用者直接問「這樣報價算不算貴」，你可以用「市場大致區間」與「影響單價的因素」來回應，但要提醒他實價仍需以現場條件為準。
+3. 任何估價數字都要清楚標註「為估算區間，非實際報價」。
+"""
+
+# --- 所有階段完成後：產出最終報告 ---
+FINAL_REPORT_INSTRUCTION = """
+-------------------------
+四、當前任務：產出最終報告
+-------------------------
+所有資訊已收集完畢。請根據對話歷史，執行以下兩項任務：
+
+任務一：產出「標準化的報價草稿」
+嚴格遵循以下格式要求，以 Markdown 表格方式呈現。
+- 報價項目要依「施工順序」排序。
+- 將「原報價有寫」與「你建議補上的工項」都放進表格，並在「風險提示」欄標示來源（例如：「原報價已含」或「建議補列，避免日後追加」）。
+- 欄位：工項編號, 分類, 子項目, 單位, 數量, 單價, 小計, 材料品牌／等級, 工法說明, 是否疑似需送審, 風險提示
+
+任務二：產出「建議對設計師／統包發問」的問題清單
+- 根據對話內容，生成一份條列式、好複製貼上的問題清單。
+- 至少涵蓋：舊漆處理、壁癌處理、地板找平、清潔收尾、保固與追加方式。
+
+完成以上兩項任務後，在訊息的最後，加上以下這句 CTA：
+「如果你希望進一步確認現場狀況，我們可以根據這份報價內容，提供一次免費到府說明與丈量服務。需要我幫你預約嗎？」
+"""
+
+# --- 各階段的任務指示 ---
+STAGE_INSTRUCTIONS: Dict[str, str] = {
+    "stage_1_situation_purpose": """
+-------------------------
+四、當前任務：【階段 1：釐清屋況與目的】
+-------------------------
+你的目標是釐清是新成屋、舊屋翻修、還是局部修繕，以及是自住／出租。
+請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
+範例問題：
+- 「這份報價是針對整個房子，還是某幾個空間？」
+- 「這個空間是自住、出租，還是其他用途？」
+- 「你這次主要是想解決什麼問題？（例如：牆面舊、壁癌、想換地板…）」
+""",
+    "stage_2_scope_condition": """
+-------------------------
+四、當前任務：【階段 2：釐清施工範圍與現況】
+-------------------------
+你的目標是知道哪些空間會施工、牆面狀況、地板狀況、櫃體保留與否。
+請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
+範例問題：
+- 「這次施工會包含哪些空間？（例如：主臥、書房、小孩房…）」
+- 「牆面目前狀況大概是：完整舊漆？裂縫？壁癌？有貼壁紙？」
+- 「地板會保留還是拆掉重做？櫃體會保留嗎？需不要做保護？」
+""",
+    "stage_3_material_style": """
+-------------------------
+四、當前任務：【階段 3：釐清材質與風格】
+-------------------------
+你的目標是瞭解油漆／地板／燈具的方向，用來推薦工項與風險。
+請用消費者的角度提問，避免客戶不清楚。一次只問一題。
+範例問題：
+- 「牆面你比較在意的是：耐髒好清潔？還是設計感（例如特殊漆、跳色）？」
+- 「地板你有鎖定超耐磨木地板、SPC，還是還沒決定？」
+- 「有預計更換燈具或開關插座嗎？（例如換成隱藏式面板）」
+""",
+    "stage_4_hidden_risks": """
+-------------------------
+四、當前任務：【階段 4：釐清隱藏工程與風險】
+-------------------------
+你的目標是主動把「最常被忽略、施工後才加價」的地方問出來。
+請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
+範例問題：
+- 拆除後的找平與修補：「如果拆掉舊地板或磁磚，地面高低差太大，能接受另外按實際狀況報價，還是希望先估一個預算上限？」
+- 壁癌與滲水：「有沒有哪幾面牆之前就有壁癌或滲水的記錄？」
+- 清潔與收尾：「你期待完工時是『可以直接搬進來』，還是可以接受自己再整理一次？」
+""",
+    "stage_5_budget_decision": """
+-------------------------
+四、當前任務：【階段 5：確認預算感與決策方式】
+-------------------------
+你的目標是了解使用者的預算區間與重視的優先順序（價格、品質、風格）。
+請根據對話歷史，向使用者提出下一個最關鍵的問題來收集資訊。一次只問一題。
+範例問題：
+- 「你心裡有沒有一個大概的預算範圍？比如說 XX–XX 萬？」
+- 「在這次工程裡，價格、施工品質、設計感，三個排列順序會是？」
+""",
+}
+
+DEFAULT_STAGE_INSTRUCTION = "請繼續與使用者對話，收集裝修相關資訊。"
+
+
+def prompt_digest(*texts: str) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class StagePrompt:
+    """
+    單一階段的完整系統提示（BASE_PROMPT + 階段任務指示），啟動時建立一次後重複使用。
+    parts 為預先建立的 content parts；cache_key 由兩段文字的雜湊組成，提示內容變更時自動失效。
+    """
+    stage_id: str
+    text: str
+    parts: Tuple[types.Part, ...]
+    cache_key: str
+    token_estimate: int
+
+
+class PromptLibrary:
+    """預先計算好的系統提示；每回合只依 SpecTracker 的下一個缺少階段挑選，不再重組字串"""
+
+    def __init__(
+        self,
+        base_prompt: str = BASE_PROMPT,
+        stage_instructions: Optional[Mapping[str, str]] = None,
+        final_instruction: str = FINAL_REPORT_INSTRUCTION,
+        default_instruction: str = DEFAULT_STAGE_INSTRUCTION,
+    ) -> None:
+        instructions = dict(STAGE_INSTRUCTIONS if stage_instructions is None else stage_instructions)
+        instructions[FINAL_REPORT_STAGE] = final_instruction
+        base_part = types.Part.from_text(text=base_prompt)
+        self._base_prompt = base_prompt
+        self._base_part = base_part
+        self.stages: Mapping[str, StagePrompt] = MappingProxyType({
+            stage_id: self._build(stage_id, instruction) for stage_id, instruction in instructions.items()
+        })
+        self.default = self._build("default", default_instruction)
+
+    def for_stage(self, stage_id: Optional[str]) -> StagePrompt:
+        """stage_id 為 None 代表所有階段已完成，回傳最終報告的提示"""
+        return self.stages.get(stage_id or FINAL_REPORT_STAGE, self.default)
+
+    def _build(self, stage_id: str, instruction: str) -> StagePrompt:
+        text = f"{self._base_prompt}\n{instruction}"
+        return StagePrompt(
+            stage_id=stage_id,
+            text=text,
+            parts=(self._base_part, types.Part.from_text(text=instruction)),
+            cache_key=prompt_digest(self._base_prompt, instruction),
+            token_estimate=estimate_tokens(text),
+        )
+
+
+class PromptContextCache(ABC):
+    """
+    將階段系統提示註冊為模型端可重複使用的 cached context，回傳 cached content 名稱。
+    以 (model, cache_key) 記住註冊結果並在伺服器端 TTL 到期前重新註冊；
+    註冊失敗時回傳 None，呼叫端改為隨訊息送出系統提示。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = PROMPT_CONTEXT_CACHE_TTL,
+        *,
+        retry_seconds: float = PROMPT_CONTEXT_CACHE_RETRY,
+        clock=time.monotonic,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        # 提早 10% 過期，避免使用到伺服器端剛失效的 cached content
+        self._handles = LRUTTLCache(
+            64, ttl_seconds * 0.9, negative_ttl_seconds=retry_seconds, clock=clock
+        )
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.registrations = 0
+        self.failures = 0
+
+    async def get(self, model_name: str, stage: StagePrompt) -> Optional[str]:
+        key = f"{model_name}:{stage.cache_key}"
+        handle = self._handles.get(key)
+        if handle is not MISSING:
+            return handle
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 併發的第一個回合只註冊一次
+            handle = self._handles.get(key)
+            if handle is not MISSING:
+                return handle
+            try:
+                handle = await self._register(model_name, stage)
+                self.registrations += 1
+            except Exception as e:
+                logger.warning(f"Prompt context cache registration failed for stage {stage.stage_id}: {e}")
+                self.failures += 1
+                handle = None
+            self._handles.set(key, handle)
+            return handle
+
+    @abstractmethod
+    async def _register(self, model_name: str, stage: StagePrompt) -> str:
+        """在模型端建立 cached content 並回傳其名稱；失敗時拋出例外"""
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._handles.stats()
+        stats.update({"registrations": self.registrations, "failures": self.failures})
+        return stats
+
+
+class InMemoryPromptContextCache(PromptContextCache):
+    """本地假實作：不呼叫模型端，只記錄註冊內容，供測試與本機開發使用"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.contents: Dict[str, str] = {}
+
+    async def _register(self, model_name: str, stage: StagePrompt) -> str:
+        name = f"cachedContents/local-{stage.cache_key}"
+        self.contents[name] = stage.text
+        return name
+
+
+class VertexPromptContextCache(PromptContextCache):
+    """以 google-genai 的 caches API 在 Vertex AI 上建立 cached content"""
+
+    def __init__(self, client: Any, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.client = client
+
+    async def _register(self, model_name: str, stage: StagePrompt) -> str:
+        cached = await self.client.aio.caches.create(
+            model=model_name,
+            config=types.CreateCachedContentConfig(
+                display_name=f"system-{stage.stage_id}-{stage.cache_key}",
+                system_instruction=types.Content(role="user", parts=list(stage.parts)),
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        return cached.name
+
+
+def build_prompt_context_cache(
+    mode: str = PROMPT_CONTEXT_CACHE,
+    *,
+    client: Any = None,
+) -> Optional[PromptContextCache]:
+    """client 為 google-genai Client（Vertex 後端）；其他後端不支援 cached content"""
+    if mode == "local":
+        return InMemoryPromptContextCache()
+    if mode == "vertex":
+        if client is None:
+            logger.warning("PROMPT_CONTEXT_CACHE=vertex requires the Vertex AI backend; prompt context caching disabled.")
+            return None
+        return VertexPromptContextCache(client)
+    if mode != "none":
+        logger.warning(f"Unknown PROMPT_CONTEXT_CACHE '{mode}', prompt context caching disabled.")
+    return None
+
+
+# Built once at import; StagePrompt objects are shared across all turns
+prompt_library = PromptLibrary()
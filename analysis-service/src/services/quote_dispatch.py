@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from google.cloud import pubsub_v1
+
+from src.services.upload_service import StageTimings
+
+logger = logging.getLogger(__name__)
+
+# "pubsub" publishes to GCP; "memory" keeps messages in process (local dev / tests)
+QUOTE_DISPATCH_MODE = os.getenv("QUOTE_DISPATCH_MODE", "pubsub")
+PUBSUB_PROCESSING_TOPIC = os.getenv("PUBSUB_PROCESSING_TOPIC", "quote-analysis-requests")
+PUBSUB_PROJECT_ID = os.getenv("PROJECT_ID", "houseiq-yourinteriordeco-ai")
+PUBSUB_BATCH_MAX_MESSAGES = int(os.getenv("PUBSUB_BATCH_MAX_MESSAGES", "100"))
+PUBSUB_BATCH_MAX_BYTES = int(os.getenv("PUBSUB_BATCH_MAX_BYTES", str(1024 * 1024)))
+PUBSUB_BATCH_MAX_LATENCY = float(os.getenv("PUBSUB_BATCH_MAX_LATENCY", "0.05"))
+
+# (message_id, error) -> coroutine; exactly one of the two is set
+CompletionCallback = Callable[[Optional[str], Optional[BaseException]], Awaitable[None]]
+
+
+class QuoteDispatcher(ABC):
+    """
+    Fire-and-forget dispatch of quote analysis requests.
+    `dispatch` returns as soon as the message is handed to the publisher; the
+    completion callback runs on the event loop once the publish is acknowledged.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.dispatched = 0
+        self.published = 0
+        self.failed = 0
+        self.ack_timings = StageTimings()
+        self._callbacks: Set[asyncio.Task] = set()
+
+    def dispatch(self, message: Dict[str, Any], on_complete: Optional[CompletionCallback] = None) -> None:
+        """Must be called from the event loop."""
+        self.dispatched += 1
+        self._publish(json.dumps(message).encode("utf-8"), self._completion(on_complete))
+
+    @abstractmethod
+    def _publish(self, data: bytes, done: Callable[[Optional[str], Optional[BaseException]], None]) -> None:
+        """Hands `data` to the backend and calls `done(message_id, error)` from any thread once settled."""
+
+    def _completion(self, on_complete: Optional[CompletionCallback]) -> Callable[[Optional[str], Optional[BaseException]], None]:
+        # The publisher resolves futures on its own threads; hop back to the loop
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        def done(message_id: Optional[str], error: Optional[BaseException]) -> None:
+            loop.call_soon_threadsafe(self._finish, started, on_complete, message_id, error)
+
+        return done
+
+    def _finish(
+        self,
+        started: float,
+        on_complete: Optional[CompletionCallback],
+        message_id: Optional[str],
+        error: Optional[BaseException],
+    ) -> None:
+        self.ack_timings.record((time.perf_counter() - started) * 1000, ok=error is None)
+        if error is None:
+            self.published += 1
+        else:
+            self.failed += 1
+            logger.error(f"Quote dispatch failed: {error}")
+        if on_complete is None:
+            return
+        task = asyncio.ensure_future(on_complete(message_id, error))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task) -> None:
+        self._callbacks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Quote dispatch callback failed: {task.exception()}")
+
+    @property
+    def pending(self) -> int:
+        return self.dispatched - self.published - self.failed
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Waits for outstanding publishes and their callbacks (shutdown / tests)."""
+        deadline = time.monotonic() + timeout
+        while (self.pending or self._callbacks) and time.monotonic() < deadline:
+            if self._callbacks:
+                await asyncio.wait(set(self._callbacks), timeout=max(0.0, deadline - time.monotonic()))
+            else:
+                await asyncio.sleep(0.01)
+
+    def start(self) -> None:
+        """Called at app startup to open backend clients before the first request."""
+        return None
+
+    def close(self) -> None:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "dispatched": self.dispatched,
+            "published": self.published,
+            "failed": self.failed,
+            "pending": self.pending,
+            "ack_latency": self.ack_timings.stats(),
+        }
+
+
+class PubSubQuoteDispatcher(QuoteDispatcher):
+    """Long-lived PublisherClient with batching tuned for upload bursts."""
+
+    name = "pubsub"
+
+    def __init__(
+        self,
+        publisher: Optional[pubsub_v1.PublisherClient] = None,
+        project_id: str = PUBSUB_PROJECT_ID,
+        topic_id: str = PUBSUB_PROCESSING_TOPIC,
+    ):
+        super().__init__()
+        self._publisher = publisher
+        self._project_id = project_id
+        self._topic_id = topic_id
+        self._topic_path: Optional[str] = None
+
+    @property
+    def publisher(self) -> pubsub_v1.PublisherClient:
+        if self._publisher is None:
+            batch_settings = pubsub_v1.types.BatchSettings(
+                max_messages=PUBSUB_BATCH_MAX_MESSAGES,
+                max_bytes=PUBSUB_BATCH_MAX_BYTES,
+                max_latency=PUBSUB_BATCH_MAX_LATENCY,
+            )
+            self._publisher = pubsub_v1.PublisherClient(batch_settings=batch_settings)
+        return self._publisher
+
+    @property
+    def topic_path(self) -> str:
+        if self._topic_path is None:
+            self._topic_path = self.publisher.topic_path(self._project_id, self._topic_id)
+        return self._topic_path
+
+    def _publish(self, data: bytes, done: Callable[[Optional[str], Optional[BaseException]], None]) -> None:
+        future = self.publisher.publish(self.topic_path, data=data)
+
+        def on_done(f) -> None:
+            error = f.exception()
+            done(None if error else f.result(), error)
+
+        future.add_done_callback(on_done)
+
+    def start(self) -> None:
+        """Creates the publisher at app startup; failures are retried lazily on first dispatch."""
+        try:
+            self.topic_path
+        except Exception as e:
+            logger.warning(f"Pub/Sub publisher not initialized at startup: {e}")
+
+    def close(self) -> None:
+        if self._publisher is not None:
+            # Flushes any batch still waiting on max_latency
+            self._publisher.stop()
+            self._publisher = None
+            self._topic_path = None
+
+
+class InMemoryQuoteDispatcher(QuoteDispatcher):
+    """Keeps published messages in a list; `fail_with` simulates publish errors."""
+
+    name = "memory"
+
+    def __init__(self, fail_with: Optional[BaseException] = None):
+        super().__init__()
+        self.messages: List[Dict[str, Any]] = []
+        self.fail_with = fail_with
+        self._ids = itertools.count(1)
+
+    def _publish(self, data: bytes, done: Callable[[Optional[str], Optional[BaseException]], None]) -> None:
+        if self.fail_with is not None:
+            done(None, self.fail_with)
+            return
+        self.messages.append(json.loads(data))
+        done(f"mem-{next(self._ids)}", None)
+
+
+def build_quote_dispatcher(mode: str = QUOTE_DISPATCH_MODE) -> QuoteDispatcher:
+    if mode == "memory":
+        return InMemoryQuoteDispatcher()
+    if mode != "pubsub":
+        logger.warning(f"Unknown QUOTE_DISPATCH_MODE '{mode}'; using pubsub.")
+    return PubSubQuoteDispatcher()
+
+
+quote_dispatcher = build_quote_dispatcher()
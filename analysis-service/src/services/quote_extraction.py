@@ -0,0 +1,201 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from src.models.project import LineItem, Quote
+
+# 欄位名稱（比對前會移除空白並轉小寫）
+HEADER_ALIASES: Dict[str, Sequence[str]] = {
+    "item_name": ("項目", "工程項目", "工程名稱", "工項", "品名", "品項", "名稱", "項目名稱", "item", "description"),
+    "spec": ("規格", "說明", "規格說明", "材料", "材質", "工法", "spec", "specification"),
+    "quantity": ("數量", "數", "qty", "quantity"),
+    "unit": ("單位", "unit"),
+    "unit_price": ("單價", "單價(元)", "unitprice", "price"),
+    "total_price": ("複價", "小計", "金額", "總價", "合計", "總額", "amount", "total", "subtotal"),
+}
+
+# 正規化後的單位：別名 -> 標準寫法
+UNIT_ALIASES: Dict[str, Sequence[str]] = {
+    "坪": ("坪", "ping"),
+    "式": ("式", "一式", "1式", "lot", "ls", "l.s."),
+    "間": ("間", "室"),
+    "才": ("才",),
+    "尺": ("尺", "台尺"),
+    "平方公尺": ("平方公尺", "平米", "m2", "㎡", "m²", "sqm"),
+    "公尺": ("公尺", "米", "m"),
+    "組": ("組", "套", "set"),
+    "樘": ("樘",),
+    "片": ("片",),
+    "支": ("支",),
+    "個": ("個", "顆", "只", "pcs", "pc", "ea"),
+    "處": ("處",),
+    "台": ("台", "臺"),
+}
+_UNIT_LOOKUP = {alias.lower(): unit for unit, aliases in UNIT_ALIASES.items() for alias in aliases}
+
+# 合計 / 稅金等彙總列，不是工項
+SUMMARY_KEYWORDS = ("合計", "總計", "小計", "總價", "稅", "折扣", "優惠", "total", "subtotal")
+
+# 空白欄位的常見寫法
+_PLACEHOLDERS = {"-", "--", "—", "－", "/", "n/a", "na"}
+
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+_SPLITTERS = (re.compile(r"\s*\|\s*"), re.compile(r"\s{2,}"), re.compile(r"\s+"))
+
+# 至少要有品名與兩個數值欄位，才視為報價表頭
+_REQUIRED_NUMERIC_COLUMNS = 2
+
+
+def normalize_unit(raw: Any) -> Optional[str]:
+    if raw is None:
+        return None
+    text = str(raw).strip().lower().replace(" ", "")
+    if not text or text in _PLACEHOLDERS:
+        return None
+    return _UNIT_LOOKUP.get(text, str(raw).strip())
+
+
+def parse_number(raw: Any) -> Optional[float]:
+    """解析 1,200 / NT$3,000 / 3.5坪 等格式；無數字時回傳 None"""
+    if raw is None:
+        return None
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    match = _NUMBER_RE.search(str(raw))
+    if not match:
+        return None
+    return float(match.group(0).replace(",", ""))
+
+
+def _unit_from_cell(raw: Any) -> Optional[str]:
+    """數量欄位帶單位時（例如「3.5坪」）取出單位"""
+    if raw is None or isinstance(raw, (int, float)):
+        return None
+    suffix = _NUMBER_RE.sub("", str(raw)).strip()
+    return normalize_unit(suffix) if suffix else None
+
+
+def detect_header(row: Sequence[Any]) -> Optional[Dict[str, int]]:
+    """回傳欄位名稱 -> 欄位索引；不像表頭時回傳 None"""
+    columns: Dict[str, int] = {}
+    for index, cell in enumerate(row):
+        if cell is None:
+            continue
+        label = str(cell).strip().lower().replace(" ", "")
+        for field, aliases in HEADER_ALIASES.items():
+            if field not in columns and label in aliases:
+                columns[field] = index
+                break
+    numeric = sum(1 for field in ("quantity", "unit_price", "total_price") if field in columns)
+    if "item_name" not in columns or numeric < _REQUIRED_NUMERIC_COLUMNS:
+        return None
+    return columns
+
+
+def _cell(row: Sequence[Any], columns: Dict[str, int], field: str) -> Any:
+    index = columns.get(field)
+    if index is None or index >= len(row):
+        return None
+    value = row[index]
+    return value.strip() if isinstance(value, str) else value
+
+
+def _line_item(row: Sequence[Any], columns: Dict[str, int]) -> Optional[LineItem]:
+    name = _cell(row, columns, "item_name")
+    if name is None or not str(name).strip():
+        return None
+    name = str(name).strip()
+    if any(keyword in name.lower() for keyword in SUMMARY_KEYWORDS):
+        return None
+
+    raw_quantity = _cell(row, columns, "quantity")
+    quantity = parse_number(raw_quantity)
+    unit_price = parse_number(_cell(row, columns, "unit_price"))
+    total = parse_number(_cell(row, columns, "total_price"))
+    unit = normalize_unit(_cell(row, columns, "unit")) or _unit_from_cell(raw_quantity)
+
+    if unit_price is None and total is None:
+        # 分類標題列（例如「一、拆除工程」）
+        return None
+    if quantity is None:
+        quantity = 1.0
+    if total is None:
+        total = quantity * unit_price
+    if unit_price is None:
+        unit_price = total / quantity if quantity else total
+
+    spec = _cell(row, columns, "spec")
+    return LineItem(
+        item_name=name,
+        spec=str(spec) if spec not in (None, "") else None,
+        quantity=quantity,
+        unit=unit or "式",
+        unit_price=unit_price,
+        total_price=total,
+    )
+
+
+def extract_from_rows(rows: Iterable[Sequence[Any]], source: str = "original_upload") -> Optional[Quote]:
+    """
+    從表格列（Excel rows 或切分後的 PDF 文字列）擷取工項。
+    每次遇到新的表頭列就改用新的欄位對應（多個工作表 / 多頁表格）。
+    """
+    columns: Optional[Dict[str, int]] = None
+    items: List[LineItem] = []
+    for row in rows:
+        header = detect_header(row)
+        if header is not None:
+            columns = header
+            continue
+        if columns is None:
+            continue
+        item = _line_item(row, columns)
+        if item is not None:
+            items.append(item)
+
+    if not items:
+        return None
+    total = round(sum(item.total_price for item in items), 2)
+    return Quote(source=source, line_items=items, total_price=total)
+
+
+def _split_line(line: str, expected: Optional[int]) -> List[str]:
+    """
+    Excel 文字以 tab 分隔並保留空白欄位，直接依位置切分；
+    PDF 文字依 | / 多個空白 / 單一空白的順序切分，優先選擇與表頭欄數相同的結果。
+    """
+    if "\t" in line:
+        return [cell.strip() for cell in line.split("\t")]
+    candidates = [[cell for cell in splitter.split(line.strip()) if cell != ""] for splitter in _SPLITTERS]
+    if expected:
+        for cells in candidates:
+            if len(cells) == expected:
+                return cells
+    return next((cells for cells in candidates if len(cells) > 1), candidates[-1])
+
+
+def extract_from_text(text: str, source: str = "original_upload") -> Optional[Quote]:
+    """從背景處理器產生的純文字（PDF 頁面文字或 Excel tab 分隔文字）擷取工項"""
+    rows: List[List[str]] = []
+    expected: Optional[int] = None
+    for line in (text or "").splitlines():
+        if not line.strip() or line.startswith("--- Sheet:"):
+            continue
+        cells = _split_line(line, expected)
+        if detect_header(cells) is not None:
+            expected = len(cells)
+        rows.append(cells)
+    return extract_from_rows(rows, source=source)
+
+
+def format_quote_table(quote: Quote, max_items: int = 80) -> str:
+    """提示用的精簡表格（取代整份報價單原文）"""
+    lines = ["項目 | 規格 | 數量 | 單位 | 單價 | 小計"]
+    for item in quote.line_items[:max_items]:
+        lines.append(
+            f"{item.item_name} | {item.spec or '-'} | {item.quantity:g} | {item.unit} | "
+            f"{item.unit_price:,.0f} | {item.total_price:,.0f}"
+        )
+    if len(quote.line_items) > max_items:
+        lines.append(f"…（另有 {len(quote.line_items) - max_items} 項未列出）")
+    lines.append(f"總計：{quote.total_price:,.0f} 元（{len(quote.line_items)} 項）")
+    return "\n".join(lines)
@@ -0,0 +1,72 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import unquote, urlparse
+
+from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+# Read side only: background-processor/quote_text_store.py writes these blobs and
+# owns their layout (bucket, prefix, gzip level). The manifest's `uri` says where to read.
+
+
+class QuoteTextUnavailable(LookupError):
+    """The text a manifest points to is missing, unreadable or does not match its hash."""
+
+
+def decompress_quote_text(compressed: bytes, manifest: Dict[str, Any]) -> str:
+    if manifest.get("encoding", "gzip") != "gzip":
+        raise QuoteTextUnavailable(f"Unsupported quote text encoding: {manifest.get('encoding')}")
+    try:
+        data = gzip.decompress(compressed)
+    except (OSError, EOFError, zlib.error) as e:
+        raise QuoteTextUnavailable(f"Quote text is not valid gzip: {manifest.get('uri')}: {e}") from e
+    if manifest.get("sha256") and hashlib.sha256(data).hexdigest() != manifest["sha256"]:
+        raise QuoteTextUnavailable(f"Quote text does not match its manifest hash: {manifest.get('uri')}")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise QuoteTextUnavailable(f"Quote text is not valid UTF-8: {manifest.get('uri')}") from e
+
+
+class QuoteTextStore:
+    """
+    Reads compressed, content-addressed quote text written by the background processor.
+    Project documents keep only the manifest (uri, sizes, sha256, page_count);
+    the text is fetched on demand from the manifest's gs:// or file:// URI.
+    """
+
+    def __init__(self, storage_client: Optional[storage.Client] = None):
+        self._storage_client = storage_client
+
+    @property
+    def storage_client(self) -> storage.Client:
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    async def load(self, manifest: Dict[str, Any]) -> str:
+        uri = manifest.get("uri") or ""
+        try:
+            compressed = await asyncio.to_thread(self._read, uri)
+        except QuoteTextUnavailable:
+            raise
+        except Exception as e:
+            raise QuoteTextUnavailable(f"Failed to read quote text {uri}: {e}") from e
+        return decompress_quote_text(compressed, manifest)
+
+    def _read(self, uri: str) -> bytes:
+        parsed = urlparse(uri)
+        if parsed.scheme == "gs":
+            return self.storage_client.bucket(parsed.netloc).blob(parsed.path.lstrip("/")).download_as_bytes()
+        if parsed.scheme == "file":
+            return Path(unquote(parsed.path)).read_bytes()
+        raise QuoteTextUnavailable(f"Unsupported quote text URI: {uri!r}")
+
+
+quote_text_store = QuoteTextStore()
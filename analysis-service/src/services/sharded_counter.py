@@ -0,0 +1,52 @@
+import os
+import random
+from typing import Any, List, Optional
+
+from google.cloud import firestore
+
+# 每個計數器的分片數：單一文件的持續寫入約每秒 1 次，分片數即可承受的並行寫入倍數
+COUNTER_SHARDS = int(os.getenv("COUNTER_SHARDS", "10"))
+COUNTER_SHARDS_COLLECTION = "counter_shards"
+
+
+class ShardedCounter:
+    """
+    Firestore 分片計數器。
+    遞增時隨機寫入 `{parent}/counter_shards/{name}-{i}` 其中一片，
+    讀取時一次 get_all 取回所有分片加總，熱點欄位不再集中在 parent document。
+    parent document 上既有的同名欄位（分片前的舊資料）視為基數一併加總。
+    """
+
+    def __init__(self, db: Any, parent_ref: Any, name: str, num_shards: int = COUNTER_SHARDS):
+        self.db = db
+        self.parent_ref = parent_ref
+        self.name = name
+        self.num_shards = max(1, num_shards)
+
+    def shard_ref(self, index: int) -> Any:
+        return self.parent_ref.collection(COUNTER_SHARDS_COLLECTION).document(f"{self.name}-{index}")
+
+    def shard_refs(self) -> List[Any]:
+        return [self.shard_ref(index) for index in range(self.num_shards)]
+
+    def increment_in(self, batch: Any, amount: int = 1, shard: Optional[int] = None) -> None:
+        """將遞增加入既有的 WriteBatch（與同回合的其他寫入一起提交）"""
+        index = random.randrange(self.num_shards) if shard is None else shard % self.num_shards
+        batch.set(self.shard_ref(index), {"count": firestore.Increment(amount)}, merge=True)
+
+    async def increment(self, amount: int = 1) -> None:
+        batch = self.db.batch()
+        self.increment_in(batch, amount)
+        await batch.commit()
+
+    async def total(self) -> int:
+        """加總所有分片與 parent 上的舊欄位（num_shards + 1 次文件讀取，單一 RPC）"""
+        total = 0
+        refs = [self.parent_ref, *self.shard_refs()]
+        async for snapshot in self.db.get_all(refs, field_paths=["count", self.name]):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict() or {}
+            field = self.name if snapshot.reference.path == self.parent_ref.path else "count"
+            total += data.get(field) or 0
+        return total
@@ -1,18 +1,508 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
 import logging
-from typing import Any, Dict
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
 from src.models.project import AgentRole, ProjectBrief
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "memory" keeps jobs in process; "sqlite" persists them so queued work survives restarts
+TASK_QUEUE_BACKEND = os.getenv("TASK_QUEUE_BACKEND", "memory")
+TASK_QUEUE_PATH = os.getenv("TASK_QUEUE_PATH", "task_queue.sqlite3")
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "4"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+TASK_RETRY_BASE_DELAY = float(os.getenv("TASK_RETRY_BASE_DELAY", "1.0"))
+TASK_RETRY_MAX_DELAY = float(os.getenv("TASK_RETRY_MAX_DELAY", "60.0"))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "0.5"))
+# Finished jobs kept for status polling: dropped after this many seconds, and the
+# oldest ones first once more than TASK_JOB_RETENTION_MAX are kept
+TASK_JOB_RETENTION_SECONDS = float(os.getenv("TASK_JOB_RETENTION_SECONDS", "3600"))
+TASK_JOB_RETENTION_MAX = int(os.getenv("TASK_JOB_RETENTION_MAX", "1000"))
+# The SQLite queue applies the retention policy at most this often (on a job finishing)
+TASK_JOB_PRUNE_INTERVAL = float(os.getenv("TASK_JOB_PRUNE_INTERVAL", "60"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+TaskHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    """Status record of one queued task. `payload` and `result` must be JSON-serializable."""
+
+    task_type: str
+    payload: Dict[str, Any]
+    job_id: str = field(default_factory=lambda: f"job-{uuid.uuid4()}")
+    idempotency_key: Optional[str] = None
+    status: str = JOB_QUEUED
+    attempts: int = 0
+    max_attempts: int = TASK_MAX_ATTEMPTS
+    run_after: float = field(default_factory=time.time)
+    result: Any = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=_now_iso)
+    updated_at: str = field(default_factory=_now_iso)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobQueue(ABC):
+    """Storage for job records. `claim` must hand each due job to exactly one worker."""
+
+    @abstractmethod
+    async def enqueue(self, job: Job) -> Job:
+        """Stores the job, or returns the existing job with the same idempotency key."""
+
+    @abstractmethod
+    async def claim(self) -> Optional[Job]:
+        """Marks the next due queued job as running and returns it."""
+
+    @abstractmethod
+    async def save(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    async def recover(self) -> int:
+        """Re-queues jobs left running by a previous process; returns how many."""
+        return 0
+
+    @abstractmethod
+    async def counts(self) -> Dict[str, int]:
+        ...
+
+    def close(self) -> None:
+        return None
+
+
+class InMemoryJobQueue(JobQueue):
+    """
+    Queued jobs sit in a heap ordered by `run_after`, so `claim` only looks at
+    the head. Finished jobs are kept for `retention_seconds` (at most
+    `retention_max` of them) and then forgotten along with their idempotency key.
+    """
+
+    def __init__(
+        self,
+        retention_seconds: float = TASK_JOB_RETENTION_SECONDS,
+        retention_max: int = TASK_JOB_RETENTION_MAX,
+    ):
+        self.retention_seconds = retention_seconds
+        self.retention_max = retention_max
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        # (run_after, seq, job_id); entries whose job was claimed or rescheduled are skipped lazily
+        self._queued: List[tuple] = []
+        self._seq = itertools.count()
+        # job_id -> time it finished, oldest first (dicts keep insertion order)
+        self._finished: Dict[str, float] = {}
+
+    def _push(self, job: Job) -> None:
+        heapq.heappush(self._queued, (job.run_after, next(self._seq), job.job_id))
+
+    def _evict_finished(self) -> None:
+        cutoff = time.monotonic() - self.retention_seconds
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff and len(self._finished) <= self.retention_max:
+                break
+            del self._finished[job_id]
+            job = self._jobs.pop(job_id, None)
+            if job is not None and job.idempotency_key and self._by_key.get(job.idempotency_key) == job_id:
+                del self._by_key[job.idempotency_key]
+
+    async def enqueue(self, job: Job) -> Job:
+        self._evict_finished()
+        if job.idempotency_key and job.idempotency_key in self._by_key:
+            return self._jobs[self._by_key[job.idempotency_key]]
+        self._jobs[job.job_id] = job
+        if job.idempotency_key:
+            self._by_key[job.idempotency_key] = job.job_id
+        if job.status == JOB_QUEUED:
+            self._push(job)
+        return job
+
+    async def claim(self) -> Optional[Job]:
+        now = time.time()
+        while self._queued and self._queued[0][0] <= now:
+            run_after, _, job_id = heapq.heappop(self._queued)
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED or job.run_after != run_after:
+                continue
+            job.status = JOB_RUNNING
+            job.updated_at = _now_iso()
+            return job
+        return None
+
+    async def save(self, job: Job) -> None:
+        self._jobs[job.job_id] = job
+        if job.status == JOB_QUEUED:
+            self._push(job)
+        elif job.status in TERMINAL_STATUSES:
+            self._finished.pop(job.job_id, None)
+            self._finished[job.job_id] = time.monotonic()
+            self._evict_finished()
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    File-backed queue usable without any cloud service.
+    One connection guarded by a lock; every call runs in a worker thread.
+    Finished rows (and with them their idempotency keys) follow the same retention
+    policy as the in-memory queue, pruned at most every `prune_interval` seconds.
+    """
+
+    _COLUMNS = (
+        "job_id", "task_type", "payload", "idempotency_key", "status", "attempts",
+        "max_attempts", "run_after", "result", "error", "created_at", "updated_at",
+    )
+
+    def __init__(
+        self,
+        path: str = TASK_QUEUE_PATH,
+        retention_seconds: float = TASK_JOB_RETENTION_SECONDS,
+        retention_max: int = TASK_JOB_RETENTION_MAX,
+        prune_interval: float = TASK_JOB_PRUNE_INTERVAL,
+    ):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.retention_max = retention_max
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                task_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                idempotency_key TEXT UNIQUE,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_after)")
+        # updated_at of a finished job is when it finished
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, updated_at)")
+
+    def _row_to_job(self, row) -> Job:
+        data = dict(zip(self._COLUMNS, row))
+        data["payload"] = json.loads(data["payload"])
+        data["result"] = json.loads(data["result"]) if data["result"] is not None else None
+        return Job(**data)
+
+    def _values(self, job: Job):
+        data = job.to_dict()
+        data["payload"] = json.dumps(job.payload, ensure_ascii=False)
+        data["result"] = json.dumps(job.result, ensure_ascii=False) if job.result is not None else None
+        return tuple(data[column] for column in self._COLUMNS)
+
+    def _select(self, where: str, args: tuple) -> Optional[Job]:
+        row = self._conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE {where}", args).fetchone()
+        return self._row_to_job(row) if row else None
+
+    async def enqueue(self, job: Job) -> Job:
+        def _enqueue() -> Job:
+            with self._lock:
+                if job.idempotency_key:
+                    existing = self._select("idempotency_key = ?", (job.idempotency_key,))
+                    if existing:
+                        return existing
+                placeholders = ", ".join("?" for _ in self._COLUMNS)
+                self._conn.execute(f"INSERT INTO jobs VALUES ({placeholders})", self._values(job))
+                return job
+        return await asyncio.to_thread(_enqueue)
+
+    async def claim(self) -> Optional[Job]:
+        def _claim() -> Optional[Job]:
+            with self._lock:
+                job = self._select(
+                    "status = ? AND run_after <= ? ORDER BY run_after LIMIT 1", (JOB_QUEUED, time.time())
+                )
+                if job is None:
+                    return None
+                job.status = JOB_RUNNING
+                job.updated_at = _now_iso()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                    (job.status, job.updated_at, job.job_id),
+                )
+                return job
+        return await asyncio.to_thread(_claim)
+
+    async def save(self, job: Job) -> None:
+        def _save() -> None:
+            with self._lock:
+                assignments = ", ".join(f"{column} = ?" for column in self._COLUMNS[1:])
+                values = self._values(job)
+                self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", values[1:] + values[:1])
+                if job.status in TERMINAL_STATUSES and time.monotonic() - self._last_prune >= self.prune_interval:
+                    self._prune()
+        await asyncio.to_thread(_save)
+
+    async def prune(self) -> int:
+        """Deletes finished jobs past the retention policy; returns how many."""
+        def _prune() -> int:
+            with self._lock:
+                return self._prune()
+        return await asyncio.to_thread(_prune)
+
+    def _prune(self) -> int:
+        self._last_prune = time.monotonic()
+        terminal = ", ".join("?" for _ in TERMINAL_STATUSES)
+        cutoff = datetime.fromtimestamp(time.time() - self.retention_seconds, timezone.utc).isoformat()
+        deleted = self._conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({terminal}) AND updated_at < ?", (*TERMINAL_STATUSES, cutoff)
+        ).rowcount
+        deleted += self._conn.execute(
+            f"""
+            DELETE FROM jobs WHERE job_id IN (
+                SELECT job_id FROM jobs WHERE status IN ({terminal})
+                ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (*TERMINAL_STATUSES, self.retention_max),
+        ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs from {self.path}")
+        return deleted
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        def _get() -> Optional[Job]:
+            with self._lock:
+                return self._select("job_id = ?", (job_id,))
+        return await asyncio.to_thread(_get)
+
+    async def recover(self) -> int:
+        def _recover() -> int:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                    (JOB_QUEUED, _now_iso(), JOB_RUNNING),
+                )
+                return cursor.rowcount
+        return await asyncio.to_thread(_recover)
+
+    async def counts(self) -> Dict[str, int]:
+        def _counts() -> Dict[str, int]:
+            with self._lock:
+                return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return await asyncio.to_thread(_counts)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def build_job_queue(backend: str = TASK_QUEUE_BACKEND) -> JobQueue:
+    if backend == "sqlite":
+        return SQLiteJobQueue(TASK_QUEUE_PATH)
+    if backend != "memory":
+        logger.warning(f"Unknown TASK_QUEUE_BACKEND '{backend}'; using memory.")
+    return InMemoryJobQueue()
+
+
 class TaskDispatcher:
     """
-    A prototype service for dispatching tasks to other agents.
-    In a production environment, this would interface with a real task queue
-    like Google Cloud Tasks.
+    Background job system for long-running agent work.
+    Handlers are registered per task type; `submit` records a job and returns
+    immediately, and a pool of worker coroutines runs due jobs with retries and
+    exponential backoff until they succeed or exhaust `max_attempts`.
     """
 
+    def __init__(
+        self,
+        queue: Optional[JobQueue] = None,
+        workers: int = TASK_WORKERS,
+        max_attempts: int = TASK_MAX_ATTEMPTS,
+        retry_base_delay: float = TASK_RETRY_BASE_DELAY,
+        retry_max_delay: float = TASK_RETRY_MAX_DELAY,
+        poll_interval: float = TASK_POLL_INTERVAL,
+    ):
+        self.queue = queue or build_job_queue()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, TaskHandler] = {}
+        self._worker_tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    def register(self, task_type: str, handler: TaskHandler) -> None:
+        self._handlers[task_type] = handler
+
+    def handler(self, task_type: str) -> Callable[[TaskHandler], TaskHandler]:
+        """Decorator form of `register`."""
+        def decorator(fn: TaskHandler) -> TaskHandler:
+            self.register(task_type, fn)
+            return fn
+        return decorator
+
+    async def submit(
+        self,
+        task_type: str,
+        payload: Optional[Dict[str, Any]] = None,
+        *,
+        idempotency_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> Job:
+        """
+        Queues a job. Submitting again with the same idempotency key returns the
+        existing job (whatever its status) instead of running the work twice.
+        `job_id` lets callers put the id into the payload before submitting.
+        """
+        job = Job(
+            task_type=task_type,
+            payload=payload or {},
+            idempotency_key=idempotency_key,
+            max_attempts=max_attempts or self.max_attempts,
+        )
+        if job_id:
+            job.job_id = job_id
+        stored = await self.queue.enqueue(job)
+        if stored.job_id == job.job_id:
+            logger.info(f"Queued job {job.job_id} ({task_type})")
+            self._notify()
+        return stored
+
+    async def get_job(self, job_id: str) -> Optional[Job]:
+        return await self.queue.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float = 30.0) -> Optional[Job]:
+        """Polls until the job reaches a terminal status or the timeout expires."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.queue.get(job_id)
+            if job is None or job.status in TERMINAL_STATUSES or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(min(0.05, self.poll_interval))
+
+    async def start(self) -> None:
+        if self._worker_tasks:
+            return
+        self._wakeup = asyncio.Event()
+        recovered = await self.queue.recover()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted jobs.")
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(index), name=f"task-worker-{index}") for index in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max_delay, self.retry_base_delay * (2 ** (attempts - 1)))
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            # Cleared before claiming so a submit racing with an empty claim still wakes us
+            self._wakeup.clear()
+            job = await self.queue.claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        job.attempts += 1
+        handler = self._handlers.get(job.task_type)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for task type '{job.task_type}'")
+            job.result = await handler(job.payload)
+            job.status = JOB_SUCCEEDED
+            job.error = None
+            self.succeeded += 1
+            logger.info(f"Job {job.job_id} ({job.task_type}) succeeded on attempt {job.attempts}")
+        except asyncio.CancelledError:
+            # Shutdown mid-job: leave it for the next process to pick up
+            job.status = JOB_QUEUED
+            job.attempts -= 1
+            await self.queue.save(job)
+            raise
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            if handler is not None and job.attempts < job.max_attempts:
+                delay = self._retry_delay(job.attempts)
+                job.status = JOB_QUEUED
+                job.run_after = time.time() + delay
+                self.retried += 1
+                logger.warning(f"Job {job.job_id} ({job.task_type}) failed ({e}); retrying in {delay:.1f}s")
+            else:
+                job.status = JOB_FAILED
+                self.failed += 1
+                logger.error(f"Job {job.job_id} ({job.task_type}) failed after {job.attempts} attempts: {e}")
+        job.updated_at = _now_iso()
+        await self.queue.save(job)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._worker_tasks),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "jobs": await self.queue.counts(),
+        }
+
     async def dispatch_task(
         self,
         target_agent: AgentRole,
@@ -20,35 +510,33 @@ class TaskDispatcher:
         payload: Dict[str, Any] = None
     ):
         """
-        Simulates dispatching a task to a target agent.
-        
+        Queues a task for a target agent. Keyed by project, agent and a hash of
+        the brief and payload, so dispatching the same brief twice does not run
+        the agent twice while an updated brief queues a new run.
+
         :param target_agent: The role of the agent to dispatch the task to.
         :param brief: The project brief containing all necessary context.
         :param payload: Any additional data specific to this task.
         """
-        if not payload:
-            payload = {}
-            
-        logger.info(f"--- TASK DISPATCHED (PROTOTYPE) ---")
-        logger.info(f"Target Agent: {target_agent.value}")
-        logger.info(f"Project ID: {brief.project_id}")
-        logger.info(f"Payload Keys: {list(payload.keys())}")
-        logger.info(f"------------------------------------")
-        
-        # In a real implementation, this would create a Cloud Task:
-        # e.g.,
-        # client = tasks_v2.CloudTasksClient()
-        # task = {
-        #     "http_request": {
-        #         "http_method": tasks_v2.HttpMethod.POST,
-        #         "url": f"https://your-service-url/api/tasks/{target_agent.name.lower()}",
-        #         "headers": {"Content-type": "application/json"},
-        #         "body": brief.json().encode(),
-        #     }
-        # }
-        # client.create_task(parent=queue_path, task=task)
-        
-        return {"status": "success", "message": f"Task for {target_agent.value} has been dispatched."}
+        job_payload = {"brief": brief.model_dump(mode="json"), **(payload or {})}
+        content_hash = hashlib.sha256(
+            json.dumps(job_payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        job = await self.submit(
+            agent_task_type(target_agent),
+            job_payload,
+            idempotency_key=f"{brief.project_id}:{target_agent.name.lower()}:{content_hash}",
+        )
+        return {
+            "status": "success",
+            "message": f"Task for {target_agent.value} has been dispatched.",
+            "job_id": job.job_id,
+        }
+
+
+def agent_task_type(role: AgentRole) -> str:
+    return f"agent.{role.name.lower()}"
+
 
 # Singleton instance
 task_dispatcher = TaskDispatcher()
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_READ_CHUNK_SIZE = int(os.getenv("UPLOAD_READ_CHUNK_SIZE", str(1024 * 1024)))
+# GCS resumable uploads require a multiple of 256 KiB
+UPLOAD_GCS_CHUNK_SIZE = int(os.getenv("UPLOAD_GCS_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# The PDF trailer (%%EOF) must appear within the last bytes of the file
+PDF_TRAILER_WINDOW = 2048
+# Bounds how many blocking GCS / pre-flight calls run at once, so a burst of
+# uploads cannot take over the default executor used by the rest of the app
+UPLOAD_EXECUTOR_WORKERS = int(os.getenv("UPLOAD_EXECUTOR_WORKERS", "4"))
+UPLOAD_TIMING_WINDOW = int(os.getenv("UPLOAD_TIMING_WINDOW", "512"))
+
+_MAGIC_NUMBERS = {
+    "application/pdf": (b"%PDF-",),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": (b"PK\x03\x04",),
+    # Legacy .xls (OLE2 compound file); some clients also send .xlsx with this type
+    "application/vnd.ms-excel": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b"PK\x03\x04"),
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+}
+
+
+class InvalidUpload(ValueError):
+    """The uploaded file failed the pre-flight check."""
+
+
+class UploadTooLarge(InvalidUpload):
+    pass
+
+
+@dataclass(frozen=True)
+class UploadInfo:
+    content_sha256: str
+    size_bytes: int
+
+
+def inspect_upload(fileobj: BinaryIO, content_type: str, max_bytes: int = UPLOAD_MAX_BYTES) -> UploadInfo:
+    """
+    Streams the spooled upload once to compute its SHA-256 and size, then runs a
+    bounded pre-flight check (magic number, PDF trailer, xlsx central directory)
+    instead of parsing the whole document. Blocking; run it in a worker thread.
+    The file position is rewound to 0 on return.
+    """
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    while True:
+        chunk = fileobj.read(UPLOAD_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not head:
+            head = chunk[:16]
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit.")
+        digest.update(chunk)
+
+    if size == 0:
+        raise InvalidUpload("File is empty.")
+    _preflight(fileobj, content_type, head, size)
+    fileobj.seek(0)
+    return UploadInfo(content_sha256=digest.hexdigest(), size_bytes=size)
+
+
+def _preflight(fileobj: BinaryIO, content_type: str, head: bytes, size: int) -> None:
+    magics = _MAGIC_NUMBERS.get(content_type, ())
+    if magics and not head.startswith(magics):
+        raise InvalidUpload(f"File content does not match {content_type}.")
+
+    if content_type == "application/pdf":
+        fileobj.seek(max(0, size - PDF_TRAILER_WINDOW))
+        if b"%%EOF" not in fileobj.read(PDF_TRAILER_WINDOW):
+            raise InvalidUpload("PDF file is truncated or corrupted.")
+    elif head.startswith(b"PK\x03\x04"):
+        # Reads only the zip central directory at the end of the file
+        try:
+            names = zipfile.ZipFile(fileobj).namelist()
+        except zipfile.BadZipFile as e:
+            raise InvalidUpload(f"Spreadsheet archive is corrupted: {e}") from e
+        if "xl/workbook.xml" not in names:
+            raise InvalidUpload("Archive is not an Excel workbook.")
+
+
+def upload_to_gcs(bucket, blob_name: str, fileobj: BinaryIO, content_type: str, size_bytes: int) -> bool:
+    """
+    Uploads from the file handle in resumable chunks. Returns False if an object
+    with this (content-addressed) name already exists. Blocking; run it in a worker thread.
+    """
+    blob = bucket.blob(blob_name, chunk_size=UPLOAD_GCS_CHUNK_SIZE)
+    fileobj.seek(0)
+    try:
+        # if_generation_match=0 only creates the object; identical content is never re-uploaded
+        blob.upload_from_file(
+            fileobj, size=size_bytes, content_type=content_type, if_generation_match=0
+        )
+        return True
+    except google_exceptions.PreconditionFailed:
+        return False
+
+
+class StageTimings:
+    """Latency of one upload stage over the last `window` calls."""
+
+    def __init__(self, window: int = UPLOAD_TIMING_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float, ok: bool = True) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self._recent.append(elapsed_ms)
+        if not ok:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 2)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(recent[-1], 2) if recent else 0.0,
+        }
+
+
+class UploadService:
+    """
+    Process-lifetime GCS client for quote uploads (publishing is done by quote_dispatch).
+    Blocking client calls run on a bounded thread pool and every stage is timed,
+    so uploads do not stall the SSE streams served by the same worker.
+    """
+
+    STAGES = ("preflight", "upload")
+
+    def __init__(
+        self,
+        storage_client: Optional[storage.Client] = None,
+        max_workers: int = UPLOAD_EXECUTOR_WORKERS,
+    ):
+        self._storage_client = storage_client
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.timings: Dict[str, StageTimings] = {stage: StageTimings() for stage in self.STAGES}
+
+    def start(self) -> None:
+        """Creates the client at app startup; failures are retried lazily on first use."""
+        try:
+            self.storage_client
+        except Exception as e:
+            logger.warning(f"Storage client not initialized at startup: {e}")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def storage_client(self) -> storage.Client:
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="upload")
+        return self._executor
+
+    async def _run_blocking(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            ok = True
+            return result
+        finally:
+            self.timings[stage].record((time.perf_counter() - started) * 1000, ok)
+
+    async def inspect(self, fileobj: BinaryIO, content_type: str) -> UploadInfo:
+        return await self._run_blocking("preflight", inspect_upload, fileobj, content_type)
+
+    async def upload(
+        self, bucket_name: str, blob_name: str, fileobj: BinaryIO, content_type: str, size_bytes: int
+    ) -> bool:
+        bucket = self.storage_client.bucket(bucket_name)
+        return await self._run_blocking("upload", upload_to_gcs, bucket, blob_name, fileobj, content_type, size_bytes)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage: timings.stats() for stage, timings in self.timings.items()}
+
+
+upload_service = UploadService()
@@ -0,0 +1,216 @@
+"""
+SSE 對話回合的延遲基準測試。
+
+透過 ASGI app 直接驅動 /api/projects/{id}/conversation/message-stream，
+Firestore 使用 conftest 的 FakeAsyncFirestore（搭配真正的 ConversationService，以計算每回合的讀寫次數），
+LLM 使用 LocalLLMBackend（可設定首 token 延遲與 token 速率）。
+輸出 JSON，方便在不同 commit 之間比較：
+
+    python -m tests.benchmark_message_stream --turns 200 --concurrency 16 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote, urlencode
+
+# 基準測試不連線 Firestore；AsyncClient 在 import 時建立，需要專案與 emulator 設定
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+
+for path in (ROOT_DIR, SRC_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from main import app  # noqa: E402
+from src.api import projects  # noqa: E402
+from src.services.conversation_service import ConversationService  # noqa: E402
+from src.services.gemini_service import GeminiLLMService  # noqa: E402
+from src.services.llm_backend import LocalLLMBackend  # noqa: E402
+from tests.conftest import FakeAsyncFirestore  # noqa: E402
+
+MESSAGES = [
+    "我們家是三十年的老公寓，想整理主臥和浴室",
+    "主要是自住，牆面有壁癌",
+    "地板想換成超耐磨木地板",
+    "預算大概一百萬左右",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """nearest-rank 百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+async def drive_turn(project_id: str, message: str) -> Dict[str, Any]:
+    """以原始 ASGI 呼叫送出一回合，記錄首個 chunk、isComplete 與串流結束的時間（毫秒）"""
+    path = f"/api/projects/{project_id}/conversation/message-stream"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": quote(path).encode(),
+        "root_path": "",
+        "query_string": urlencode({"message": message}).encode(),
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    result: Dict[str, Any] = {"status": None, "first_chunk_ms": None, "complete_ms": None, "chunks": 0}
+    request_sent = False
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # 用戶端不會中斷連線；串流結束時 Starlette 會取消這個等待
+        await asyncio.Event().wait()
+
+    async def send(event):
+        elapsed = (time.perf_counter() - started) * 1000
+        if event["type"] == "http.response.start":
+            result["status"] = event["status"]
+        elif event["type"] == "http.response.body":
+            body = event.get("body", b"")
+            if body.startswith(b"data:"):
+                data = json.loads(body[5:])
+                if data.get("chunk"):
+                    result["chunks"] += 1
+                    if result["first_chunk_ms"] is None:
+                        result["first_chunk_ms"] = elapsed
+                if data.get("isComplete"):
+                    result["complete_ms"] = elapsed
+
+    await app(scope, receive, send)
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_benchmark(
+    turns: int = 100,
+    concurrency: int = 8,
+    conversations: Optional[int] = None,
+    first_token_delay: float = 0.2,
+    tokens_per_second: float = 200.0,
+    extraction_mode: str = "background",
+) -> Dict[str, Any]:
+    conversations = conversations or concurrency
+    db = FakeAsyncFirestore()
+    service = ConversationService(db=db)
+    backend = LocalLLMBackend(first_token_delay=first_token_delay, tokens_per_second=tokens_per_second)
+    gemini = GeminiLLMService(backend=backend)
+    gemini.spec_extraction_mode = extraction_mode
+    gemini.context_cache = None
+
+    original = (projects.conversation_service, projects.gemini_service)
+    projects.conversation_service, projects.gemini_service = service, gemini
+    try:
+        project_ids = [f"bench-{index}" for index in range(conversations)]
+        for project_id in project_ids:
+            await service.create_project_in_db(project_id)
+            await service.create_conversation(f"conv-{project_id}", project_id)
+        await service.flush_events()
+        ops_before = dict(db.ops)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(turns):
+            queue.put_nowait((project_ids[index % conversations], MESSAGES[index % len(MESSAGES)]))
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            while not queue.empty():
+                project_id, message = queue.get_nowait()
+                try:
+                    results.append(await drive_turn(project_id, message))
+                except Exception as e:
+                    results.append({"status": None, "error": str(e)})
+
+        wall_started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        wall_time = time.perf_counter() - wall_started
+        await service.flush_events()
+        ops = {key: db.ops[key] - ops_before.get(key, 0) for key in db.ops}
+    finally:
+        await service.close()
+        projects.conversation_service, projects.gemini_service = original
+
+    ok = [result for result in results if result.get("status") == 200 and result.get("complete_ms") is not None]
+    return {
+        "config": {
+            "turns": turns,
+            "concurrency": concurrency,
+            "conversations": conversations,
+            "first_token_delay_s": first_token_delay,
+            "tokens_per_second": tokens_per_second,
+            "spec_extraction_mode": extraction_mode,
+        },
+        "completed_turns": len(ok),
+        "errors": len(results) - len(ok),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_turns_per_s": round(len(ok) / wall_time, 3) if wall_time else 0.0,
+        "time_to_first_chunk_ms": summarize([r["first_chunk_ms"] for r in ok if r["first_chunk_ms"] is not None]),
+        "time_to_complete_ms": summarize([r["complete_ms"] for r in ok]),
+        "total_turn_ms": summarize([r["total_ms"] for r in ok]),
+        "firestore_ops_total": ops,
+        "firestore_ops_per_turn": {key: round(value / max(1, turns), 3) for key, value in ops.items()},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the conversation message-stream SSE endpoint.")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--conversations", type=int, default=None,
+                        help="Distinct conversations to spread turns over (default: concurrency)")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--extraction-mode", choices=["inline", "speculative", "background"], default="background")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        turns=args.turns,
+        concurrency=args.concurrency,
+        conversations=args.conversations,
+        first_token_delay=args.first_token_delay,
+        tokens_per_second=args.tokens_per_second,
+        extraction_mode=args.extraction_mode,
+    ))
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
+import asyncio
+import importlib.util
+import itertools
 import os
 import sys
+from datetime import datetime, timezone
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 import pytest
+from google.cloud import firestore
 
 # 確保分析服務根目錄在 sys.path 中，讓 `src` 套件可被載入
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -16,6 +21,230 @@ for path in (ROOT_DIR, SRC_DIR):
 from src.api import projects  # noqa: E402  pylint: disable=C0413
 
 
+class FakeSnapshot:
+    def __init__(self, ref: "FakeDocumentRef", data: Optional[Dict[str, Any]]):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, db: "FakeAsyncFirestore", path: str):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollectionRef":
+        return FakeCollectionRef(self.db, f"{self.path}/{name}")
+
+    async def get(self, field_paths=None):
+        self.db.ops["reads"] += 1
+        return self.db.snapshot(self, field_paths)
+
+    async def set(self, data: Dict[str, Any], merge: bool = False):
+        self.db.ops["writes"] += 1
+        self.db.apply_set(self.path, data, merge)
+
+    async def update(self, data: Dict[str, Any]):
+        self.db.ops["writes"] += 1
+        if self.path not in self.db.docs:
+            raise LookupError(f"No document to update: {self.path}")
+        self.db.apply_set(self.path, data, merge=True)
+
+
+class FakeQuery:
+    def __init__(self, collection: "FakeCollectionRef", filters=None, order=None, limit_count=None):
+        self.collection = collection
+        self.filters = filters or []
+        self.order = order
+        self.limit_count = limit_count
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return FakeQuery(self.collection, self.filters + [(field, op, value)], self.order, self.limit_count)
+
+    def order_by(self, field: str, direction: str = firestore.Query.ASCENDING) -> "FakeQuery":
+        return FakeQuery(self.collection, self.filters, (field, direction), self.limit_count)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self.collection, self.filters, self.order, count)
+
+    async def stream(self):
+        self.collection.db.ops["queries"] += 1
+        docs = self.collection.db.children(self.collection.path)
+        for field, op, value in self.filters:
+            docs = [(path, data) for path, data in docs if _matches(data.get(field), op, value)]
+        if self.order:
+            field, direction = self.order
+            docs.sort(key=lambda item: item[1].get(field), reverse=direction == firestore.Query.DESCENDING)
+        if self.limit_count is not None:
+            docs = docs[: self.limit_count]
+        for path, data in docs:
+            self.collection.db.ops["reads"] += 1
+            yield FakeSnapshot(FakeDocumentRef(self.collection.db, path), data)
+
+
+def _matches(actual: Any, op: str, expected: Any) -> bool:
+    if op == "==":
+        return actual == expected
+    if actual is None:
+        return False
+    if op == ">":
+        return actual > expected
+    if op == ">=":
+        return actual >= expected
+    if op == "<":
+        return actual < expected
+    raise NotImplementedError(op)
+
+
+class FakeCollectionRef(FakeQuery):
+    def __init__(self, db: "FakeAsyncFirestore", path: str):
+        self.db = db
+        self.path = path
+        super().__init__(self)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentRef:
+        if doc_id is None:
+            doc_id = f"auto-{next(self.db.auto_ids)}"
+        return FakeDocumentRef(self.db, f"{self.path}/{doc_id}")
+
+    async def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        await ref.set(data)
+        return None, ref
+
+
+class FakeWriteBatch:
+    def __init__(self, db: "FakeAsyncFirestore"):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref: FakeDocumentRef, data: Dict[str, Any], merge: bool = False):
+        self.writes.append((ref.path, data, merge))
+
+    def update(self, ref: FakeDocumentRef, data: Dict[str, Any]):
+        self.writes.append((ref.path, data, True))
+
+    async def commit(self):
+        if self.db.fail_commits:
+            raise RuntimeError("firestore unavailable")
+        self.db.ops["batch_commits"] += 1
+        self.db.ops["writes"] += len(self.writes)
+        self.db.committed_batches.append(list(self.writes))
+        for path, data, merge in self.writes:
+            self.db.apply_set(path, data, merge)
+
+
+class FakeAsyncFirestore:
+    """In-memory stand-in for firestore.AsyncClient with per-op counters."""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.ops = {"reads": 0, "writes": 0, "queries": 0, "batch_commits": 0}
+        self.committed_batches: List[List[Any]] = []
+        self.fail_commits = False
+        self.auto_ids = itertools.count(1)
+        self._clock = itertools.count(1)
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    async def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            self.ops["reads"] += 1
+            yield self.snapshot(ref, field_paths)
+
+    def snapshot(self, ref: FakeDocumentRef, field_paths=None) -> FakeSnapshot:
+        data = self.docs.get(ref.path)
+        if data is not None and field_paths is not None:
+            data = {key: value for key, value in data.items() if key in set(field_paths)}
+        return FakeSnapshot(ref, data)
+
+    def children(self, collection_path: str):
+        depth = collection_path.count("/") + 1
+        return [
+            (path, data) for path, data in self.docs.items()
+            if path.startswith(collection_path + "/") and path.count("/") == depth
+        ]
+
+    def apply_set(self, path: str, data: Dict[str, Any], merge: bool):
+        current = dict(self.docs.get(path, {})) if merge else {}
+        for key, value in data.items():
+            if value is firestore.SERVER_TIMESTAMP:
+                # Strictly increasing so ordering by timestamp stays deterministic
+                value = datetime.fromtimestamp(next(self._clock), tz=timezone.utc)
+            elif isinstance(value, firestore.Increment):
+                value = (current.get(key) or 0) + value.value
+            current[key] = value
+        self.docs[path] = current
+
+
+@pytest.fixture
+def fake_firestore() -> FakeAsyncFirestore:
+    return FakeAsyncFirestore()
+
+
+@pytest.fixture
+def save_quote_text(tmp_path, monkeypatch):
+    """
+    報價單原文 blob 由 background-processor 寫入；測試直接使用該模組（local 模式寫入 tmp_path），
+    確保讀取端與實際寫入格式一致。回傳 async (text, page_count=None) -> manifest。
+    """
+    writer_path = os.path.join(ROOT_DIR, "..", "background-processor", "quote_text_store.py")
+    spec = importlib.util.spec_from_file_location("background_quote_text_store", writer_path)
+    writer = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(writer)
+    monkeypatch.setattr(writer, "QUOTE_TEXT_STORE", "local")
+    monkeypatch.setattr(writer, "QUOTE_TEXT_LOCAL_DIR", str(tmp_path))
+
+    async def save(text: str, page_count: Optional[int] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(writer.save_quote_text, text, page_count)
+
+    return save
+
+
+class ConversationTurnTestDouble:
+    """Forwards turn-scoped writes straight to the owning test double."""
+
+    def __init__(self, service: "ConversationServiceTestDouble", conversation_id: str):
+        self.service = service
+        self.conversation_id = conversation_id
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+    async def save_message(self, *args, **kwargs):
+        return await self.service.save_message(self.conversation_id, *args, **kwargs)
+
+    async def update_extracted_specs(self, specs):
+        await self.service.update_extracted_specs(self.conversation_id, specs)
+
+    async def update_missing_fields(self, missing_fields):
+        await self.service.update_missing_fields(self.conversation_id, missing_fields)
+
+    async def update_conversation_stage(self, stage: str, progress: int):
+        await self.service.update_conversation_stage(self.conversation_id, stage, progress)
+
+    async def update_history_summary(self, summary_state):
+        await self.service.update_history_summary(self.conversation_id, summary_state)
+
+    async def log_event(self, *args, **kwargs):
+        await self.service.log_event(self.conversation_id, *args, **kwargs)
+
+    async def checkpoint(self):
+        return 0
+
+
 class ConversationServiceTestDouble:
     """Minimal stub to avoid hitting real Firestore during tests."""
 
@@ -25,6 +254,7 @@ class ConversationServiceTestDouble:
         self.spec_state: Dict[str, Dict[str, Any]] = {}
         self.missing: Dict[str, List[Dict[str, Any]]] = {}
         self.stage_state: Dict[str, Dict[str, Any]] = {}
+        self.history_summaries: Dict[str, Dict[str, Any]] = {}
 
     async def create_project_in_db(self, project_id: str) -> None:
         self.created_projects.add(project_id)
@@ -43,6 +273,9 @@ class ConversationServiceTestDouble:
                 return conv
         return None
 
+    def turn(self, conversation_id: str) -> ConversationTurnTestDouble:
+        return ConversationTurnTestDouble(self, conversation_id)
+
     async def save_message(self, *args, **kwargs):
         return "msg-id"
 
@@ -62,9 +295,21 @@ class ConversationServiceTestDouble:
     async def update_conversation_stage(self, conversation_id: str, stage: str, progress: int):
         self.stage_state[conversation_id] = {"stage": stage, "progress": progress}
 
+    async def get_conversation_history(self, conversation_id: str, limit=100):
+        return []
+
+    async def get_history_summary(self, conversation_id: str):
+        return self.history_summaries.get(conversation_id)
+
+    async def update_history_summary(self, conversation_id: str, summary_state):
+        self.history_summaries[conversation_id] = summary_state
+
     async def log_event(self, *args, **kwargs):
         return None
 
+    async def close(self) -> None:
+        return None
+
 
 @pytest.fixture(autouse=True)
 def patch_conversation_service(monkeypatch):
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services.agent_orchestration import AGENT_ERROR, AGENT_OK, AGENT_TIMEOUT, AgentCall, run_agents
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _sleep_then(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def _boom():
+    raise ValueError("no quote")
+
+
+async def test_agents_run_concurrently_with_partial_results():
+    started = time.perf_counter()
+    outcomes = await run_agents([
+        AgentCall("contractor", lambda: _sleep_then("quote", 0.1), timeout=1),
+        AgentCall("designer", lambda: _sleep_then("image", 0.1), timeout=1),
+        AgentCall("slow", lambda: _sleep_then("late", 1), timeout=0.05),
+        AgentCall("broken", _boom, timeout=1),
+    ])
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.3
+    assert {name: outcome.status for name, outcome in outcomes.items()} == {
+        "contractor": AGENT_OK, "designer": AGENT_OK, "slow": AGENT_TIMEOUT, "broken": AGENT_ERROR,
+    }
+    assert outcomes["contractor"].value == "quote"
+    assert outcomes["slow"].value is None
+    assert outcomes["broken"].error == "ValueError: no quote"
+    assert outcomes["broken"].summary()["status"] == AGENT_ERROR
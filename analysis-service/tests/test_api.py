@@ -2,9 +2,13 @@ import pytest
 from httpx import AsyncClient, ASGITransport
 from main import app
 import io
+import json
+import openpyxl
 
 from src.services.spec_tracking import SPEC_FIELDS
 from src.services.database_service import db_service
+from src.services.upload_service import UploadService
+from src.services.quote_dispatch import InMemoryQuoteDispatcher
 
 
 def _fill_all_fields():
@@ -168,3 +172,305 @@ async def test_book_measurement_with_region(client: AsyncClient, patch_conversat
     assert data["status"] == "success"
     assert data["booking"]["name"] == "Test User"
     assert data["booking"]["region"] == "台北市"
+
+async def test_init_conversation_extracts_structured_quote(client: AsyncClient, patch_conversation_service, monkeypatch):
+    """報價單原文只擷取一次工項，分析時改送精簡工項表。"""
+    from src.api import projects
+
+    project_id = "test_project_quote"
+    patch_conversation_service.created_projects.add(project_id)
+    await db_service.update_project(project_id, {
+        "original_quote_content": "項目\t數量\t單位\t單價\n油漆\t30\t坪\t1800\n木地板\t20\t坪\t5500"
+    })
+    prompts = []
+
+    async def fake_analyze(quote_content):
+        prompts.append(quote_content)
+        return {"analysis": {"summary": "ok"}, "initial_response": "您好，我看過報價單了。"}
+
+    monkeypatch.setattr(projects.gemini_service, "analyze_quote_and_generate_initial_response", fake_analyze)
+
+    response = await client.post(f"/api/projects/{project_id}/conversation/init")
+
+    assert response.status_code == 200
+    assert response.json()["initialMessage"] == "您好，我看過報價單了。"
+    stored = (await db_service.get_project(project_id))["structured_quote"]
+    assert [item["item_name"] for item in stored["line_items"]] == ["油漆", "木地板"]
+    assert prompts[0].startswith("項目 | 規格 | 數量")
+
+
+async def test_init_conversation_lazy_loads_offloaded_quote_text(client: AsyncClient, patch_conversation_service, monkeypatch, save_quote_text):
+    """報價單原文存在壓縮 blob，project 只存 manifest；已有工項擷取結果時不再下載原文。"""
+    from src.api import projects
+    from src.services.quote_text_store import QuoteTextStore
+
+    store = QuoteTextStore()
+    monkeypatch.setattr(projects, "quote_text_store", store)
+    project_id = "test_project_offloaded_quote"
+    patch_conversation_service.created_projects.add(project_id)
+    manifest = await save_quote_text("項目\t數量\t單位\t單價\n油漆\t30\t坪\t1800", page_count=1)
+    await db_service.update_project(project_id, {"quote_text_manifest": manifest})
+    loads = []
+    original_load = store.load
+
+    async def counting_load(m):
+        loads.append(m["sha256"])
+        return await original_load(m)
+
+    async def fake_analyze(quote_content):
+        return {"analysis": {"summary": "ok"}, "initial_response": "您好"}
+
+    monkeypatch.setattr(store, "load", counting_load)
+    monkeypatch.setattr(projects.gemini_service, "analyze_quote_and_generate_initial_response", fake_analyze)
+
+    for _ in range(2):
+        response = await client.post(f"/api/projects/{project_id}/conversation/init")
+        assert response.json()["initialMessage"] == "您好"
+
+    project = await db_service.get_project(project_id)
+    assert "original_quote_content" not in project
+    assert project["structured_quote_source_sha256"] == manifest["sha256"]
+    assert loads == [manifest["sha256"]]
+
+
+async def test_init_conversation_falls_back_when_offloaded_quote_is_missing(client: AsyncClient, patch_conversation_service, monkeypatch, tmp_path):
+    """manifest 指向的 blob 不存在時不回 500，改用一般歡迎訊息。"""
+    from src.api import projects
+
+    project_id = "test_project_missing_quote_blob"
+    patch_conversation_service.created_projects.add(project_id)
+    await db_service.update_project(project_id, {"quote_text_manifest": {
+        "uri": (tmp_path / "nonexistent.txt.gz").as_uri(), "encoding": "gzip", "sha256": "0" * 64
+    }})
+
+    async def fail_analyze(quote_content):
+        raise AssertionError("analysis must not run without quote text")
+
+    monkeypatch.setattr(projects.gemini_service, "analyze_quote_and_generate_initial_response", fail_analyze)
+
+    response = await client.post(f"/api/projects/{project_id}/conversation/init")
+
+    assert response.status_code == 200
+    assert response.json()["initialMessage"].startswith("哈囉！我是 HouseIQ")
+
+
+async def test_background_spec_update_is_saved_before_it_is_streamed(fake_firestore, monkeypatch):
+    """前端收到 spec_update 即關閉連線，因此寫入必須在送出事件前完成。"""
+    from src.api import projects
+    from src.services.conversation_service import ConversationService
+
+    service = ConversationService(db=fake_firestore)
+    await service.create_conversation("conv-stream", "proj-stream")
+    monkeypatch.setattr(projects, "conversation_service", service)
+
+    class _BackgroundGemini:
+        spec_extraction_mode = "background"
+        model_name = "fake"
+
+        async def generate_response_stream(self, message, conversation_history, context):
+            yield ("了解，主臥翻新。", None)
+
+        async def evaluate_stage_completion(self, *args):
+            return {"stage_1_situation_purpose": True}
+
+    monkeypatch.setattr(projects, "gemini_service", _BackgroundGemini())
+    response = await projects.send_message_stream("proj-stream", message="想翻新主臥")
+    iterator = response.body_iterator
+    async for chunk in iterator:
+        if chunk == "event: spec_update\n":
+            break
+
+    # Already saved while the generator is suspended at the spec_update yield
+    specs = fake_firestore.docs["conversations/conv-stream/extracted_specs/current_version"]
+    assert specs["stage_1_situation_purpose"]["value"] == "completed"
+    assert fake_firestore.docs["conversations/conv-stream"]["progress"] > 0
+    # Disconnect right after the event, as useConversation.js does
+    await iterator.aclose()
+    await service.close()
+
+
+class _FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket, self.name, self.chunk_size = bucket, name, chunk_size
+
+    def upload_from_file(self, file_obj, size=None, content_type=None, if_generation_match=None):
+        assert if_generation_match == 0
+        assert self.chunk_size, "uploads should be resumable"
+        self.bucket.uploads.append((self.name, len(file_obj.read())))
+
+
+class _FakeStorageClient:
+    uploads = []
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name, chunk_size=None):
+        return _FakeBlob(self, name, chunk_size)
+
+
+def _xlsx_bytes(header=("項目", "數量", "單價")):
+    workbook = openpyxl.Workbook()
+    workbook.active.append(list(header))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def test_upload_is_content_addressed_and_deduplicated(client: AsyncClient, patch_conversation_service, monkeypatch):
+    """相同內容的報價單以 SHA-256 為 key；已有解析結果時直接回傳 already_analyzed。"""
+    from src.api import projects
+
+    service = UploadService(storage_client=_FakeStorageClient())
+    dispatcher = InMemoryQuoteDispatcher()
+    monkeypatch.setattr(projects, "upload_service", service)
+    monkeypatch.setattr(projects, "quote_dispatcher", dispatcher)
+    _FakeStorageClient.uploads.clear()
+    project_id = "test_project_dedup"
+    patch_conversation_service.created_projects.add(project_id)
+    content = _xlsx_bytes()
+    xlsx_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    first = await client.post(f"/api/projects/{project_id}/upload", files={"file": ("quote.xlsx", content, xlsx_type)})
+    sha = first.json()["content_sha256"]
+
+    assert first.json()["status"] == "queued"
+    assert _FakeStorageClient.uploads == [(f"quotes/sha256/{sha}", len(content))]
+    assert dispatcher.messages[0]["content_sha256"] == sha
+    assert {stage: stats["count"] for stage, stats in service.stats().items()} == {"preflight": 1, "upload": 1}
+
+    await db_service.save_quote_parse_result(sha, {"extracted_text": "項目\t數量\t單價"})
+    second = await client.post(f"/api/projects/{project_id}/upload", files={"file": ("again.xlsx", content, xlsx_type)})
+
+    assert second.json()["status"] == "already_analyzed"
+    assert len(dispatcher.messages) == 1
+    project = await db_service.get_project(project_id)
+    assert project["original_quote_content"] == "項目\t數量\t單價"
+    assert project["quote_content_sha256"] == sha
+
+
+async def test_upload_records_dispatch_outcome_in_event_log(client: AsyncClient, patch_conversation_service, monkeypatch):
+    """上傳不等待 Pub/Sub ack；發佈結果由回呼寫入事件日誌，失敗時專案標記為 failed。"""
+    from src.api import projects
+
+    events = []
+
+    async def record_event(conversation_id, event_type, **kwargs):
+        events.append((event_type, kwargs.get("severity", "info")))
+
+    monkeypatch.setattr(patch_conversation_service, "log_event", record_event)
+    monkeypatch.setattr(projects, "upload_service", UploadService(storage_client=_FakeStorageClient()))
+    project_id = "test_project_dispatch"
+    await patch_conversation_service.create_conversation("conv-dispatch", project_id)
+    xlsx_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    content = _xlsx_bytes(header=("品名", "數量", "單價", "複價"))
+
+    dispatcher = InMemoryQuoteDispatcher()
+    monkeypatch.setattr(projects, "quote_dispatcher", dispatcher)
+    response = await client.post(f"/api/projects/{project_id}/upload", files={"file": ("q.xlsx", content, xlsx_type)})
+    await dispatcher.drain()
+
+    assert response.json()["status"] == "queued"
+    assert events == [("quote_upload_queued", "info"), ("quote_upload_published", "info")]
+
+    events.clear()
+    failing = InMemoryQuoteDispatcher(fail_with=RuntimeError("topic not found"))
+    monkeypatch.setattr(projects, "quote_dispatcher", failing)
+    response = await client.post(f"/api/projects/{project_id}/upload", files={"file": ("q.xlsx", content, xlsx_type)})
+    await failing.drain()
+
+    assert response.json()["status"] == "queued"
+    assert events == [("quote_upload_queued", "info"), ("quote_dispatch_failed", "error")]
+    assert (await db_service.get_project(project_id))["quote_analysis_status"] == "failed"
+    assert failing.stats()["failed"] == 1
+
+
+async def test_complete_conversation_fans_out_agents_with_one_write(client: AsyncClient, patch_conversation_service, monkeypatch):
+    """預算 / 統包商 / 設計師並行執行；單一 agent 失敗時仍回傳其餘結果，並只寫入一次。"""
+    from src.api import projects
+
+    project_id = "proj-fanout"
+    patch_conversation_service.created_projects.add(project_id)
+    patch_conversation_service.conversations["conv-fanout"] = {"conversation_id": "conv-fanout", "project_id": project_id}
+    await db_service.update_project(project_id, {"project_id": project_id, "extracted_specs": _fill_all_fields()})
+
+    async def failing_designer(brief):
+        raise RuntimeError("image service down")
+
+    async def budget(**kwargs):
+        return {"suggestions": ["改用系統櫃"]}
+
+    monkeypatch.setattr(projects.designer_agent, "run", failing_designer)
+    monkeypatch.setattr(projects.gemini_service, "generate_budget_tradeoff_suggestions", budget)
+    writes = []
+    original_update = db_service.update_project
+
+    async def counting_update(pid, data):
+        writes.append(sorted(data))
+        return await original_update(pid, data)
+
+    monkeypatch.setattr(db_service, "update_project", counting_update)
+
+    resp = await client.post(f"/api/projects/{project_id}/conversation/complete")
+
+    assert resp.status_code == 200
+    analysis = resp.json()["analysis"]
+    assert analysis["quote"] is not None
+    assert analysis["budget_tradeoffs"] == {"suggestions": ["改用系統櫃"]}
+    assert analysis["rendering_url"] is None
+    assert analysis["agent_errors"] == {"designer": "RuntimeError: image service down"}
+    assert len(writes) == 1 and "generated_quote" in writes[0] and "final_rendering_url" not in writes[0]
+    project = await db_service.get_project(project_id)
+    assert project["agent_status"]["designer"]["status"] == "error"
+
+
+async def test_complete_conversation_job_mode_streams_progress(client: AsyncClient, patch_conversation_service, monkeypatch):
+    """mode=job 立即回傳 job id；進度以 message_chunk SSE 串流，結果寫入專案供 analysis-result 讀取。"""
+    from src.api import projects
+
+    project_id = "proj-complete-job"
+    patch_conversation_service.created_projects.add(project_id)
+    patch_conversation_service.conversations["conv-job"] = {"conversation_id": "conv-job", "project_id": project_id}
+    await db_service.update_project(project_id, {"project_id": project_id, "extracted_specs": _fill_all_fields()})
+
+    async def budget(**kwargs):
+        return {"suggestions": ["保留舊地板"]}
+
+    monkeypatch.setattr(projects.gemini_service, "generate_budget_tradeoff_suggestions", budget)
+
+    await projects.task_dispatcher.start()
+    try:
+        resp = await client.post(f"/api/projects/{project_id}/conversation/complete", params={"mode": "job"})
+        assert resp.status_code == 202
+        job = resp.json()
+        stream = await client.get(job["stream_url"])
+    finally:
+        await projects.task_dispatcher.stop()
+
+    frames = [block.splitlines() for block in stream.text.strip().split("\n\n")]
+    assert {lines[0] for lines in frames} == {"event: message_chunk"}
+    events = [json.loads(lines[1][len("data: "):]) for lines in frames]
+    progress = [event["metadata"]["progress"] for event in events]
+    assert progress == sorted(progress) and progress[-1] == 100
+    assert [event["isComplete"] for event in events].count(True) == 1
+    final = events[-1]["metadata"]
+    assert final["status"] == "succeeded"
+    assert final["result"]["analysis"]["budget_tradeoffs"] == {"suggestions": ["保留舊地板"]}
+
+    status = await client.get(f"/api/projects/{project_id}/conversation/complete/jobs/{job['job_id']}")
+    assert status.json()["status"] == "succeeded"
+    result = await client.get(f"/api/projects/{project_id}/analysis-result")
+    assert result.status_code == 200 and result.json()["quote"] is not None
+    missing = await client.get(f"/api/projects/other-project/conversation/complete/jobs/{job['job_id']}")
+    assert missing.status_code == 404
+
+
+async def test_mock_db_update_project_mirrors_read_back_contract():
+    result = await db_service.update_project("proj-write-meta", {"booking": {"name": "A", "phone": "1"}, "status": "booked"})
+    assert result.document is None and result.update_time is not None
+
+    full = await db_service.update_project("proj-write-meta", {"status": "confirmed"}, read_back=True)
+    masked = await db_service.update_project("proj-write-meta", {}, read_back=["booking.name", "missing"])
+
+    assert full.document["status"] == "confirmed"
+    assert masked.document == {"booking": {"name": "A"}}
@@ -0,0 +1,32 @@
+import json
+
+from tests.benchmark_message_stream import main, percentile, run_benchmark
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 99) == 3.0
+
+
+async def test_benchmark_reports_latency_and_firestore_ops():
+    report = await run_benchmark(turns=6, concurrency=3, first_token_delay=0, tokens_per_second=0)
+
+    assert report["completed_turns"] == 6
+    assert report["errors"] == 0
+    for metric in ("time_to_first_chunk_ms", "time_to_complete_ms", "total_turn_ms"):
+        assert report[metric]["count"] == 6
+        assert report[metric]["p50"] <= report[metric]["p99"]
+    assert report["firestore_ops_per_turn"]["batch_commits"] > 0
+
+
+def test_cli_writes_json_report(tmp_path):
+    output = tmp_path / "bench.json"
+    main(["--turns", "2", "--concurrency", "1", "--first-token-delay", "0",
+          "--tokens-per-second", "0", "--output", str(output)])
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert report["config"]["concurrency"] == 1
+    assert report["completed_turns"] == 2
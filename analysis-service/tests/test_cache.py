@@ -0,0 +1,53 @@
+from src.services.cache import LRUTTLCache, MISSING
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUTTLCache(10, ttl_seconds=30, clock=clock)
+    cache.set("proj-1", True)
+
+    clock.now = 29
+    assert cache.get("proj-1") is True
+    clock.now = 30
+    assert cache.get("proj-1") is MISSING
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_negative_entries_use_shorter_ttl():
+    clock = FakeClock()
+    cache = LRUTTLCache(10, ttl_seconds=30, negative_ttl_seconds=5, clock=clock)
+    cache.set("missing", None)
+
+    assert cache.get("missing") is None
+    clock.now = 5
+    assert cache.get("missing") is MISSING
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUTTLCache(2, ttl_seconds=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_removes_entry():
+    cache = LRUTTLCache(10, ttl_seconds=30)
+    cache.set("a", 1)
+    cache.invalidate("a")
+
+    assert cache.get("a") is MISSING
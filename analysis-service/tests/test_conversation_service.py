@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.cloud import firestore
+
+from src.services.conversation_service import ConversationService
+from src.services.history_cache import HISTORY_CACHE_CLOCK_SKEW
+
+
+@pytest.fixture
+async def service(fake_firestore):
+    service = ConversationService(db=fake_firestore)
+    await service.create_conversation("conv-1", "proj-1")
+    fake_firestore.ops.update({"reads": 0, "writes": 0, "batch_commits": 0})
+    yield service
+    await service.close()
+
+
+async def test_turn_commits_all_mutations_in_one_batch(service, fake_firestore):
+    async with service.turn("conv-1") as turn:
+        message_id = await turn.save_message("user", "想翻新主臥")
+        await turn.log_event("user_message_received", source="user")
+        await turn.update_extracted_specs({"stage_1_situation_purpose": {"value": "completed", "confidence": 1.0}})
+        await turn.update_missing_fields([{"id": "stage_2_scope_condition"}])
+        await turn.update_conversation_stage("situation_purpose", 20)
+        await turn.save_message("agent", "了解！")
+        await turn.log_event("agent_stream_completed", source="agent")
+        assert fake_firestore.ops["batch_commits"] == 0
+
+    assert fake_firestore.ops["batch_commits"] == 1
+    conversation = fake_firestore.docs["conversations/conv-1"]
+    assert await service.get_message_count("conv-1") == 2
+    assert conversation["stage"] == "situation_purpose"
+    assert conversation["progress"] == 20
+    assert conversation["missing_fields"] == [{"id": "stage_2_scope_condition"}]
+    assert "message_count" not in conversation and "last_event" not in conversation
+    assert (await service.get_last_event("conv-1"))["last_event"] == "agent_stream_completed"
+    assert fake_firestore.docs[f"conversations/conv-1/messages/{message_id}"]["content"] == "想翻新主臥"
+    assert "stage_1_situation_purpose" in fake_firestore.docs["conversations/conv-1/extracted_specs/current_version"]
+
+
+async def test_checkpoint_commits_and_turn_continues(service, fake_firestore):
+    async with service.turn("conv-1") as turn:
+        await turn.save_message("user", "hi")
+        assert await turn.checkpoint() == 2
+        assert await turn.checkpoint() == 0
+        await turn.save_message("agent", "hello")
+
+    assert fake_firestore.ops["batch_commits"] == 2
+    assert await service.get_message_count("conv-1") == 2
+
+
+async def test_turn_commits_partial_work_when_stream_fails(service, fake_firestore):
+    with pytest.raises(RuntimeError):
+        async with service.turn("conv-1") as turn:
+            await turn.save_message("user", "hi")
+            raise RuntimeError("gemini timeout")
+
+    assert await service.get_message_count("conv-1") == 1
+
+
+async def test_message_only_turns_do_not_write_the_conversation_document(service, fake_firestore):
+    fake_firestore.committed_batches.clear()
+    for shard in range(3):
+        async with service.turn("conv-1") as turn:
+            await turn.save_message("user", f"訊息 {shard}")
+            await turn.log_event("user_message_received", source="user")
+    await service.save_message("conv-1", "agent", "好的")
+
+    written_paths = {path for batch in fake_firestore.committed_batches for path, _, _ in batch}
+    assert "conversations/conv-1" not in written_paths
+    assert await service.get_message_count("conv-1") == 4
+
+
+async def test_message_count_includes_pre_sharding_value(service, fake_firestore):
+    fake_firestore.docs["conversations/conv-1"]["message_count"] = 7
+    counter = service.message_counter("conv-1")
+    batch = fake_firestore.batch()
+    counter.increment_in(batch, 2, shard=0)
+    counter.increment_in(batch, 1, shard=counter.num_shards + 1)
+    await batch.commit()
+
+    assert await counter.total() == 10
+    assert fake_firestore.docs["conversations/conv-1/counter_shards/message_count-1"]["count"] == 1
+
+
+async def test_project_exists_is_cached_including_misses(service, fake_firestore):
+    await service.create_project_in_db("proj-cached")
+    fake_firestore.ops["reads"] = 0
+
+    assert await service.project_exists("proj-cached") is True
+    assert await service.project_exists("proj-missing") is False
+    assert await service.project_exists("proj-missing") is False
+    assert fake_firestore.ops["reads"] == 1
+
+    stats = service.cache_stats()["project_exists"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+async def test_project_conversation_lookup_is_cached_and_refreshed_on_create(service, fake_firestore):
+    assert (await service.get_project_conversation("proj-1"))["conversation_id"] == "conv-1"
+    assert (await service.get_project_conversation("proj-1"))["conversation_id"] == "conv-1"
+    assert fake_firestore.ops["queries"] == 0  # populated by create_conversation in the fixture
+
+    assert await service.get_project_conversation("proj-2") is None
+    await service.create_conversation("conv-2", "proj-2")
+    assert (await service.get_project_conversation("proj-2"))["conversation_id"] == "conv-2"
+    assert fake_firestore.ops["queries"] == 1
+
+
+async def test_project_conversation_lookup_uses_project_pointer(service, fake_firestore):
+    assert fake_firestore.docs["projects/proj-1"]["conversation_id"] == "conv-1"
+    service.project_conversation_cache.clear()
+    fake_firestore.ops.update({"reads": 0, "queries": 0})
+
+    conversation = await service.get_project_conversation("proj-1")
+
+    assert conversation["conversation_id"] == "conv-1"
+    assert fake_firestore.ops["queries"] == 0
+    assert fake_firestore.ops["reads"] == 2
+
+
+async def test_legacy_conversation_without_pointer_is_found_and_backfilled(service, fake_firestore):
+    fake_firestore.docs["conversations/conv-legacy"] = {"conversation_id": "conv-legacy", "project_id": "proj-legacy"}
+
+    conversation = await service.get_project_conversation("proj-legacy")
+
+    assert conversation["conversation_id"] == "conv-legacy"
+    assert fake_firestore.docs["projects/proj-legacy"]["conversation_id"] == "conv-legacy"
+
+
+async def test_history_is_served_from_cache_after_first_load(service, fake_firestore):
+    await service.save_message("conv-1", "user", "第一則")
+    assert [m["content"] for m in await service.get_conversation_history("conv-1")] == ["第一則"]
+    fake_firestore.ops.update({"reads": 0, "queries": 0})
+
+    async with service.turn("conv-1") as turn:
+        await turn.save_message("user", "第二則")
+        await turn.save_message("agent", "回覆")
+    history = await service.get_conversation_history("conv-1")
+
+    assert [m["content"] for m in history] == ["第一則", "第二則", "回覆"]
+    assert fake_firestore.ops["queries"] == 0
+    assert fake_firestore.ops["reads"] == 0
+
+
+async def test_stale_history_fetches_only_newer_messages(service, fake_firestore):
+    await service.save_message("conv-1", "user", "第一則")
+    await service.get_conversation_history("conv-1")
+    await service.save_message("conv-1", "agent", "本地回覆")
+
+    # Another instance writes directly to Firestore
+    await fake_firestore.collection("conversations").document("conv-1").collection("messages").add({
+        "sender": "user", "content": "其他實例", "timestamp": firestore.SERVER_TIMESTAMP, "metadata": {}
+    })
+    service.history_cache.sync_interval = 0
+    fake_firestore.ops["reads"] = 0
+
+    history = await service.get_conversation_history("conv-1")
+
+    assert [m["content"] for m in history] == ["第一則", "本地回覆", "其他實例"]
+    assert fake_firestore.ops["reads"] == 2  # only the two messages newer than the synced timestamp
+    assert service.cache_stats()["conversation_history"]["delta_syncs"] == 1
+
+
+async def test_history_summary_is_cached_with_the_history(service, fake_firestore):
+    await service.update_history_summary("conv-1", {"text": "舊摘要"})
+    await service.get_conversation_history("conv-1")
+    fake_firestore.ops["reads"] = 0
+
+    assert await service.get_history_summary("conv-1") == {"text": "舊摘要"}
+    async with service.turn("conv-1") as turn:
+        await turn.update_history_summary({"text": "新摘要"})
+    assert await service.get_history_summary("conv-1") == {"text": "新摘要"}
+    assert fake_firestore.ops["reads"] == 0
+
+
+async def test_delta_messages_are_inserted_by_server_timestamp(service, fake_firestore):
+    await service.save_message("conv-1", "user", "第一則")
+    await service.get_conversation_history("conv-1")
+
+    # Another instance writes before this instance's next message
+    await fake_firestore.collection("conversations").document("conv-1").collection("messages").add({
+        "sender": "user", "content": "其他實例", "timestamp": firestore.SERVER_TIMESTAMP, "metadata": {}
+    })
+    await service.save_message("conv-1", "agent", "本地回覆")
+    service.history_cache.sync_interval = 0
+
+    history = await service.get_conversation_history("conv-1")
+
+    assert [m["content"] for m in history] == ["第一則", "其他實例", "本地回覆"]
+
+
+async def test_empty_first_load_seeds_the_delta_timestamp(service, fake_firestore):
+    before = datetime.now(timezone.utc)
+    assert await service.get_conversation_history("conv-1") == []
+
+    seeded = service.history_cache.get("conv-1").last_synced_timestamp
+    assert seeded is not None
+    assert seeded <= before
+    assert before - seeded <= timedelta(seconds=HISTORY_CACHE_CLOCK_SKEW + 1)
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from src.services.event_log_writer import BufferedEventLogWriter
+
+
+def _event(event_type: str, severity: str = "info"):
+    return {"type": event_type, "severity": severity, "payload": {}}
+
+
+def _writer(db, **kwargs):
+    return BufferedEventLogWriter(db, "conversations", **kwargs)
+
+
+async def test_flush_coalesces_parent_updates(fake_firestore):
+    writer = _writer(fake_firestore, batch_size=100, flush_interval=10)
+    writer.enqueue("conv-1", _event("user_message_received"))
+    writer.enqueue("conv-1", _event("agent_stream_started"))
+    writer.enqueue("conv-2", _event("booking_created"))
+    writer.enqueue("conv-1", _event("agent_stream_error", "error"))
+
+    assert fake_firestore.committed_batches == []
+    assert await writer.flush() == 4
+
+    assert fake_firestore.ops["batch_commits"] == 1
+    writes = fake_firestore.committed_batches[0]
+    event_writes = [w for w in writes if "/events/" in w[0]]
+    activity_writes = {w[0]: w[1] for w in writes if "/events/" not in w[0]}
+    assert len(event_writes) == 4
+    assert set(activity_writes) == {"conversations/conv-1/activity/last_event", "conversations/conv-2/activity/last_event"}
+    assert fake_firestore.docs["conversations/conv-1/activity/last_event"]["last_event"] == "agent_stream_error"
+    assert fake_firestore.docs["conversations/conv-1/activity/last_event"]["last_event_severity"] == "error"
+    assert all("logged_at" in w[1] for w in event_writes)
+    await writer.close()
+
+
+async def test_size_trigger_flushes_without_waiting_for_window(fake_firestore):
+    writer = _writer(fake_firestore, batch_size=2, flush_interval=10)
+    writer.enqueue("conv-1", _event("a"))
+    writer.enqueue("conv-1", _event("b"))
+    await asyncio.sleep(0)
+
+    assert fake_firestore.ops["batch_commits"] == 1
+    assert writer.pending_count == 0
+    await writer.close()
+
+
+async def test_time_window_trigger(fake_firestore):
+    writer = _writer(fake_firestore, batch_size=100, flush_interval=0.01)
+    writer.enqueue("conv-1", _event("a"))
+    await asyncio.sleep(0.05)
+
+    assert fake_firestore.ops["batch_commits"] == 1
+    await writer.close()
+
+
+async def test_close_flushes_remaining_events(fake_firestore):
+    writer = _writer(fake_firestore, batch_size=100, flush_interval=10)
+    writer.enqueue("conv-1", _event("a"))
+    await writer.close()
+
+    assert fake_firestore.ops["batch_commits"] == 1
+    assert writer.pending_count == 0
+
+
+async def test_failed_commit_is_logged_not_raised(fake_firestore):
+    fake_firestore.fail_commits = True
+    writer = _writer(fake_firestore, batch_size=100, flush_interval=10)
+    writer.enqueue("conv-1", _event("a"))
+
+    assert await writer.flush() == 0
+    assert writer.pending_count == 0
+
+
+async def test_flushes_rotate_across_registry_channels():
+    from src.services.firestore_client import FirestoreClientRegistry
+    from tests.conftest import FakeAsyncFirestore
+
+    registry = FirestoreClientRegistry(channels=2, client_factory=FakeAsyncFirestore)
+    writer = _writer(registry, batch_size=100, flush_interval=10)
+    for conversation_id in ("conv-1", "conv-2"):
+        writer.enqueue(conversation_id, _event("user_message_received"))
+        await writer.flush()
+
+    clients = [client._target for client in registry._clients]
+    assert [client.ops["batch_commits"] for client in clients] == [1, 1]
+    assert [sorted(client.docs) for client in clients] == [
+        ["conversations/conv-1/activity/last_event", "conversations/conv-1/events/auto-1"],
+        ["conversations/conv-2/activity/last_event", "conversations/conv-2/events/auto-1"],
+    ]
@@ -0,0 +1,75 @@
+import pytest
+
+from src.services.database_service import FirestoreDBService
+from src.services.firestore_client import FirestoreClientRegistry
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_registry_rotates_channels_per_call_and_counts_rpcs():
+    from tests.conftest import FakeAsyncFirestore
+
+    registry = FirestoreClientRegistry(channels=3, client_factory=FakeAsyncFirestore)
+    service = FirestoreDBService(client=registry)
+
+    for index in range(6):
+        await service.update_project(f"p{index}", {"status": "created"})
+    refs = [registry.collection("projects").document(f"p{index}") for index in range(2)]
+    snapshots = [snapshot async for snapshot in registry.get_all(refs)]
+
+    clients = [client._target for client in registry._clients]
+    assert registry.stats()["open_clients"] == 3
+    assert [client.ops["writes"] for client in clients] == [2, 2, 2]
+    assert len(snapshots) == 2
+    rpcs = registry.stats()["rpcs"]
+    assert (rpcs["started"], rpcs["completed"], rpcs["in_flight"]) == (7, 7, 0)
+    assert rpcs["by_method"]["FakeDocumentRef.set"]["started"] == 6
+
+
+async def test_counted_refs_work_with_real_async_client_batches():
+    registry = FirestoreClientRegistry(channels=2, project="test")
+    batch = registry.batch()
+    batch.set(registry.collection("conversations").document("c1"), {"stage": "greeting"})
+    batch.set(registry.document("projects/p1"), {"conversation_id": "c1"}, merge=True)
+
+    assert len(batch._target._write_pbs) == 2
+    assert registry.stats()["open_clients"] == 2
+
+
+async def test_firestore_db_service_uses_async_client(fake_firestore):
+    service = FirestoreDBService(client=fake_firestore)
+
+    await service.update_project("p1", {"status": "booked"})
+    await service.save_quote_parse_result("abc", {"extracted_text": "報價"})
+
+    assert (await service.get_project("p1"))["status"] == "booked"
+    assert (await service.get_quote_parse_result("abc"))["extracted_text"] == "報價"
+
+
+async def test_update_project_is_read_free_unless_read_back_requested(fake_firestore):
+    service = FirestoreDBService(client=fake_firestore)
+
+    result = await service.update_project("p2", {"booking": {"name": "王小明", "phone": "0912"}, "status": "booked"})
+    assert fake_firestore.ops == {"reads": 0, "writes": 1, "queries": 0, "batch_commits": 0}
+    assert result.project_id == "p2" and result.document is None
+
+    masked = await service.update_project("p2", {"status": "confirmed"}, read_back=["status"])
+    assert masked.document == {"status": "confirmed"}
+    assert fake_firestore.ops["reads"] == 1
+
+
+async def test_project_views_read_only_their_field_mask(fake_firestore):
+    service = FirestoreDBService(client=fake_firestore)
+    await service.update_project("p3", {
+        "original_quote_content": "x" * 10_000,
+        "extracted_specs": {"area": 30},
+        "quote_analysis": {"risk": "low"},
+        "conversation_summary": "摘要",
+    })
+
+    inputs = await service.get_completion_inputs("p3")
+    result = await service.get_analysis_result("p3")
+
+    assert inputs.extracted_specs == {"area": 30} and inputs.quote_analysis == {"risk": "low"}
+    assert result.conversation_summary == "摘要" and result.generated_quote is None
+    assert await service.get_quote_context("missing") is None
@@ -0,0 +1,85 @@
+from src.services.history_compaction import (
+    HistoryCompactor,
+    estimate_tokens,
+    extractive_summary,
+    message_tokens,
+)
+
+
+def _history(count: int, content: str = "我們家是三十年的老公寓，想重新整理主臥和浴室"):
+    return [
+        {"id": f"m{i}", "sender": "user" if i % 2 == 0 else "agent", "content": f"{i}:{content}"}
+        for i in range(count)
+    ]
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous_summary, messages):
+        self.calls.append([m["id"] for m in messages])
+        return await extractive_summary(previous_summary, messages)
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("浴室防水工程") == 6
+    assert estimate_tokens("waterproofing") == 4
+    assert estimate_tokens("") == 0
+    # The old len(text)//4 heuristic would report 1 token here
+    assert estimate_tokens("壁癌處理") > len("壁癌處理") // 4
+
+
+async def test_history_within_budget_is_untouched():
+    history = _history(4)
+    summarizer = RecordingSummarizer()
+
+    result = await HistoryCompactor(max_tokens=1000).compact(history, None, summarizer)
+
+    assert result.messages == history
+    assert result.summary_state == {}
+    assert not result.summary_changed
+    assert summarizer.calls == []
+
+
+async def test_older_messages_are_folded_into_summary_within_budget():
+    history = _history(30)
+    summarizer = RecordingSummarizer()
+    compactor = HistoryCompactor(max_tokens=400)
+
+    result = await compactor.compact(history, None, summarizer)
+
+    assert result.summary_changed
+    assert result.messages == history[-len(result.messages):]
+    assert result.summary_state["covered_through_id"] == history[-len(result.messages) - 1]["id"]
+    assert result.total_tokens <= 400
+    assert sum(message_tokens(m) for m in result.messages) <= 400 - compactor.summary_budget
+
+
+async def test_summary_is_updated_incrementally():
+    history = _history(30)
+    summarizer = RecordingSummarizer()
+    compactor = HistoryCompactor(max_tokens=400)
+    first = await compactor.compact(history, None, summarizer)
+
+    history += _history(34)[30:]
+    second = await compactor.compact(history, first.summary_state, summarizer)
+
+    assert len(summarizer.calls) == 2
+    # Only messages evicted since the previous summary are sent to the summarizer
+    assert summarizer.calls[1][0] == history[first.summary_state["covered_count"]]["id"]
+    assert second.summary_state["covered_count"] > first.summary_state["covered_count"]
+    assert second.total_tokens <= 400
+
+
+def test_fit_uses_current_summary_without_summarizing():
+    history = _history(30)
+    compactor = HistoryCompactor(max_tokens=400)
+    summary_state = {"text": "使用者想翻新老公寓", "covered_through_id": "m3", "covered_count": 4}
+
+    result = compactor.fit(history, summary_state)
+
+    assert result.summary_text == "使用者想翻新老公寓"
+    assert not result.summary_changed
+    assert result.messages == history[-len(result.messages):]
+    assert result.total_tokens <= 400
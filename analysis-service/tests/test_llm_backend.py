@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from src.agents.client_manager_agent import ClientManagerAgent
+from src.agents.contractor_agent import ContractorAgent
+from src.models.project import ProjectBrief
+from src.services.gemini_service import GeminiLLMService
+from src.services.llm_backend import LLMBackend, LLMBackendError, LocalLLMBackend
+
+
+def _brief():
+    return ProjectBrief(
+        project_id="proj-llm",
+        user_profile={"house_type": "中古屋", "budget": "100萬"},
+        style_preferences=["北歐風"],
+        key_requirements=["浴室乾濕分離"],
+        original_quote_analysis={},
+    )
+
+
+def test_local_backend_satisfies_protocol():
+    assert isinstance(LocalLLMBackend(), LLMBackend)
+
+
+async def test_local_stream_respects_first_token_delay_and_rate():
+    backend = LocalLLMBackend(
+        first_token_delay=0.05, tokens_per_second=2000, chunk_tokens=4,
+        responder=lambda prompt, context: "浴室防水需要做到一百八十公分",
+    )
+
+    started = time.perf_counter()
+    chunks = []
+    first_chunk_at = None
+    async for text in backend.stream_text("問題"):
+        first_chunk_at = first_chunk_at or time.perf_counter() - started
+        chunks.append(text)
+
+    assert "".join(chunks) == "浴室防水需要做到一百八十公分"
+    assert len(chunks) == 4
+    assert first_chunk_at >= 0.05
+
+
+async def test_local_stream_injects_failures():
+    always_fails = LocalLLMBackend.instant(seed=1)
+    always_fails.failure_rate = 1.0
+    with pytest.raises(LLMBackendError):
+        await always_fails.generate_text("hi")
+
+    mid_stream = LocalLLMBackend.instant(chunk_tokens=2, fail_after_tokens=4,
+                                         responder=lambda prompt, context: "一二三四五六七八")
+    received = []
+    with pytest.raises(LLMBackendError):
+        async for text in mid_stream.stream_text("hi"):
+            received.append(text)
+    assert "".join(received) == "一二三四"
+
+
+async def test_local_generate_json_parses_text_replies():
+    backend = LocalLLMBackend.instant(responder=lambda prompt, context: '結果：{"is_complete": false}')
+    assert await backend.generate_json("evaluate") == {"is_complete": False}
+
+    backend = LocalLLMBackend.instant(responder=lambda prompt, context: "沒有 JSON")
+    with pytest.raises(LLMBackendError):
+        await backend.generate_json("evaluate")
+
+
+async def test_gemini_service_streams_through_local_backend():
+    service = GeminiLLMService(backend=LocalLLMBackend.instant())
+    service.spec_extraction_mode = "inline"
+
+    results = [item async for item in service.generate_response_stream("你好", [], {"extracted_specs": {}})]
+
+    assert "".join(text for text, _ in results)
+    assert results[-1] == ("", {"stage_1_situation_purpose": True})
+
+
+async def test_agents_use_injected_backend():
+    backend = LocalLLMBackend.instant()
+    quote = await ContractorAgent(llm=backend).run(_brief())
+    reply = await ClientManagerAgent(llm=backend).run({"project_id": "proj-llm", "user_message": "想要北歐風"})
+
+    assert quote.total_price > 0
+    assert reply["message"]
+    assert backend.calls == 2
+
+
+async def test_history_summary_is_refreshed_after_streaming_not_before():
+    backend = LocalLLMBackend.instant()
+    service = GeminiLLMService(backend=backend)
+    service.spec_extraction_mode = "background"
+    history = [
+        {"id": f"m{i}", "sender": "user" if i % 2 == 0 else "agent", "content": "老公寓浴室漏水要處理" * 40}
+        for i in range(30)
+    ]
+
+    results = [item async for item in service.generate_response_stream("你好", history, {"extracted_specs": {}})]
+
+    # Only the reply is generated while the user waits; no summarization call, no summary on the stream
+    assert backend.calls == 1
+    assert all(update is None for _, update in results)
+
+    summary_state = await service.refresh_history_summary(history)
+    assert summary_state["covered_count"] > 0 and summary_state["text"]
+    assert await service.refresh_history_summary(history, summary_state) is None
+
+
+async def test_client_manager_passes_its_context_to_the_backend():
+    contexts = []
+
+    def responder(prompt, context):
+        contexts.append(context)
+        return "請問您偏好哪種收納方式？"
+
+    backend = LocalLLMBackend.instant(responder=responder)
+    await ClientManagerAgent(llm=backend).run({"project_id": "proj-llm", "user_message": "想要北歐風"})
+
+    assert contexts == [{"project_id": "proj-llm", "user_message": "想要北歐風"}]
+
+
+async def test_budget_tradeoff_suggestions_use_the_backend():
+    service = GeminiLLMService(backend=LocalLLMBackend.instant())
+
+    result = await service.generate_budget_tradeoff_suggestions(
+        extracted_specs={"budget_range": {"value": "100萬"}}, quote_analysis={"summary": "拆除與水電"}
+    )
+
+    assert result["suggestions"] and all(isinstance(item, str) for item in result["suggestions"])
+    assert result["notes"]
+
+    broken = GeminiLLMService(backend=LocalLLMBackend.instant(responder=lambda prompt, context: {"notes": "缺少建議"}))
+    with pytest.raises(LLMBackendError):
+        await broken.generate_budget_tradeoff_suggestions(extracted_specs={}, quote_analysis={})
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from main import app
+from src.api import projects
+
+pytestmark = pytest.mark.asyncio
+
+
+class GeminiStub:
+    model_name = "gemini-stub"
+
+    def __init__(self, mode: str, stage_update=None):
+        self.spec_extraction_mode = mode
+        self.stage_update = stage_update or {}
+        self.evaluations = 0
+
+    async def generate_response_stream(self, message, conversation_history, context):
+        for chunk in ("了解", "，", "請問預算大概多少？"):
+            yield (chunk, None)
+        if self.spec_extraction_mode != "background" and self.stage_update:
+            yield ("", dict(self.stage_update))
+
+    async def evaluate_stage_completion(self, conversation_history, message, response_text, current_specs):
+        self.evaluations += 1
+        return dict(self.stage_update)
+
+
+def _parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def _start_conversation(service, project_id: str):
+    service.created_projects.add(project_id)
+    await service.create_conversation(f"conv-{project_id}", project_id)
+
+
+async def test_background_mode_sends_spec_update_after_completion(client, patch_conversation_service, monkeypatch):
+    gemini = GeminiStub("background", {"stage_1_situation_purpose": True})
+    monkeypatch.setattr(projects, "gemini_service", gemini)
+    await _start_conversation(patch_conversation_service, "proj-stream-1")
+
+    resp = await client.get("/api/projects/proj-stream-1/conversation/message-stream", params={"message": "老公寓翻新"})
+    events = _parse_sse(resp.text)
+
+    complete_index = next(i for i, (name, data) in enumerate(events) if data.get("isComplete"))
+    assert events[complete_index][1]["metadata"]["specUpdatePending"] is True
+    assert events[-1][0] == "spec_update"
+    assert complete_index == len(events) - 2
+    assert events[-1][1]["changed"] is True
+    assert events[-1][1]["metadata"]["progress"] == 20
+    assert gemini.evaluations == 1
+    assert "stage_1_situation_purpose" in patch_conversation_service.spec_state["conv-proj-stream-1"]
+
+
+async def test_inline_mode_completes_without_spec_update_event(client, patch_conversation_service, monkeypatch):
+    gemini = GeminiStub("inline", {"stage_1_situation_purpose": True})
+    monkeypatch.setattr(projects, "gemini_service", gemini)
+    await _start_conversation(patch_conversation_service, "proj-stream-2")
+
+    resp = await client.get("/api/projects/proj-stream-2/conversation/message-stream", params={"message": "老公寓翻新"})
+    events = _parse_sse(resp.text)
+
+    assert [name for name, _ in events] == ["message_chunk"] * 4
+    assert events[-1][1]["isComplete"] is True
+    assert events[-1][1]["metadata"]["specUpdatePending"] is False
+    assert events[-1][1]["metadata"]["progress"] == 20
+    assert gemini.evaluations == 0
+
+
+async def test_history_summary_is_refreshed_in_a_job_after_the_reply(client, patch_conversation_service, monkeypatch):
+    gemini = GeminiStub("inline")
+    refreshed = []
+
+    async def refresh_history_summary(conversation_history, summary_state=None):
+        refreshed.append(summary_state)
+        return {"text": "新摘要"}
+
+    gemini.refresh_history_summary = refresh_history_summary
+    monkeypatch.setattr(projects, "gemini_service", gemini)
+    submitted = []
+
+    async def submit(task_type, payload=None, **kwargs):
+        submitted.append((task_type, payload, kwargs.get("idempotency_key")))
+
+    monkeypatch.setattr(projects.task_dispatcher, "submit", submit)
+    await _start_conversation(patch_conversation_service, "proj-stream-4")
+    patch_conversation_service.history_summaries["conv-proj-stream-4"] = {"text": "舊摘要"}
+
+    await client.get("/api/projects/proj-stream-4/conversation/message-stream", params={"message": "老公寓翻新"})
+
+    # Nothing is summarized while streaming; the job is queued once the turn is done
+    assert refreshed == []
+    payload = {"conversation_id": "conv-proj-stream-4", "last_message_id": "msg-id"}
+    key = f"{projects.HISTORY_SUMMARY_TASK_TYPE}:conv-proj-stream-4:msg-id"
+    assert submitted == [(projects.HISTORY_SUMMARY_TASK_TYPE, payload, key)]
+
+    async def history(conversation_id, limit=100):
+        return [{"id": "msg-id", "sender": "agent", "content": "了解，請問預算大概多少？"}]
+
+    monkeypatch.setattr(patch_conversation_service, "get_conversation_history", history)
+    assert await projects._refresh_history_summary(payload) == {"changed": True}
+    assert refreshed == [{"text": "舊摘要"}]
+    assert patch_conversation_service.history_summaries["conv-proj-stream-4"] == {"text": "新摘要"}
+
+
+async def test_history_summary_jobs_are_serialized_and_skip_superseded_turns(patch_conversation_service, monkeypatch):
+    history = [{"id": "m1", "sender": "user", "content": "老公寓"}, {"id": "m2", "sender": "agent", "content": "了解"}]
+    running = []
+    overlaps = []
+
+    async def refresh_history_summary(conversation_history, summary_state=None):
+        overlaps.append(len(running))
+        running.append(1)
+        await asyncio.sleep(0.01)
+        running.pop()
+        return {"text": "摘要", "covered_through_id": conversation_history[-1]["id"]}
+
+    async def get_history(conversation_id, limit=100):
+        return list(history)
+
+    gemini = GeminiStub("inline")
+    gemini.refresh_history_summary = refresh_history_summary
+    monkeypatch.setattr(projects, "gemini_service", gemini)
+    monkeypatch.setattr(patch_conversation_service, "get_conversation_history", get_history)
+
+    results = await asyncio.gather(
+        projects._refresh_history_summary({"conversation_id": "conv-s", "last_message_id": "m2"}),
+        projects._refresh_history_summary({"conversation_id": "conv-s", "last_message_id": "m2"}),
+        projects._refresh_history_summary({"conversation_id": "conv-s", "last_message_id": "m1"}),
+    )
+
+    # The first job summarizes; the duplicate finds m2 already covered and the older turn is superseded
+    assert results == [{"changed": True}, {"changed": False, "skipped": True}, {"changed": False, "skipped": True}]
+    assert overlaps == [0]
+    assert projects._history_summary_locks == {}
@@ -0,0 +1,51 @@
+import io
+import os
+
+import openpyxl
+import pytest
+
+from src.services.excel_rows import iter_capped_rows
+from src.services.parsing_service import ParsingService
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _workbook_bytes(rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_parse_excel_skips_empty_rows():
+    content = _workbook_bytes([["項目", "數量", "單價"], [None, None, None], ["油漆", 20, 800]])
+
+    result = ParsingService()._parse_excel(io.BytesIO(content))
+
+    assert result["rows"] == [["項目", "數量", "單價"], ["油漆", 20, 800]]
+    assert result["truncated"] is False
+
+
+def test_excel_rows_are_capped():
+    content = _workbook_bytes([[f"item-{i}", i] for i in range(50)])
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+
+    rows = list(iter_capped_rows(workbook.active, max_rows=10))
+    by_bytes = list(iter_capped_rows(workbook.active, max_bytes=40))
+
+    assert len(rows) == 11 and rows[-1] is None
+    assert by_bytes[-1] is None and len(by_bytes) < 10
+    workbook.close()
+
+
+def test_excel_rows_match_background_processor_copy():
+    """兩個服務分開部署，excel_rows.py 必須保持一致，上限與逐列讀取才不會分岐"""
+    shared = os.path.join(ROOT_DIR, "..", "background-processor", "excel_rows.py")
+    if not os.path.exists(shared):
+        pytest.skip("background-processor is not checked out next to analysis-service")
+    with open(os.path.join(ROOT_DIR, "src", "services", "excel_rows.py"), encoding="utf-8") as ours, \
+            open(shared, encoding="utf-8") as theirs:
+        assert ours.read() == theirs.read()
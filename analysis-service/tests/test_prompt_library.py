@@ -0,0 +1,104 @@
+import asyncio
+
+from src.services.gemini_service import GeminiLLMService
+from src.services.prompt_library import (
+    BASE_PROMPT,
+    FINAL_REPORT_STAGE,
+    STAGE_INSTRUCTIONS,
+    InMemoryPromptContextCache,
+    PromptContextCache,
+    PromptLibrary,
+    prompt_library,
+)
+
+
+class RecordingBackend:
+    name = "recording"
+
+    def __init__(self):
+        self.requests = []
+
+    async def stream_text(self, contents, *, cached_content=None):
+        request = {"contents": contents}
+        if cached_content:
+            request["cached_content"] = cached_content
+        self.requests.append(request)
+        for text in ("好的", "，請問"):
+            yield text
+
+
+class FailingContextCache(PromptContextCache):
+    async def _register(self, model_name, stage):
+        raise RuntimeError("cached content too small")
+
+
+def _service(context_cache=None):
+    service = GeminiLLMService(backend=RecordingBackend())
+    service.spec_extraction_mode = "background"
+    service.context_cache = context_cache
+    return service
+
+
+def test_stage_prompts_are_built_once_and_shared():
+    stage = prompt_library.for_stage("stage_2_scope_condition")
+
+    assert stage is prompt_library.for_stage("stage_2_scope_condition")
+    assert stage.text == f"{BASE_PROMPT}\n{STAGE_INSTRUCTIONS['stage_2_scope_condition']}"
+    assert stage.parts[0] is prompt_library.for_stage("stage_1_situation_purpose").parts[0]
+    assert prompt_library.for_stage(None).stage_id == FINAL_REPORT_STAGE
+    assert prompt_library.for_stage("unknown").stage_id == "default"
+
+
+def test_cache_key_changes_with_prompt_text():
+    keys = {stage.cache_key for stage in prompt_library.stages.values()}
+    assert len(keys) == len(prompt_library.stages)
+
+    edited = PromptLibrary(base_prompt=BASE_PROMPT + "4. 新規則")
+    assert edited.for_stage("stage_1_situation_purpose").cache_key != (
+        prompt_library.for_stage("stage_1_situation_purpose").cache_key
+    )
+
+
+async def test_context_cache_registers_each_stage_once():
+    cache = InMemoryPromptContextCache()
+    stage = prompt_library.for_stage("stage_3_material_style")
+
+    names = await asyncio.gather(*(cache.get("gemini", stage) for _ in range(5)))
+
+    assert len(set(names)) == 1
+    assert cache.registrations == 1
+    assert cache.contents[names[0]] == stage.text
+
+
+async def test_failed_registration_is_negatively_cached():
+    cache = FailingContextCache()
+    stage = prompt_library.for_stage("stage_1_situation_purpose")
+
+    assert await cache.get("gemini", stage) is None
+    assert await cache.get("gemini", stage) is None
+    assert cache.failures == 1
+
+
+async def test_cached_context_replaces_inline_system_prompt():
+    service = _service(InMemoryPromptContextCache())
+
+    chunks = [text async for text, _ in service.generate_response_stream("你好", [], {"extracted_specs": {}})]
+
+    request = service.backend.requests[0]
+    assert "".join(chunks) == "好的，請問"
+    assert request["cached_content"].startswith("cachedContents/local-")
+    user_text = "".join(part.text for part in request["contents"][-1].parts)
+    assert user_text == "你好"
+
+
+async def test_without_context_cache_first_turn_carries_prompt_parts():
+    service = _service()
+
+    _ = [chunk async for chunk in service.generate_response_stream("你好", [], {"extracted_specs": {}})]
+
+    request = service.backend.requests[0]
+    assert "cached_content" not in request
+    parts = request["contents"][-1].parts
+    stage = prompt_library.for_stage("stage_1_situation_purpose")
+    assert parts[:2] == list(stage.parts)
+    assert parts[-1].text.endswith("USER_MESSAGE:\n你好")
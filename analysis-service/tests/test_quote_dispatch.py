@@ -0,0 +1,97 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+from src.services import quote_dispatch
+from src.services.quote_dispatch import PubSubQuoteDispatcher
+
+pytestmark = pytest.mark.asyncio
+
+
+class _ThreadedPublisher:
+    """Resolves publish futures from another thread, like the real batching publisher."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.published = []
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic_path, data):
+        self.published.append((topic_path, data))
+        future = concurrent.futures.Future()
+        message_id = f"msg-{len(self.published)}"
+
+        def resolve():
+            if self.error:
+                future.set_exception(self.error)
+            else:
+                future.set_result(message_id)
+
+        threading.Timer(0.01, resolve).start()
+        return future
+
+
+async def test_pubsub_dispatch_returns_before_ack_and_runs_callback_on_loop():
+    dispatcher = PubSubQuoteDispatcher(publisher=_ThreadedPublisher(), project_id="p", topic_id="t")
+    loop = asyncio.get_running_loop()
+    outcomes = []
+
+    async def on_complete(message_id, error):
+        assert asyncio.get_running_loop() is loop
+        outcomes.append((message_id, error))
+
+    dispatcher.dispatch({"project_id": "a"}, on_complete=on_complete)
+    dispatcher.dispatch({"project_id": "b"}, on_complete=on_complete)
+    assert dispatcher.pending == 2 and outcomes == []
+
+    await dispatcher.drain()
+
+    assert sorted(outcomes) == [("msg-1", None), ("msg-2", None)]
+    assert dispatcher.stats()["published"] == 2
+    assert dispatcher.stats()["ack_latency"]["count"] == 2
+
+
+async def test_pubsub_dispatch_reports_publish_errors():
+    dispatcher = PubSubQuoteDispatcher(publisher=_ThreadedPublisher(error=RuntimeError("boom")), project_id="p", topic_id="t")
+    outcomes = []
+
+    async def on_complete(message_id, error):
+        outcomes.append((message_id, str(error)))
+
+    dispatcher.dispatch({"project_id": "a"}, on_complete=on_complete)
+    await dispatcher.drain()
+
+    assert outcomes == [(None, "boom")]
+    assert dispatcher.stats()["failed"] == 1 and dispatcher.pending == 0
+
+
+async def test_pubsub_publisher_is_created_at_start_and_stopped_on_close(monkeypatch):
+    created = []
+
+    class _Publisher(_ThreadedPublisher):
+        def __init__(self, batch_settings=None):
+            super().__init__()
+            self.batch_settings = batch_settings
+            self.stopped = False
+            created.append(self)
+
+        def stop(self):
+            self.stopped = True
+
+    monkeypatch.setattr(quote_dispatch.pubsub_v1, "PublisherClient", _Publisher)
+    dispatcher = PubSubQuoteDispatcher(project_id="p", topic_id="t")
+
+    dispatcher.start()
+    assert len(created) == 1 and created[0].batch_settings.max_messages == quote_dispatch.PUBSUB_BATCH_MAX_MESSAGES
+
+    dispatcher.dispatch({"project_id": "a"})
+    await dispatcher.drain()
+    assert created[0].published == [("projects/p/topics/t", b'{"project_id": "a"}')]
+    assert len(created) == 1
+
+    dispatcher.close()
+    assert created[0].stopped
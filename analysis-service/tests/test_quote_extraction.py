@@ -0,0 +1,106 @@
+import io
+
+import openpyxl
+
+from src.services.parsing_service import ParsingService
+from src.services.quote_extraction import (
+    detect_header,
+    extract_from_rows,
+    extract_from_text,
+    format_quote_table,
+    normalize_unit,
+    parse_number,
+)
+
+
+def test_normalize_unit_and_numbers():
+    assert normalize_unit(" 一式 ") == "式"
+    assert normalize_unit("PING") == "坪"
+    assert normalize_unit("室") == "間"
+    assert normalize_unit("㎡") == "平方公尺"
+    assert normalize_unit("樘") == "樘"
+    assert parse_number("NT$ 12,500") == 12500.0
+    assert parse_number("3.5坪") == 3.5
+    assert parse_number("—") is None
+
+
+def test_detect_header_requires_item_and_numeric_columns():
+    assert detect_header(["項目", "規格", "數量", "單位", "單價", "複價"]) == {
+        "item_name": 0, "spec": 1, "quantity": 2, "unit": 3, "unit_price": 4, "total_price": 5,
+    }
+    assert detect_header(["項目", "備註"]) is None
+
+
+def test_extract_from_excel_rows_derives_missing_values():
+    rows = [
+        ["XX 設計工程 報價單"],
+        ["工程項目", "規格說明", "數量", "單位", "單價", "金額"],
+        ["一、拆除工程", None, None, None, None, None],
+        ["舊地板拆除", "含清運", 20, "坪", 1200, None],
+        ["浴室防水", "彈性水泥 180cm", 1, "室", None, 25000],
+        ["水電配置", None, None, "一式", 80000, 80000],
+        ["合計", None, None, None, None, 129000],
+    ]
+
+    quote = extract_from_rows(rows)
+
+    assert [item.item_name for item in quote.line_items] == ["舊地板拆除", "浴室防水", "水電配置"]
+    floor, bathroom, electrical = quote.line_items
+    assert (floor.unit, floor.total_price) == ("坪", 24000)
+    assert (bathroom.unit, bathroom.unit_price) == ("間", 25000)
+    assert (electrical.unit, electrical.quantity) == ("式", 1.0)
+    assert quote.total_price == 129000
+    assert quote.source == "original_upload"
+
+
+def test_extract_from_pdf_text_with_space_separated_columns():
+    text = "\n".join([
+        "報價單 2024/05/01",
+        "項目 規格 數量 單位 單價 小計",
+        "油漆 得利乳膠漆 30 坪 1,800 54,000",
+        "超耐磨木地板 Pergo 20坪 - 5,500 110,000",
+        "總計 164,000",
+    ])
+
+    quote = extract_from_text(text)
+
+    assert len(quote.line_items) == 2
+    assert quote.line_items[1].quantity == 20
+    assert quote.line_items[1].unit == "坪"
+    assert quote.total_price == 164000
+
+
+def test_extract_returns_none_without_a_table():
+    assert extract_from_text("感謝您的詢價，詳細報價請見附件。") is None
+
+
+def test_format_quote_table_is_compact():
+    quote = extract_from_text("項目\t數量\t單位\t單價\n油漆\t30\t坪\t1800")
+
+    table = format_quote_table(quote)
+
+    assert table.splitlines()[1] == "油漆 | - | 30 | 坪 | 1,800 | 54,000"
+    assert table.endswith("總計：54,000 元（1 項）")
+
+
+def test_parsing_service_returns_structured_quote():
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["品名", "數量", "單位", "單價", "複價"])
+    workbook.active.append(["系統櫃", 3, "尺", 6500, 19500])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    result = ParsingService()._parse_excel(io.BytesIO(buffer.getvalue()))
+
+    assert result["quote"]["line_items"][0]["unit"] == "尺"
+    assert result["quote"]["total_price"] == 19500
+
+
+def test_extract_from_tab_text_keeps_blank_columns_aligned():
+    text = "--- Sheet: 報價 ---\n項目\t規格\t數量\t單位\t單價\t複價\n水電配置\t\t\t式\t80000\t80000"
+
+    quote = extract_from_text(text)
+
+    assert quote.line_items[0].quantity == 1.0
+    assert quote.line_items[0].unit == "式"
+    assert quote.line_items[0].spec is None
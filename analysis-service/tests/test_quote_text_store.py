@@ -0,0 +1,40 @@
+import gzip
+
+import pytest
+
+from src.services.quote_text_store import QuoteTextStore, QuoteTextUnavailable
+
+
+async def test_reads_compressed_content_addressed_text_written_by_the_processor(tmp_path, save_quote_text):
+    store = QuoteTextStore()
+    text = "項目\t數量\t單價\n油漆\t30\t1800\n" * 200
+
+    manifest = await save_quote_text(text, page_count=3)
+    again = await save_quote_text(text)
+
+    assert manifest["uri"] == again["uri"] and manifest["uri"].startswith("file://")
+    assert manifest["page_count"] == 3
+    assert manifest["size_bytes"] == len(text.encode("utf-8")) > manifest["compressed_bytes"]
+    assert len(list(tmp_path.rglob("*.txt.gz"))) == 1
+    assert await store.load(manifest) == text
+
+
+async def test_load_rejects_missing_or_tampered_blobs(tmp_path, save_quote_text):
+    store = QuoteTextStore()
+    manifest = await save_quote_text("原始報價")
+    blob_path = next(tmp_path.rglob("*.txt.gz"))
+    blob_path.write_bytes(gzip.compress("被改過".encode("utf-8")))
+
+    with pytest.raises(QuoteTextUnavailable):
+        await store.load(manifest)
+    with pytest.raises(QuoteTextUnavailable):
+        await store.load({**manifest, "uri": (tmp_path / "missing.txt.gz").as_uri()})
+
+
+async def test_load_rejects_blobs_that_are_not_gzip(tmp_path, save_quote_text):
+    store = QuoteTextStore()
+    manifest = await save_quote_text("原始報價")
+    next(tmp_path.rglob("*.txt.gz")).write_bytes(b"not gzip")
+
+    with pytest.raises(QuoteTextUnavailable):
+        await store.load(manifest)
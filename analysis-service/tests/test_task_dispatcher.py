@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from src.models.project import AgentRole, ProjectBrief
+from src.services.task_dispatcher import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    InMemoryJobQueue,
+    Job,
+    SQLiteJobQueue,
+    TaskDispatcher,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+def _dispatcher(queue=None, **kwargs):
+    options = {"workers": 2, "retry_base_delay": 0.01, "poll_interval": 0.01}
+    options.update(kwargs)
+    return TaskDispatcher(queue=queue or InMemoryJobQueue(), **options)
+
+
+async def test_jobs_run_on_worker_pool_and_record_results():
+    dispatcher = _dispatcher()
+    running = []
+
+    @dispatcher.handler("echo")
+    async def echo(payload):
+        running.append(payload["n"])
+        await asyncio.sleep(0.02)
+        return {"n": payload["n"]}
+
+    await dispatcher.start()
+    try:
+        jobs = [await dispatcher.submit("echo", {"n": n}) for n in range(4)]
+        assert {(await dispatcher.get_job(job.job_id)).status for job in jobs} <= {JOB_QUEUED, JOB_RUNNING}
+        finished = [await dispatcher.wait(job.job_id, timeout=2) for job in jobs]
+    finally:
+        await dispatcher.stop()
+
+    assert [job.status for job in finished] == [JOB_SUCCEEDED] * 4
+    assert [job.result for job in finished] == [{"n": n} for n in range(4)]
+    assert sorted(running) == [0, 1, 2, 3]
+
+
+async def test_failed_jobs_retry_with_backoff_until_max_attempts():
+    dispatcher = _dispatcher(max_attempts=3)
+    calls = []
+
+    @dispatcher.handler("flaky")
+    async def flaky(payload):
+        calls.append(payload)
+        if len(calls) < payload["succeed_on"]:
+            raise RuntimeError("transient")
+        return "ok"
+
+    await dispatcher.start()
+    try:
+        recovered = await dispatcher.wait((await dispatcher.submit("flaky", {"succeed_on": 2})).job_id, timeout=2)
+        calls.clear()
+        exhausted = await dispatcher.wait((await dispatcher.submit("flaky", {"succeed_on": 10})).job_id, timeout=2)
+    finally:
+        await dispatcher.stop()
+
+    assert (recovered.status, recovered.attempts, recovered.result) == (JOB_SUCCEEDED, 2, "ok")
+    assert (exhausted.status, exhausted.attempts) == (JOB_FAILED, 3)
+    assert exhausted.error == "RuntimeError: transient"
+    assert dispatcher._retry_delay(1) < dispatcher._retry_delay(2) < dispatcher._retry_delay(3)
+
+
+async def test_idempotency_key_returns_existing_job():
+    dispatcher = _dispatcher()
+    brief = ProjectBrief(
+        project_id="proj-1", user_profile={}, style_preferences=[], key_requirements=[], original_quote_analysis={}
+    )
+
+    first = await dispatcher.dispatch_task(AgentRole.CONTRACTOR, brief)
+    second = await dispatcher.dispatch_task(AgentRole.CONTRACTOR, brief)
+    designer = await dispatcher.dispatch_task(AgentRole.DESIGNER, brief)
+
+    assert first["job_id"] == second["job_id"] != designer["job_id"]
+    assert (await dispatcher.stats())["jobs"] == {JOB_QUEUED: 2}
+
+
+async def test_sqlite_queue_persists_and_recovers_interrupted_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = SQLiteJobQueue(path)
+    job = await queue.enqueue(Job(task_type="echo", payload={"text": "報價"}, idempotency_key="k1"))
+    assert (await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="k1"))).job_id == job.job_id
+    assert (await queue.claim()).job_id == job.job_id
+    queue.close()
+
+    # A new process re-queues the job that was running when the old one died
+    dispatcher = _dispatcher(queue=SQLiteJobQueue(path))
+    dispatcher.register("echo", lambda payload: asyncio.sleep(0, result=payload["text"]))
+    await dispatcher.start()
+    try:
+        finished = await dispatcher.wait(job.job_id, timeout=2)
+    finally:
+        await dispatcher.stop()
+        dispatcher.queue.close()
+
+    assert (finished.status, finished.result, finished.attempts) == (JOB_SUCCEEDED, "報價", 1)
+
+
+async def test_changed_brief_is_dispatched_again():
+    dispatcher = _dispatcher()
+    brief = ProjectBrief(
+        project_id="proj-1", user_profile={}, style_preferences=[], key_requirements=["廚房"], original_quote_analysis={}
+    )
+    updated = brief.model_copy(update={"key_requirements": ["廚房", "浴室"]})
+
+    first = await dispatcher.dispatch_task(AgentRole.CONTRACTOR, brief)
+    second = await dispatcher.dispatch_task(AgentRole.CONTRACTOR, updated)
+
+    assert first["job_id"] != second["job_id"]
+
+
+async def test_memory_queue_claims_by_run_after_and_evicts_finished_jobs():
+    queue = InMemoryJobQueue(retention_seconds=3600, retention_max=1)
+    later = await queue.enqueue(Job(task_type="echo", payload={}, run_after=time.time() + 60))
+    first = await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="a", run_after=time.time() - 2))
+    second = await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="b", run_after=time.time() - 1))
+
+    assert (await queue.claim()).job_id == first.job_id
+    assert (await queue.claim()).job_id == second.job_id
+    assert await queue.claim() is None
+
+    for job in (first, second):
+        job.status = JOB_SUCCEEDED
+        await queue.save(job)
+
+    # Only the newest finished job is kept; the evicted one's key can be reused
+    assert await queue.get(first.job_id) is None
+    assert (await queue.get(second.job_id)).status == JOB_SUCCEEDED
+    assert (await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="a"))).job_id != first.job_id
+    assert (await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="b"))).job_id == second.job_id
+    assert (await queue.get(later.job_id)).status == JOB_QUEUED
+
+
+async def test_sqlite_queue_prunes_finished_jobs_by_age_and_count(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"), retention_seconds=3600, retention_max=1, prune_interval=0)
+    old, recent, newest, pending = [
+        await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key=key)) for key in ("a", "b", "c", "d")
+    ]
+    old.status, old.updated_at = JOB_SUCCEEDED, "2000-01-01T00:00:00+00:00"
+    recent.status, recent.updated_at = JOB_FAILED, "2100-01-01T00:00:00+00:00"
+    newest.status, newest.updated_at = JOB_SUCCEEDED, "2100-01-02T00:00:00+00:00"
+    for job in (old, recent, newest):
+        await queue.save(job)
+
+    # Saving a finished job prunes: `old` is past the age limit, `recent` is over the count limit
+    assert await queue.get(old.job_id) is None
+    assert await queue.get(recent.job_id) is None
+    assert (await queue.get(newest.job_id)).status == JOB_SUCCEEDED
+    assert (await queue.get(pending.job_id)).status == JOB_QUEUED
+    assert (await queue.enqueue(Job(task_type="echo", payload={}, idempotency_key="a"))).job_id != old.job_id
+    assert await queue.prune() == 0
+    queue.close()
@@ -0,0 +1,58 @@
+import hashlib
+import io
+import tempfile
+import zipfile
+
+import openpyxl
+import pytest
+
+from src.services.upload_service import InvalidUpload, UploadTooLarge, inspect_upload
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _spooled(data: bytes):
+    spool = tempfile.SpooledTemporaryFile(max_size=16)
+    spool.write(data)
+    return spool
+
+
+def _xlsx_bytes():
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["項目", "數量", "單價"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_inspect_upload_hashes_and_rewinds(monkeypatch):
+    monkeypatch.setattr("src.services.upload_service.UPLOAD_READ_CHUNK_SIZE", 1024)
+    content = _xlsx_bytes()
+    spool = _spooled(content)
+
+    info = inspect_upload(spool, XLSX)
+
+    assert info.content_sha256 == hashlib.sha256(content).hexdigest()
+    assert info.size_bytes == len(content)
+    assert spool.tell() == 0
+
+
+def test_inspect_upload_checks_pdf_header_and_trailer():
+    pdf = b"%PDF-1.4\n" + b"0" * 10_000 + b"\n%%EOF\n"
+    assert inspect_upload(_spooled(pdf), "application/pdf").size_bytes == len(pdf)
+
+    with pytest.raises(InvalidUpload):
+        inspect_upload(_spooled(pdf[:-10]), "application/pdf")
+    with pytest.raises(InvalidUpload):
+        inspect_upload(_spooled(b"This is a test pdf content."), "application/pdf")
+
+
+def test_inspect_upload_rejects_non_workbook_zip_and_oversized_files():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("readme.txt", "hello")
+
+    with pytest.raises(InvalidUpload):
+        inspect_upload(_spooled(buffer.getvalue()), XLSX)
+    with pytest.raises(UploadTooLarge):
+        inspect_upload(_spooled(_xlsx_bytes()), XLSX, max_bytes=100)
@@ -0,0 +1,56 @@
+import io
+from typing import Iterator, Optional, TextIO, Tuple
+
+import openpyxl
+
+from excel_rows import EXCEL_MAX_BYTES_PER_SHEET, EXCEL_MAX_ROWS_PER_SHEET, iter_capped_rows, row_text
+
+
+def iter_rows(
+    sheet,
+    max_rows: int = EXCEL_MAX_ROWS_PER_SHEET,
+    max_bytes: int = EXCEL_MAX_BYTES_PER_SHEET,
+) -> Iterator[Optional[str]]:
+    """
+    Lazily yields one tab-separated line per row of a read-only worksheet.
+    Empty cells are kept as empty fields; trailing ones are trimmed.
+    Yields None once if the sheet hits its row or byte cap, then stops.
+    """
+    for row in iter_capped_rows(sheet, max_rows, max_bytes):
+        yield None if row is None else row_text(row)
+
+
+def iter_sheets(content: bytes, **caps) -> Iterator[Tuple[str, Iterator[Optional[str]]]]:
+    """
+    Yields (sheet_name, row_iterator) for each sheet. The workbook is opened
+    read-only, so rows are streamed from the XML instead of building the whole
+    object graph in memory.
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield sheet.title, iter_rows(sheet, **caps)
+    finally:
+        # Read-only workbooks keep the archive open until closed
+        workbook.close()
+
+
+def write_excel_text(content: bytes, out: TextIO, **caps) -> int:
+    """Writes the workbook as text to `out` row by row; returns the number of rows written."""
+    written = 0
+    for sheet_name, rows in iter_sheets(content, **caps):
+        out.write(f"--- Sheet: {sheet_name} ---\n")
+        for text in rows:
+            if text is None:
+                out.write("[... remaining rows truncated ...]\n")
+                break
+            out.write(text)
+            out.write("\n")
+            written += 1
+    return written
+
+
+def parse_excel(content: bytes, **caps) -> str:
+    buffer = io.StringIO()
+    write_excel_text(content, buffer, **caps)
+    return buffer.getvalue()
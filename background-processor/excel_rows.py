@@ -0,0 +1,50 @@
+"""
+Per-sheet caps and the capped row iterator shared by the analysis service's
+ParsingService and the background processor's excel_parsing.
+
+The two services deploy from separate build contexts, so this module is kept
+byte-identical in analysis-service/src/services/excel_rows.py and
+background-processor/excel_rows.py; the analysis service's tests fail if the
+copies drift. It must not import anything from either service.
+"""
+import logging
+import os
+from typing import Any, Iterator, List, Optional, Sequence
+
+# --- Environment Variables ---
+EXCEL_MAX_ROWS_PER_SHEET = int(os.getenv("EXCEL_MAX_ROWS_PER_SHEET", "5000"))
+EXCEL_MAX_BYTES_PER_SHEET = int(os.getenv("EXCEL_MAX_BYTES_PER_SHEET", str(1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+def row_text(row: Sequence[Any]) -> str:
+    # Blank cells keep their column so downstream line-item extraction stays aligned
+    return "\t".join(["" if cell is None else str(cell) for cell in row]).rstrip("\t")
+
+
+def iter_capped_rows(
+    sheet,
+    max_rows: int = EXCEL_MAX_ROWS_PER_SHEET,
+    max_bytes: int = EXCEL_MAX_BYTES_PER_SHEET,
+    skip_empty: bool = False,
+) -> Iterator[Optional[List[Any]]]:
+    """
+    Lazily yields the cell values of each row of a read-only worksheet.
+    Rows count towards `max_bytes` by the size of their tab-separated text.
+    Yields None once if the sheet hits its row or byte cap, then stops.
+    """
+    rows = 0
+    size = 0
+    for row in sheet.iter_rows(values_only=True):
+        if skip_empty and all(cell is None for cell in row):
+            continue
+        size += len(row_text(row).encode("utf-8")) + 1
+        if rows >= max_rows or size > max_bytes:
+            logger.warning(
+                f"Sheet '{sheet.title}' truncated after {rows} rows (caps: {max_rows} rows, {max_bytes} bytes)."
+            )
+            yield None
+            return
+        rows += 1
+        yield list(row)
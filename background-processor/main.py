@@ -1,14 +1,17 @@
 import base64
 import json
 import os
-import io
 import logging
+import time
+from typing import Optional
 
 from google.cloud import firestore
 from google.cloud import storage
 from google.cloud import vision
-import pdfplumber
-import openpyxl
+
+from excel_parsing import parse_excel
+from pdf_parsing import parse_pdf
+from quote_text_store import save_quote_text
 
 # --- Client Initialization ---
 # It's a best practice to initialize clients outside of the function handler
@@ -19,6 +22,12 @@ vision_client = vision.ImageAnnotatorClient()
 
 # --- Environment Variables ---
 PROJECTS_COLLECTION = os.getenv("PROJECTS_COLLECTION", "projects")
+# Parse results keyed by the SHA-256 of the uploaded file, shared with the analysis service
+QUOTE_PARSE_CACHE_COLLECTION = os.getenv("QUOTE_PARSE_CACHE_COLLECTION", "quote_parse_cache")
+# Minimum seconds between parse-progress writes to Firestore
+PARSE_PROGRESS_INTERVAL = float(os.getenv("PARSE_PROGRESS_INTERVAL", "2"))
+# Firestore allows 500 writes per batch; leave room for the project update
+PROGRESS_PAGES_PER_BATCH = 400
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO)
@@ -47,28 +56,61 @@ def _get_file_from_gcs(gcs_uri: str) -> tuple[bytes, str]:
         raise
 
 
-def _parse_pdf(content: bytes) -> str:
-    """Extracts text from PDF content."""
-    text = ""
-    with pdfplumber.open(io.BytesIO(content)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
+class _PdfProgressReporter:
+    """
+    Streams per-page progress to `projects/{id}/quote_pages/{page}` and the page
+    count to the project document while a PDF is being parsed. Page docs hold
+    only the page number and text length; the text itself goes to the quote
+    text store with the finished result.
+    Writes are throttled to PARSE_PROGRESS_INTERVAL; failures are logged only.
+    """
+
+    def __init__(self, project_id: str):
+        self.project_ref = firestore_client.collection(PROJECTS_COLLECTION).document(project_id)
+        # (page index, characters of text on that page)
+        self._unsent: list[tuple[int, int]] = []
+        self._last_write = 0.0
+        self.total_pages: Optional[int] = None
+
+    def __call__(self, pages_done: int, total_pages: int, pages: list[tuple[int, str]]):
+        self.total_pages = total_pages
+        self._unsent.extend((index, len(text)) for index, text in pages)
+        finished = pages_done == total_pages
+        if not finished and time.monotonic() - self._last_write < PARSE_PROGRESS_INTERVAL:
+            return
+        self._last_write = time.monotonic()
+        unsent, self._unsent = self._unsent, []
+        try:
+            for start in range(0, max(len(unsent), 1), PROGRESS_PAGES_PER_BATCH):
+                batch = firestore_client.batch()
+                for index, char_count in unsent[start:start + PROGRESS_PAGES_PER_BATCH]:
+                    batch.set(self.project_ref.collection("quote_pages").document(f"{index:04d}"), {
+                        "page": index + 1,
+                        "char_count": char_count
+                    })
+                batch.set(self.project_ref, {
+                    "quote_analysis_status": "processing",
+                    "quote_analysis_progress": {"pages_done": pages_done, "total_pages": total_pages},
+                }, merge=True)
+                batch.commit()
+        except Exception as e:
+            logger.warning(f"Failed to write parse progress for {self.project_ref.id}: {e}")
+
+
+def _parse_pdf(content: bytes, project_id: Optional[str] = None) -> tuple[str, Optional[int]]:
+    """
+    Extracts text from PDF content, reporting per-page progress when a project is given.
+    Returns the text and the page count (None when no progress was reported).
+    """
+    on_progress = _PdfProgressReporter(project_id) if project_id else None
+    text = parse_pdf(content, on_progress=on_progress)
     logger.info(f"Successfully parsed PDF, extracted {len(text)} characters.")
-    return text
+    return text, on_progress.total_pages if on_progress else None
 
 
 def _parse_excel(content: bytes) -> str:
-    """Extracts text from Excel content."""
-    text = ""
-    workbook = openpyxl.load_workbook(io.BytesIO(content))
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        text += f"--- Sheet: {sheet_name} ---\n"
-        for row in sheet.iter_rows(values_only=True):
-            row_text = "\t".join([str(cell) for cell in row if cell is not None])
-            text += row_text + "\n"
+    """Extracts text from Excel content (streamed, capped per sheet)."""
+    text = parse_excel(content)
     logger.info(f"Successfully parsed Excel, extracted {len(text)} characters.")
     return text
 
@@ -85,17 +127,67 @@ def _parse_image_ocr(gcs_uri: str) -> str:
     return text
 
 
-def _save_result_to_firestore(project_id: str, extracted_text: str):
+def _get_cached_parse_result(content_sha256: str) -> Optional[dict]:
     """
-    Saves the extracted text and updates the project status in Firestore.
+    Returns the cache entry for identical file content, if any: either a
+    `quote_text_manifest` or (older entries) the inline `extracted_text`.
+    """
+    try:
+        doc = firestore_client.collection(QUOTE_PARSE_CACHE_COLLECTION).document(content_sha256).get()
+        if doc.exists:
+            return doc.to_dict()
+    except Exception as e:
+        logger.warning(f"Failed to read parse cache for {content_sha256}: {e}")
+    return None
+
+
+def _save_parse_result_to_cache(content_sha256: str, extracted_text: str, content_type: str, manifest: Optional[dict] = None):
+    entry = {"content_type": content_type, "parsed_at": firestore.SERVER_TIMESTAMP}
+    if manifest:
+        entry["quote_text_manifest"] = manifest
+    else:
+        entry["extracted_text"] = extracted_text
+    try:
+        firestore_client.collection(QUOTE_PARSE_CACHE_COLLECTION).document(content_sha256).set(entry)
+    except Exception as e:
+        logger.warning(f"Failed to write parse cache for {content_sha256}: {e}")
+
+
+def _store_quote_text(extracted_text: str, page_count: Optional[int] = None) -> Optional[dict]:
+    """Offloads the text to the quote text store; None (keep it inline) if that fails."""
+    try:
+        return save_quote_text(extracted_text, page_count, storage_client)
+    except Exception as e:
+        logger.warning(f"Failed to offload quote text, keeping it on the project document: {e}")
+        return None
+
+
+def _save_result_to_firestore(
+    project_id: str,
+    extracted_text: Optional[str],
+    content_sha256: Optional[str] = None,
+    manifest: Optional[dict] = None,
+):
+    """
+    Updates the project status in Firestore. With a manifest only the manifest
+    is stored and any previous inline text is removed; otherwise the text is
+    stored inline in `original_quote_content`.
     """
     try:
         doc_ref = firestore_client.collection(PROJECTS_COLLECTION).document(project_id)
-        doc_ref.update({
+        data = {
             "quote_analysis_status": "completed",
-            "original_quote_content": extracted_text,
             "quote_analysis_completed_at": firestore.SERVER_TIMESTAMP
-        })
+        }
+        if manifest:
+            data["quote_text_manifest"] = manifest
+            data["original_quote_content"] = firestore.DELETE_FIELD
+        else:
+            data["original_quote_content"] = extracted_text or ""
+            data["quote_text_manifest"] = firestore.DELETE_FIELD
+        if content_sha256:
+            data["quote_content_sha256"] = content_sha256
+        doc_ref.update(data)
         logger.info(f"Successfully saved analysis for project {project_id} to Firestore.")
     except Exception as e:
         logger.error(f"Failed to save result to Firestore for project {project_id}: {e}")
@@ -138,13 +230,26 @@ def process_quote(event, context):
             logger.error(f"Missing required data in Pub/Sub message: {message_data}")
             return
 
-        # 2. Download file from GCS
+        # 2. Identical files (same SHA-256) are parsed only once
+        content_sha256 = message_data.get("content_sha256")
+        if content_sha256:
+            cached = _get_cached_parse_result(content_sha256)
+            if cached is not None:
+                _save_result_to_firestore(
+                    project_id, cached.get("extracted_text"), content_sha256, cached.get("quote_text_manifest")
+                )
+                logger.info(f"Reused cached parse result {content_sha256} for project {project_id}.")
+                return
+
+        # 3. Download file from GCS
         file_content, _ = _get_file_from_gcs(gcs_uri)
         extracted_text = ""
+        page_count = None
+        parsed = True
 
-        # 3. Select parser based on content type
+        # 4. Select parser based on content type
         if content_type == "application/pdf":
-            extracted_text = _parse_pdf(file_content)
+            extracted_text, page_count = _parse_pdf(file_content, project_id)
         elif "spreadsheetml" in content_type or "ms-excel" in content_type:
             extracted_text = _parse_excel(file_content)
         elif content_type in ["image/jpeg", "image/png"]:
@@ -153,9 +258,13 @@ def process_quote(event, context):
         else:
             logger.warning(f"Unsupported content type '{content_type}' for parsing.")
             extracted_text = "Unsupported file type for analysis."
+            parsed = False
 
-        # 4. Save the result to Firestore
-        _save_result_to_firestore(project_id, extracted_text)
+        # 5. Store the compressed text, then its manifest on the project document
+        manifest = _store_quote_text(extracted_text, page_count) if parsed else None
+        _save_result_to_firestore(project_id, extracted_text, content_sha256, manifest)
+        if content_sha256 and parsed:
+            _save_parse_result_to_cache(content_sha256, extracted_text, content_type, manifest)
 
         logger.info(f"Successfully processed file for project {project_id}.")
 
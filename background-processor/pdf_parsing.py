@@ -0,0 +1,132 @@
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pdfplumber
+
+# Kept free of the Cloud clients in main.py so pool workers can import it cheaply.
+
+# --- Environment Variables ---
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+# "spawn" avoids forking a process that already holds gRPC channels
+PDF_POOL_START_METHOD = os.getenv("PDF_POOL_START_METHOD", "spawn")
+
+logger = logging.getLogger(__name__)
+
+# (pages_done, total_pages, pages newly available in order as (index, text))
+ProgressCallback = Callable[[int, int, List[Tuple[int, str]]], None]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class PageTextWriter:
+    """
+    Assembles page text that may arrive out of order.
+    Pages are written to a single buffer in page order as soon as the
+    contiguous prefix is complete, instead of re-concatenating the result.
+    """
+
+    def __init__(self, total_pages: int):
+        self.total_pages = total_pages
+        self.pages_done = 0
+        self._pending: Dict[int, str] = {}
+        self._next_index = 0
+        self._buffer = io.StringIO()
+
+    def add(self, index: int, text: str) -> List[Tuple[int, str]]:
+        """Adds one page and returns the pages that became available in order."""
+        self.pages_done += 1
+        self._pending[index] = text
+        flushed = []
+        while self._next_index in self._pending:
+            page_text = self._pending.pop(self._next_index)
+            if page_text:
+                self._buffer.write(page_text)
+                self._buffer.write("\n")
+            flushed.append((self._next_index, page_text))
+            self._next_index += 1
+        return flushed
+
+    def getvalue(self) -> str:
+        return self._buffer.getvalue()
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Pool task: extracts text for pages [start, end) of the PDF at `path`.
+    The PDF is opened per range and closed before returning, so idle workers
+    hold no file handle or parsed pages once the job's temp file is gone.
+    """
+    with pdfplumber.open(path) as pdf:
+        return [(index, pdf.pages[index].extract_text() or "") for index in range(start, end)]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Reused across invocations on a warm instance to amortize worker start-up
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context(PDF_POOL_START_METHOD),
+        )
+    return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def _parse_serial(pdf, writer: PageTextWriter, on_progress: Optional[ProgressCallback]) -> None:
+    for index, page in enumerate(pdf.pages):
+        flushed = writer.add(index, page.extract_text() or "")
+        if on_progress:
+            on_progress(writer.pages_done, writer.total_pages, flushed)
+
+
+def _parse_parallel(content: bytes, writer: PageTextWriter, on_progress: Optional[ProgressCallback]) -> None:
+    # Workers read the PDF from a temp file rather than receiving the bytes with every task
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(content)
+        tmp.flush()
+        executor = _get_executor()
+        futures = [
+            executor.submit(extract_page_range, tmp.name, start, min(start + PDF_PAGES_PER_TASK, writer.total_pages))
+            for start in range(0, writer.total_pages, PDF_PAGES_PER_TASK)
+        ]
+        for future in as_completed(futures):
+            for index, text in future.result():
+                flushed = writer.add(index, text)
+                if on_progress:
+                    on_progress(writer.pages_done, writer.total_pages, flushed)
+
+
+def parse_pdf(content: bytes, on_progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Extracts text from PDF content, one "page text\\n" per non-empty page.
+    PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split across a process pool.
+    """
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        writer = PageTextWriter(len(pdf.pages))
+        if writer.total_pages < PDF_PARALLEL_MIN_PAGES or PDF_PARSE_WORKERS <= 1:
+            _parse_serial(pdf, writer, on_progress)
+            return writer.getvalue()
+
+    try:
+        _parse_parallel(content, writer, on_progress)
+    except BrokenProcessPool as e:
+        logger.warning(f"PDF worker pool failed ({e}); re-parsing serially.")
+        _reset_executor()
+        writer = PageTextWriter(writer.total_pages)
+        with pdfplumber.open(io.BytesIO(content)) as pdf:
+            _parse_serial(pdf, writer, on_progress)
+    return writer.getvalue()
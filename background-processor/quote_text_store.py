@@ -0,0 +1,58 @@
+import gzip
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from google.api_core.exceptions import PreconditionFailed
+
+# --- Environment Variables ---
+# Must match the analysis service's src/services/quote_text_store.py, which reads these blobs back.
+# "gcs" writes to QUOTE_TEXT_BUCKET, "local" to QUOTE_TEXT_LOCAL_DIR (local dev / tests)
+QUOTE_TEXT_STORE = os.getenv("QUOTE_TEXT_STORE", "gcs")
+QUOTE_TEXT_BUCKET = os.getenv("QUOTE_TEXT_BUCKET", os.getenv("GCS_UPLOAD_BUCKET", "houseiq-project-quotes"))
+QUOTE_TEXT_PREFIX = os.getenv("QUOTE_TEXT_PREFIX", "quote-text/sha256")
+QUOTE_TEXT_LOCAL_DIR = os.getenv("QUOTE_TEXT_LOCAL_DIR", "./quote_text")
+QUOTE_TEXT_GZIP_LEVEL = int(os.getenv("QUOTE_TEXT_GZIP_LEVEL", "6"))
+
+logger = logging.getLogger(__name__)
+
+
+def save_quote_text(text: str, page_count: Optional[int] = None, storage_client=None) -> Dict[str, Any]:
+    """
+    Stores gzip-compressed extracted text, content-addressed by the SHA-256 of
+    the UTF-8 text (identical text is stored once), and returns its manifest.
+    """
+    data = text.encode("utf-8")
+    content_sha256 = hashlib.sha256(data).hexdigest()
+    compressed = gzip.compress(data, compresslevel=QUOTE_TEXT_GZIP_LEVEL)
+    name = f"{QUOTE_TEXT_PREFIX}/{content_sha256}.txt.gz"
+
+    if QUOTE_TEXT_STORE == "local":
+        path = Path(QUOTE_TEXT_LOCAL_DIR) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists():
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(compressed)
+            tmp_path.replace(path)
+        uri = path.resolve().as_uri()
+    else:
+        blob = storage_client.bucket(QUOTE_TEXT_BUCKET).blob(name)
+        try:
+            # Same text -> same object; an existing one is already correct
+            blob.upload_from_string(compressed, content_type="application/gzip", if_generation_match=0)
+        except PreconditionFailed:
+            pass
+        uri = f"gs://{QUOTE_TEXT_BUCKET}/{name}"
+
+    logger.info(f"Stored quote text {content_sha256}: {len(data)} bytes -> {len(compressed)} compressed.")
+    # The small record kept on the project document in place of the text itself
+    return {
+        "uri": uri,
+        "encoding": "gzip",
+        "size_bytes": len(data),
+        "compressed_bytes": len(compressed),
+        "sha256": content_sha256,
+        "page_count": page_count,
+    }
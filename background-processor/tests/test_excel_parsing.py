@@ -0,0 +1,30 @@
+import io
+
+import openpyxl
+
+from excel_parsing import parse_excel
+
+
+def _workbook_bytes(rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "BOM"
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_parse_excel_keeps_blank_cells_and_caps_rows():
+    content = _workbook_bytes([["Item", None, "Qty"], [None, None, None], ["paint", 20, None]] + [["x", i] for i in range(10)])
+
+    text = parse_excel(content, max_rows=3)
+
+    assert text.splitlines() == [
+        "--- Sheet: BOM ---",
+        "Item\t\tQty",
+        "",
+        "paint\t20",
+        "[... remaining rows truncated ...]",
+    ]
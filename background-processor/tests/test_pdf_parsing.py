@@ -0,0 +1,85 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import pdf_parsing
+from pdf_parsing import PageTextWriter, parse_pdf
+
+PAGES = [f"Item {index + 1}: paint {30 + index} ping" for index in range(9)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(pdf_parsing, "PDF_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(pdf_parsing, "PDF_PARSE_WORKERS", 2)
+    monkeypatch.setattr(pdf_parsing, "PDF_PAGES_PER_TASK", 2)
+    pdf_parsing._reset_executor()
+    yield
+    pdf_parsing._reset_executor()
+
+
+def _recording_progress():
+    calls = []
+
+    def on_progress(pages_done, total_pages, pages):
+        calls.append((pages_done, total_pages, pages))
+
+    return calls, on_progress
+
+
+def _serial_text(content: bytes, monkeypatch) -> str:
+    with monkeypatch.context() as patch:
+        patch.setattr(pdf_parsing, "PDF_PARSE_WORKERS", 1)
+        return parse_pdf(content)
+
+
+def test_page_text_writer_emits_pages_in_order():
+    writer = PageTextWriter(4)
+
+    assert writer.add(2, "c") == []
+    assert writer.add(0, "a") == [(0, "a")]
+    assert writer.add(3, "") == []
+    assert writer.add(1, "b") == [(1, "b"), (2, "c"), (3, "")]
+    assert writer.pages_done == 4
+    assert writer.getvalue() == "a\nb\nc\n"
+
+
+def test_parallel_parse_matches_serial_and_reports_every_page(pdf_factory, monkeypatch):
+    content = pdf_factory(PAGES)
+    calls, on_progress = _recording_progress()
+
+    text = parse_pdf(content, on_progress=on_progress)
+
+    assert pdf_parsing._executor is not None  # went through the pool
+    assert text == _serial_text(content, monkeypatch)
+    assert text.splitlines() == PAGES
+    assert [done for done, _, _ in calls] == list(range(1, len(PAGES) + 1))
+    assert {total for _, total, _ in calls} == {len(PAGES)}
+    flushed = [page for _, _, pages in calls for page in pages]
+    assert flushed == list(enumerate(PAGES))
+
+
+def test_small_pdfs_are_parsed_serially(pdf_factory, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("small PDFs must not use the process pool")
+
+    monkeypatch.setattr(pdf_parsing, "_parse_parallel", no_pool)
+    calls, on_progress = _recording_progress()
+
+    text = parse_pdf(pdf_factory(PAGES[:3]), on_progress=on_progress)
+
+    assert text.splitlines() == PAGES[:3]
+    assert [done for done, _, _ in calls] == [1, 2, 3]
+
+
+def test_broken_pool_falls_back_to_serial_parsing(pdf_factory, monkeypatch):
+    def broken(content, writer, on_progress):
+        writer.add(0, "partial")
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(pdf_parsing, "_parse_parallel", broken)
+
+    text = parse_pdf(pdf_factory(PAGES))
+
+    assert text.splitlines() == PAGES
+    assert pdf_parsing._executor is None
@@ -186,14 +186,35 @@ function useConversation(projectId, apiBaseUrl) {
           }
 
           if (data.isComplete) {
-            console.log('Received isComplete: true. Closing EventSource.');
             setAgent((prev) => ({ ...prev, status: 'idle' }));
             setStreamingMessageId(null);
             console.log('Cleared streamingMessageId.');
-            eventSource.close();
+            // 階段評估在背景執行時，保持連線等待後續的 spec_update 事件
+            if (!data.metadata?.specUpdatePending) {
+              console.log('Received isComplete: true. Closing EventSource.');
+              eventSource.close();
+            }
           }
         });
 
+        eventSource.addEventListener('spec_update', (event) => {
+          const data = JSON.parse(event.data);
+          console.log('Received spec_update:', data);
+          const metadata = data.metadata || {};
+          if (metadata.stage) {
+            setProgress((prev) => ({
+              ...prev,
+              stage: metadata.stage,
+              current: metadata.progress ?? prev.current,
+              description: stageDescriptions[metadata.stage] || prev.description
+            }));
+          }
+          if (metadata.missingFields) {
+            setMissingFields(metadata.missingFields);
+          }
+          eventSource.close();
+        });
+
         eventSource.addEventListener('error', (error) => {
           console.error('SSE 連接錯誤:', error);
           setAgent((prev) => ({ ...prev, status: 'idle' }));